@@ -1,149 +1,646 @@
-import importlib.util
+import asyncio
+import functools
+import inspect
+import json
 import os
-import sys
+import threading
 import time
-from pathlib import Path
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
 
 import google.generativeai as genai
 from dotenv import load_dotenv
 from google.api_core.exceptions import InternalServerError, ResourceExhausted
+from google.generativeai.types import FunctionDeclaration
 
-from core.plugin import Plugin
-from core.tools import rate_limit
+from core.cassette import wrap_chat
+from core.clock import clock
+from core.funds import Fund, current_fund
+from core.limiter import get_bucket
+from core.loader import PluginLoader
+from core.metrics import TOKEN_BUCKETS, metrics
 
-ROOT_DIR = Path(__file__).parent.parent
-PLUGINS_DIR = ROOT_DIR / "plugins"
+# Upper bound on the number of tools running at the same time
+MAX_TOOL_WORKERS = 8
+
+# Seconds a single tool call may take before its result is given up on
+TOOL_TIMEOUT = 120
+
+# Per-tool overrides of TOOL_TIMEOUT. None means no timeout
+TOOL_TIMEOUTS = {
+    "core_sleep": None,
+    # Waits on the Twitter rate limit, which refills 50 requests per 15 minutes.
+    # The batch caps its requests to fit in that window
+    "twitter_search_batch_tool": 900,
+}
+
+# Prompt tokens after which the chat is rolled over
+HISTORY_TOKEN_BUDGET = 100_000
+
+# Most recent model turns that are always kept verbatim
+HISTORY_KEEP_TURNS = 4
+
+# Older function responses longer than this (in JSON characters) are compacted
+COMPACT_RESPONSE_CHARS = 500
+
+# Items of a list kept in a compacted function response
+COMPACT_LIST_ITEMS = 3
+
+
+class ToolStart:
+    """When a tool call started running. Calls queued behind MAX_TOOL_WORKERS
+    only start their timeout once they get a worker"""
+
+    def __init__(self):
+        """Init"""
+        self.event = threading.Event()
+        self.at = None
+
+    def set(self, *_):
+        """Mark the call as started. Also used as a done callback, so calls
+        cancelled before running do not keep their waiter blocked"""
+        if self.at is None:
+            self.at = time.monotonic()
+        self.event.set()
+
+    def wait_result(self, future, timeout: Optional[float]):
+        """Wait for the result of the call, at most timeout seconds after it started"""
+        if timeout is None:
+            return future.result()
+        self.event.wait()
+        return future.result(timeout=max(0, self.at + timeout - time.monotonic()))
+
+
+def coerce_ints(method, kwargs: dict) -> dict:
+    """Gemini sends every number as a float. Give the int parameters of a
+    tool whole numbers back, so they work as counts and slice indices"""
+    try:
+        hints = typing.get_type_hints(method)
+    except Exception:
+        return kwargs
+    ints = (int, Optional[int])
+    return {
+        key: int(value)
+        if hints.get(key) in ints and isinstance(value, float) and value.is_integer()
+        else value
+        for key, value in kwargs.items()
+    }
+
+
+def summarize(value, max_chars: int = COMPACT_RESPONSE_CHARS):
+    """Summarize a tool result so it fits in max_chars"""
+    if isinstance(value, list):
+        summary = {
+            "items": len(value),
+            "first": [summarize(v, max_chars // 4) for v in value[:COMPACT_LIST_ITEMS]],
+        }
+    elif isinstance(value, dict):
+        summary = {}
+        for key, item in value.items():
+            summary[key] = summarize(item, max_chars // 4)
+            if len(json.dumps(summary, default=str)) > max_chars:
+                summary.pop(key)
+                summary["omitted_keys"] = len(value) - len(summary)
+                break
+    elif isinstance(value, str) and len(value) > max_chars:
+        summary = value[:max_chars] + "..."
+    else:
+        summary = value
+    return summary
+
+
+class History:
+    """Keeps the chat history within a token budget.
+
+    Old function responses are compacted into summaries and, once a turn
+    exceeds the budget, the chat is rolled over keeping the system prompt
+    pinned plus the most recent turns.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+    ):
+        """Init"""
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.turn_tokens = []
+        self.rollovers = 0
+        self.compacted = 0
+
+    def record(self, response):
+        """Record the token usage of a model response"""
+        usage = response.usage_metadata
+        self.turn_tokens.append(
+            {
+                "prompt": usage.prompt_token_count,
+                "response": usage.candidates_token_count,
+            }
+        )
+        metrics.inc("llm_prompt_tokens_total", amount=usage.prompt_token_count)
+        metrics.inc("llm_response_tokens_total", amount=usage.candidates_token_count)
+        metrics.observe(
+            "llm_prompt_tokens", usage.prompt_token_count, buckets=TOKEN_BUCKETS
+        )
+        print(
+            f"Turn {len(self.turn_tokens)}: {usage.prompt_token_count} prompt tokens, "
+            f"{usage.candidates_token_count} response tokens"
+        )
+
+    def get_last_prompt_tokens(self) -> int:
+        """Prompt tokens of the last turn"""
+        return self.turn_tokens[-1]["prompt"] if self.turn_tokens else 0
+
+    def compact_content(self, content):
+        """Replace the long function responses of a message with summaries"""
+        parts = []
+        for part in content.parts:
+            if part.function_response:
+                response = type(part.function_response).to_dict(part.function_response)[
+                    "response"
+                ]
+                if len(json.dumps(response, default=str)) > COMPACT_RESPONSE_CHARS:
+                    part = genai.protos.Part(
+                        function_response=genai.protos.FunctionResponse(
+                            name=part.function_response.name,
+                            response={"summary": summarize(response)},
+                        )
+                    )
+            parts.append(part)
+        return genai.protos.Content(role=content.role, parts=parts)
+
+    def maintain(self, chat):
+        """Compact old tool outputs and roll the chat over if over budget"""
+        history = list(chat.history)
+        if not history:
+            return
+
+        # Index where the verbatim tail starts: the oldest of the last model turns
+        model_turns = [i for i, c in enumerate(history) if c.role == "model"]
+        if len(model_turns) >= self.keep_turns:
+            tail_start = model_turns[-self.keep_turns]
+        elif model_turns:
+            tail_start = model_turns[0]
+        else:
+            tail_start = len(history)
+
+        if self.get_last_prompt_tokens() > self.token_budget:
+            # Start over from the pinned system prompt plus the recent turns
+            self.rollovers += 1
+            print(
+                f"History over budget ({self.get_last_prompt_tokens()} tokens). "
+                f"Rolling over, keeping the last {self.keep_turns} turns"
+            )
+            pinned = genai.protos.Content(
+                role="user", parts=[genai.protos.Part(text=self.system_prompt)]
+            )
+            chat.history = [pinned] + history[tail_start:]
+            self.compacted = 1
+            return
+
+        # Messages before self.compacted were already compacted in earlier turns
+        if tail_start <= self.compacted:
+            return
+        chat.history = (
+            history[: self.compacted]
+            + [
+                self.compact_content(c) if c.role == "user" else c
+                for c in history[self.compacted : tail_start]
+            ]
+            + history[tail_start:]
+        )
+        self.compacted = tail_start
+
+    def stats(self) -> dict:
+        """Get the token usage stats"""
+        return {
+            "turns": len(self.turn_tokens),
+            "last_prompt_tokens": self.get_last_prompt_tokens(),
+            "total_prompt_tokens": sum(t["prompt"] for t in self.turn_tokens),
+            "total_response_tokens": sum(t["response"] for t in self.turn_tokens),
+            "rollovers": self.rollovers,
+        }
 
 
 class Agent:
     """Agent"""
 
-    def __init__(self, system_prompt: str):
-        """Init"""
+    def __init__(
+        self,
+        system_prompt: str,
+        async_mode: bool = False,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        fund: Optional[Fund] = None,
+        loader: Optional[PluginLoader] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        """Init. Agents of several funds share a loop and get loaders that
+        share the plugins that do not trade"""
+        start = time.perf_counter()
+        # Seconds spent in each startup stage
+        self.startup = {}
+
         load_dotenv(override=True)
         genai.configure(api_key=os.environ["GEMINI_API_KEY"])
 
         self.system_prompt = system_prompt
-        self.plugins = {}
-        self.tools = [self.core_sleep]
+        self.async_mode = async_mode
+        self.fund = fund
+        self.loader = loader or PluginLoader(fund=fund)
+        self.core_tools = [self.core_sleep]
+        self.tools = []
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool"
+        )
+
+        # The event loop shared by the async tools, the Gemini calls and the
+        # background tasks
+        self.loop = loop or asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.background_tasks = set()
+
+        # What happened in the current turn, logged as JSON when it ends
+        self.turn = None
+        self.turns = 0
+        # Turn events and the Prometheus text file are only written on demand
+        self.metrics_files = bool(os.environ.get("METRICS_FILES"))
+        if os.environ.get("METRICS_PORT"):
+            metrics.serve(int(os.environ["METRICS_PORT"]))
+        self.startup["setup"] = time.perf_counter() - start
+
         self.load_plugins()
         self.build_tools()
+
+        start = time.perf_counter()
         self.model = genai.GenerativeModel(
             model_name="gemini-2.0-flash", tools=self.tools
         )
-        self.chat = self.model.start_chat()
+        self.chat = wrap_chat(self.model.start_chat())
+        self.history = History(system_prompt, token_budget=token_budget)
+        self.startup["model"] = time.perf_counter() - start
+
+        self.print_startup_profile()
 
     def load_plugins(self):
-        """Load plugins"""
-
-        for folder in os.listdir(PLUGINS_DIR):
-            plugin_path = PLUGINS_DIR / folder / "plugin.py"
-
-            if os.path.isfile(plugin_path):
-                module_name = f"plugins.{folder}.plugin"
-
-                # Import the plugin module
-                spec = importlib.util.spec_from_file_location(module_name, plugin_path)
-                module = importlib.util.module_from_spec(spec)
-                sys.modules[module_name] = module
-                spec.loader.exec_module(module)
-
-                # Load the class that inherits from Plugin
-                for attr_name in dir(module):
-                    plugin_class = getattr(module, attr_name)
-                    if (
-                        isinstance(plugin_class, type)
-                        and issubclass(plugin_class, Plugin)
-                        and plugin_class is not Plugin
-                    ):
-                        self.plugins[plugin_class.NAME.lower()] = plugin_class()
-                        print(f"Loaded {plugin_class.NAME} plugin")
+        """Load the plugin manifest. Plugins are imported and instantiated on
+        the first call to one of their tools"""
+        start = time.perf_counter()
+        self.loader.load_manifest()
+        self.startup["manifest"] = time.perf_counter() - start
 
     def build_tools(self):
-        """Build available tools"""
-        for plugin in self.plugins.values():
-            self.tools.extend(
-                [
-                    getattr(plugin, attr)
-                    for attr in dir(plugin)
-                    if callable(getattr(plugin, attr)) and attr.endswith("_tool")
-                ]
-            )
-        print(f"Loaded tools: {[t.__name__ for t in self.tools]}")
+        """Build the tool declarations, from the core tools and the manifest"""
+        start = time.perf_counter()
+        declarations = [
+            FunctionDeclaration.from_function(tool).to_proto()
+            for tool in self.core_tools
+        ] + self.loader.get_declarations()
+        self.tools = [genai.protos.Tool(function_declarations=declarations)]
+        self.startup["tools"] = time.perf_counter() - start
+
+        print(f"Loaded tools: {[d.name for d in declarations]}")
+        print(f"Async tools: {self.loader.get_async_tools()}")
+
+    def print_startup_profile(self):
+        """Print the time spent in each startup stage and per plugin"""
+        stages = ", ".join(f"{k} {v:.2f}s" for k, v in self.startup.items())
+        print(f"Startup: {sum(self.startup.values()):.2f}s ({stages})")
+        print(self.loader.report())
 
-    @rate_limit(interval=10)
     def send_message(self, message):
         """Send a message to the chat"""
+        bucket = get_bucket("gemini")
+        self.history.maintain(self.chat)
         while True:
+            self.turn["rate_limit_wait"] += bucket.acquire()
             try:
-                result = self.chat.send_message(message)
+                with metrics.timed("llm_request_seconds"):
+                    result = self.chat.send_message(message)
+                bucket.success()
+                self.history.record(result)
                 return result
             except ResourceExhausted:
-                print("Hit rate limit. Retrying...")
-                time.sleep(30)
-                pass
+                self.turn["llm_retries"] += 1
+                bucket.backoff()
+
+    async def send_message_async(self, message):
+        """Send a message to the chat without blocking the event loop"""
+        bucket = get_bucket("gemini")
+        self.history.maintain(self.chat)
+        while True:
+            self.turn["rate_limit_wait"] += await bucket.acquire_async()
+            try:
+                with metrics.timed("llm_request_seconds"):
+                    result = await self.chat.send_message_async(message)
+                bucket.success()
+                self.history.record(result)
+                return result
+            except ResourceExhausted:
+                self.turn["llm_retries"] += 1
+                bucket.backoff()
+
+    def spawn(self, coro):
+        """Run a coroutine in the background, alongside the chat"""
+        task = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
 
     def run(self):
         """Start the agent"""
         try:
-            response_parts = None
             print("Running...")
-
-            # Agent loop
-            while True:
-                # Receive a call request
-                try:
-                    call_request = self.send_message(
-                        response_parts or self.system_prompt
-                    )
-                except InternalServerError:
-                    print("Exception")
-                    continue
-
-                # Get the function call request
-                fn = None
-                method = None
-                for part in call_request.parts:
-                    fn = part.function_call
-                    if not fn:
-                        continue
-                    class_id = fn.name.split("_")[0].lower()
-                    if class_id == "core":
-                        method = getattr(self, fn.name)
-                    else:
-                        plugin = self.plugins[class_id]
-                        method = getattr(plugin, fn.name)
-                    kwargs = dict(fn.args)
-                    break
-
-                if not method:
-                    continue
-
-                # Make the call
-                try:
-                    print(f"Calling {method.__name__}({kwargs})")
-                    result = method(**kwargs)
-                except Exception as e:
-                    print(f"Exception while calling the function: {e}")
-                    continue
-
-                print(f"Result: {result}\n")
-
-                # Build the response
-                function_calls = {fn.name: result}
-
-                response_parts = [
-                    genai.protos.Part(
-                        function_response=genai.protos.FunctionResponse(
-                            name=fn, response={"result": val}
-                        )
-                    )
-                    for fn, val in function_calls.items()
-                ]
+            if self.async_mode:
+                self.loop.run_until_complete(self.run_async())
+            else:
+                # Async tools and background tasks run on a side thread
+                threading.Thread(
+                    target=self.loop.run_forever, name="agent-loop", daemon=True
+                ).start()
+                self.run_sync()
 
         except KeyboardInterrupt:
             print("Agent stopped")
+        finally:
+            self.flush_turn()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def run_sync(self):
+        """Agent loop, on the calling thread"""
+        response_parts = None
+
+        while True:
+            self.start_turn()
+
+            # Receive a call request
+            try:
+                call_request = self.send_message(response_parts or self.system_prompt)
+            except InternalServerError:
+                print("Exception")
+                continue
+
+            # Get all the function call requests
+            function_calls = self.get_function_calls(call_request)
+
+            if not function_calls:
+                continue
+
+            # Make the calls and build the response
+            response_parts = self.build_response_parts(
+                function_calls, self.call_tools(function_calls)
+            )
+
+    async def run_async(self):
+        """Agent loop, on the event loop"""
+        response_parts = None
+
+        while True:
+            self.start_turn()
+
+            # Receive a call request
+            try:
+                call_request = await self.send_message_async(
+                    response_parts or self.system_prompt
+                )
+            except InternalServerError:
+                print("Exception")
+                continue
+
+            # Get all the function call requests
+            function_calls = self.get_function_calls(call_request)
+
+            if not function_calls:
+                continue
+
+            # Make the calls and build the response
+            response_parts = self.build_response_parts(
+                function_calls, await self.call_tools_async(function_calls)
+            )
+
+    def start_turn(self):
+        """Log the previous turn and start recording a new one"""
+        self.flush_turn()
+        self.turns += 1
+        self.turn = {
+            "turn": self.turns,
+            "fund": self.fund.name if self.fund else None,
+            "started": time.perf_counter(),
+            "rate_limit_wait": 0.0,
+            "llm_retries": 0,
+            "tools": [],
+        }
+
+    def end_turn(self):
+        """Record the current turn. With METRICS_FILES, also log it as JSON and
+        export the metrics to a file"""
+        turn = dict(self.turn)
+        started = turn.pop("started")
+        turn["seconds"] = round(time.perf_counter() - started, 3)
+        turn["rate_limit_wait"] = round(turn["rate_limit_wait"], 3)
+        if self.history.turn_tokens:
+            turn["tokens"] = self.history.turn_tokens[-1]
+        metrics.inc("turns_total")
+        metrics.observe("turn_seconds", turn["seconds"])
+        if not self.metrics_files:
+            return
+        # A full or read-only disk must not stop the agent
+        try:
+            metrics.log("turn", **turn)
+            metrics.write()
+        except OSError as e:
+            print(f"Couldnt write the metrics: {e}")
+
+    def flush_turn(self):
+        """Log the turn in progress, if any, like the last one when the agent
+        stops"""
+        if self.turn is not None:
+            self.end_turn()
+            self.turn = None
+
+    def record_tool(self, turn: dict, name: str, start: float, error: Optional[str]):
+        """Add a tool call to the turn it was requested in"""
+        call = {"name": name, "seconds": round(time.perf_counter() - start, 3)}
+        if error:
+            call["error"] = error
+        turn["tools"].append(call)
+
+    def run_tool(self, name: str, method, kwargs: dict, on_start=None):
+        """Run a sync tool, recording its latency and errors"""
+        turn, start, error = self.turn, time.perf_counter(), None
+        if on_start:
+            on_start()
+        # Shared plugins keep their per fund state for the calling fund
+        fund_token = current_fund.set(self.fund)
+        try:
+            with metrics.timed("tool_call_seconds", {"tool": name}):
+                return method(**kwargs)
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            current_fund.reset(fund_token)
+            self.record_tool(turn, name, start, error)
+
+    async def run_tool_async(self, name: str, method, kwargs: dict, on_start=None):
+        """Run an async tool, recording its latency and errors"""
+        turn, start, error = self.turn, time.perf_counter(), None
+        if on_start:
+            on_start()
+        # Shared plugins keep their per fund state for the calling fund
+        fund_token = current_fund.set(self.fund)
+        try:
+            with metrics.timed("tool_call_seconds", {"tool": name}):
+                return await method(**kwargs)
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            current_fund.reset(fund_token)
+            self.record_tool(turn, name, start, error)
+
+    def get_function_calls(self, call_request) -> list:
+        """Get the function calls requested by the model"""
+        return [part.function_call for part in call_request.parts if part.function_call]
+
+    def build_response_parts(self, function_calls, responses) -> list:
+        """Build the message parts that answer the function calls"""
+        return [
+            genai.protos.Part(
+                function_response=genai.protos.FunctionResponse(
+                    name=fn.name, response=response
+                )
+            )
+            for fn, response in zip(function_calls, responses)
+        ]
+
+    def get_tool(self, name: str):
+        """Get the method that implements a tool, loading its plugin if needed"""
+        if name.startswith("core_"):
+            return getattr(self, name)
+        return self.loader.get_tool(name)
+
+    def get_tool_or_error(self, name: str):
+        """Get the method that implements a tool, or the error message"""
+        try:
+            return self.get_tool(name), None
+        except (AttributeError, KeyError):
+            return None, f"Unknown function {name}"
+        except Exception as e:
+            return None, f"Plugin failed to load: {e}"
+
+    def call_tools(self, function_calls) -> list:
+        """Run all the requested function calls concurrently"""
+
+        futures = []
+        starts = []
+        errors = {}
+        for fn in function_calls:
+            kwargs = dict(fn.args)
+            print(f"Calling {fn.name}({kwargs})")
+            method, error = self.get_tool_or_error(fn.name)
+            if error:
+                errors[len(futures)] = error
+                futures.append(None)
+                starts.append(None)
+                continue
+            kwargs = coerce_ints(method, kwargs)
+            # Every call gets its own timeout, counted from the moment it starts
+            # running rather than from when it was queued
+            start = ToolStart()
+            if inspect.iscoroutinefunction(method):
+                future = asyncio.run_coroutine_threadsafe(
+                    self.run_tool_async(fn.name, method, kwargs, start.set), self.loop
+                )
+            else:
+                future = self.executor.submit(
+                    self.run_tool, fn.name, method, kwargs, start.set
+                )
+            future.add_done_callback(start.set)
+            futures.append(future)
+            starts.append(start)
+
+        responses = []
+        for i, (fn, future) in enumerate(zip(function_calls, futures)):
+            if future is None:
+                responses.append(self.tool_error(fn.name, errors[i]))
+                continue
+            timeout = TOOL_TIMEOUTS.get(fn.name, TOOL_TIMEOUT)
+            try:
+                result = starts[i].wait_result(future, timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                metrics.inc("tool_timeouts_total", {"tool": fn.name})
+                error = f"Timed out after {timeout}s"
+                responses.append(self.tool_error(fn.name, error))
+                continue
+            except Exception as e:
+                responses.append(self.tool_error(fn.name, e))
+                continue
+
+            responses.append(self.tool_result(fn.name, result))
+
+        return responses
+
+    async def call_tools_async(self, function_calls) -> list:
+        """Run all the requested function calls concurrently on the event loop"""
+        return await asyncio.gather(
+            *[self.call_tool_async(fn.name, dict(fn.args)) for fn in function_calls]
+        )
+
+    async def call_tool_async(self, name: str, kwargs: dict) -> dict:
+        """Run a single tool, offloading sync ones to the executor"""
+        print(f"Calling {name}({kwargs})")
+        # Loading a plugin can be slow, keep it off the event loop
+        method, error = await self.loop.run_in_executor(
+            self.executor, self.get_tool_or_error, name
+        )
+        if error:
+            return self.tool_error(name, error)
+        kwargs = coerce_ints(method, kwargs)
+
+        if inspect.iscoroutinefunction(method):
+            call = self.run_tool_async(name, method, kwargs)
+        else:
+            # The timeout starts once the call gets a worker, not while it is queued
+            started = self.loop.create_future()
+
+            def on_start():
+                self.loop.call_soon_threadsafe(
+                    lambda: started.done() or started.set_result(None)
+                )
+
+            call = self.loop.run_in_executor(
+                self.executor,
+                functools.partial(self.run_tool, name, method, kwargs, on_start),
+            )
+            await asyncio.wait([started, call], return_when=asyncio.FIRST_COMPLETED)
+
+        timeout = TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT)
+        try:
+            result = await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("tool_timeouts_total", {"tool": name})
+            return self.tool_error(name, f"Timed out after {timeout}s")
+        except Exception as e:
+            return self.tool_error(name, e)
+
+        return self.tool_result(name, result)
+
+    def tool_result(self, name: str, result) -> dict:
+        """Build the response for a successful tool call"""
+        print(f"Result of {name}: {result}\n")
+        return {"result": result}
+
+    def tool_error(self, name: str, error) -> dict:
+        """Build the response for a failed tool call"""
+        print(f"Exception while calling {name}: {error}")
+        return {"error": str(error)}
 
-    def core_sleep(self, seconds: int) -> None:
+    async def core_sleep(self, seconds: int) -> None:
         """Sleep for a number of seconds"""
-        time.sleep(seconds)
+        await clock.sleep_async(seconds)
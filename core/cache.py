@@ -0,0 +1,245 @@
+import asyncio
+import functools
+import inspect
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from peewee import CharField, CompositeKey, FloatField, TextField
+
+from core.clock import clock
+from core.db import BaseModel, init_db
+from core.metrics import metrics
+
+
+class CacheEntry(BaseModel):
+    """A cached tool response"""
+
+    tool = CharField()
+    key = TextField()
+    value = TextField()
+    created_at = FloatField()
+    accessed_at = FloatField(index=True)
+
+    class Meta:
+        primary_key = CompositeKey("tool", "key")
+
+
+class ToolCache:
+    """A TTL + LRU cache for a single tool, backed by the on-disk store"""
+
+    def __init__(self, name: str, ttl: float, max_entries: int, stale_ttl: float):
+        """Init"""
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Tuple[Optional[Any], Optional[float]]:
+        """Get a value and its age, looking in memory first and then on disk"""
+        now = clock.time()
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                created_at, value = self.entries[key]
+                return value, now - created_at
+
+        init_db(CacheEntry)
+        entry = CacheEntry.get_or_none(
+            (CacheEntry.tool == self.name) & (CacheEntry.key == key)
+        )
+        if entry is None:
+            return None, None
+
+        value = json.loads(entry.value)
+        CacheEntry.update(accessed_at=now).where(
+            (CacheEntry.tool == self.name) & (CacheEntry.key == key)
+        ).execute()
+        with self.lock:
+            self.entries[key] = (entry.created_at, value)
+            self.evict()
+        return value, now - entry.created_at
+
+    def set(self, key: str, value: Any):
+        """Store a value in memory and on disk"""
+        now = clock.time()
+        with self.lock:
+            self.entries[key] = (now, value)
+            self.entries.move_to_end(key)
+            self.evict()
+
+        init_db(CacheEntry)
+        CacheEntry.insert(
+            tool=self.name,
+            key=key,
+            value=json.dumps(value, default=str),
+            created_at=now,
+            accessed_at=now,
+        ).on_conflict_replace().execute()
+
+        # Keep only the most recently used entries on disk too
+        keep = (
+            CacheEntry.select(CacheEntry.key)
+            .where(CacheEntry.tool == self.name)
+            .order_by(CacheEntry.accessed_at.desc())
+            .limit(self.max_entries)
+        )
+        CacheEntry.delete().where(
+            (CacheEntry.tool == self.name) & (CacheEntry.key.not_in(keep))
+        ).execute()
+
+    def evict(self):
+        """Drop the least recently used entries from memory. Call with the lock held"""
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key: str) -> Tuple[Optional[Any], bool, bool]:
+        """Get a cached value. Returns the value, whether it can be used and
+        whether it is stale and should be refreshed in the background"""
+        value, age = self.get(key)
+
+        if age is None or age > self.ttl + self.stale_ttl:
+            with self.lock:
+                self.misses += 1
+            return None, False, False
+
+        if age <= self.ttl:
+            with self.lock:
+                self.hits += 1
+            return value, True, False
+
+        with self.lock:
+            self.stale_hits += 1
+            refresh = key not in self.refreshing
+            self.refreshing.add(key)
+        return value, True, refresh
+
+    def refreshed(self, key: str, value: Any):
+        """Store the result of a background refresh"""
+        if value is not None:
+            self.set(key, value)
+        with self.lock:
+            self.refreshing.discard(key)
+
+    def stats(self) -> Dict:
+        """Get the cache stats"""
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0,
+                "entries": len(self.entries),
+            }
+
+
+caches: Dict[str, ToolCache] = {}
+
+# Keep a reference to the background refreshes so they are not garbage collected
+refresh_tasks = set()
+
+
+def make_key(signature: inspect.Signature, args, kwargs) -> str:
+    """Build a cache key from the call arguments, ignoring self"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = dict(bound.arguments)
+    arguments.pop("self", None)
+    return json.dumps(arguments, sort_keys=True, default=str)
+
+
+def cached(ttl: float, max_entries: int = 128, stale_ttl: float = 0):
+    """Cache the responses of a read-only tool for ttl seconds.
+
+    Within stale_ttl seconds after expiring, the stale response is returned and
+    refreshed in the background. None responses are never cached.
+    """
+
+    def decorator(func):
+        cache = ToolCache(func.__qualname__, ttl, max_entries, stale_ttl)
+        caches[cache.name] = cache
+        signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+
+            async def refresh_async(key, args, kwargs):
+                try:
+                    cache.refreshed(key, await func(*args, **kwargs))
+                except Exception as e:
+                    print(f"Exception while refreshing {cache.name}: {e}")
+                    cache.refreshed(key, None)
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = make_key(signature, args, kwargs)
+                value, found, refresh = cache.lookup(key)
+                if refresh:
+                    task = asyncio.ensure_future(refresh_async(key, args, kwargs))
+                    refresh_tasks.add(task)
+                    task.add_done_callback(refresh_tasks.discard)
+                if found:
+                    return value
+
+                value = await func(*args, **kwargs)
+                if value is not None:
+                    cache.set(key, value)
+                return value
+
+            async_wrapper.cache = cache
+            return async_wrapper
+
+        def refresh_sync(key, args, kwargs):
+            try:
+                cache.refreshed(key, func(*args, **kwargs))
+            except Exception as e:
+                print(f"Exception while refreshing {cache.name}: {e}")
+                cache.refreshed(key, None)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(signature, args, kwargs)
+            value, found, refresh = cache.lookup(key)
+            if refresh:
+                threading.Thread(
+                    target=refresh_sync, args=(key, args, kwargs), daemon=True
+                ).start()
+            if found:
+                return value
+
+            value = func(*args, **kwargs)
+            if value is not None:
+                cache.set(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def get_stats() -> Dict[str, Dict]:
+    """Get the hit/miss counters of all the tool caches"""
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def collect_metrics():
+    """Hit and miss counters and hit rate of every tool cache"""
+    stats = get_stats()
+    for key in ("hits", "stale_hits", "misses"):
+        for tool, tool_stats in stats.items():
+            yield f"cache_{key}_total", "counter", {"tool": tool}, tool_stats[key]
+    for tool, tool_stats in stats.items():
+        yield "cache_hit_rate", "gauge", {"tool": tool}, tool_stats["hit_rate"]
+
+
+metrics.register(collect_metrics)
@@ -0,0 +1,557 @@
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from core.clock import clock
+from core.metrics import metrics
+
+# Where sessions are recorded to and replayed from, unless CASSETTE_PATH says
+# otherwise. CASSETTE_MODE is either record or replay
+DEFAULT_CASSETTE_PATH = Path(__file__).parent.parent / "cassettes" / "session.jsonl.gz"
+
+CASSETTE_VERSION = 1
+
+# Recorded calls buffered before flushing them to disk. What was flushed can
+# still be replayed if the recording process dies
+FLUSH_EVERY = 50
+
+# Bodies are stored decoded, so these headers no longer apply to them
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """A replayed request that was never recorded"""
+
+
+class ReplayFinished(KeyboardInterrupt):
+    """All the recorded model responses were replayed. Stops the agent like
+    Ctrl+C does"""
+
+
+def digest(*chunks: bytes) -> str:
+    """Short hash of some chunks of data"""
+    return hashlib.sha256(b"\n".join(chunks)).hexdigest()[:32]
+
+
+def is_rpc(payload) -> bool:
+    """Whether a request body is a JSON-RPC call or batch"""
+    calls = payload if isinstance(payload, list) else [payload]
+    return bool(calls) and all(
+        isinstance(call, dict) and "jsonrpc" in call for call in calls
+    )
+
+
+def request_key(method: str, url: str, body: Optional[bytes]) -> Tuple:
+    """Match key of a request: its kind, a hash of the request without the
+    parts that change between runs, a readable description, and the JSON-RPC
+    payload if it is one. Only the hash is stored, so secrets sent in request
+    bodies do not end up in the cassette"""
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    what = f"{method} {parsed.hostname}{parsed.path}"
+
+    kind, rpc = "http", None
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if payload is not None and is_rpc(payload):
+            # Request ids are a counter of the client, not part of the call
+            kind, rpc = "rpc", payload
+            calls = payload if isinstance(payload, list) else [payload]
+            payload = [[call.get("method"), call.get("params")] for call in calls]
+            what += " " + ",".join(str(call[0]) for call in payload)
+        if payload is not None:
+            body = json.dumps(payload, sort_keys=True).encode("utf-8")
+
+    url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}?{query}"
+    key = digest(method.encode("utf-8"), url.encode("utf-8"), body or b"")
+    return kind, key, what, rpc
+
+
+def strip_rpc_ids(rpc, content: bytes) -> bytes:
+    """Replace the ids of a JSON-RPC response by the position of their call"""
+    try:
+        response = json.loads(content)
+    except ValueError:
+        return content
+    if isinstance(rpc, list) and isinstance(response, list):
+        positions = {call.get("id"): i for i, call in enumerate(rpc)}
+        for item in response:
+            item["id"] = positions.get(item.get("id"))
+    elif isinstance(response, dict):
+        response["id"] = 0
+    return json.dumps(response).encode("utf-8")
+
+
+def restore_rpc_ids(rpc, content: bytes) -> bytes:
+    """Give a replayed JSON-RPC response the ids of the calls being made"""
+    try:
+        response = json.loads(content)
+    except ValueError:
+        return content
+    if isinstance(rpc, list) and isinstance(response, list):
+        for item in response:
+            position = item.get("id")
+            if isinstance(position, int) and position < len(rpc):
+                item["id"] = rpc[position].get("id")
+    elif isinstance(response, dict) and isinstance(rpc, dict):
+        response["id"] = rpc.get("id")
+    return json.dumps(response).encode("utf-8")
+
+
+def message_key(message) -> str:
+    """Hash of a message sent to the model"""
+    if isinstance(message, str):
+        return digest(message.encode("utf-8"))
+    parts = [type(part).to_dict(part) for part in message]
+    return digest(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"))
+
+
+class Cassette:
+    """Every model exchange, HTTP request and JSON-RPC call of a session.
+
+    When recording, responses are appended to a gzipped JSON lines file, with
+    identical bodies stored once. When replaying, they are served back from
+    it without touching the network, and time is virtual: it follows the
+    recording and sleeps return at once.
+
+    Requests are matched by a hash of their method, URL and body. A request
+    whose body changed, like one carrying a timestamp, gets the next unserved
+    response for the same endpoint, and one made more times than recorded
+    gets the last response again. Model responses are served in order.
+
+    Cassettes contain the responses of the APIs, session tokens included.
+    They should not be shared.
+    """
+
+    def __init__(self, path: Path, mode: str):
+        """Init"""
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode}, use record or replay")
+        self.path = Path(path)
+        self.mode = mode
+        self.replaying = mode == "replay"
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts: Dict[Tuple[str, str], int] = {}
+
+        # Recording
+        self.file = None
+        self.pending = 0
+        self.blob_hashes = set()
+
+        # Replaying
+        self.blobs: Dict[str, bytes] = {}
+        self.calls: Dict[Tuple[str, str], deque] = {}
+        self.endpoint_calls: Dict[Tuple[str, str], deque] = {}
+        self.last_served: Dict[Tuple[str, str], Dict] = {}
+        self.model_calls: deque = deque()
+
+        if self.replaying:
+            self.load()
+            clock.start_virtual(self.started)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = gzip.open(self.path, "wt", encoding="utf-8")
+            self.write(
+                {"type": "header", "version": CASSETTE_VERSION, "started": self.started}
+            )
+            atexit.register(self.close)
+
+        metrics.register(self.collect_metrics)
+        print(f"Cassette {self.path}: {self.mode}")
+
+    def write(self, line: Dict):
+        """Append a line to the recording"""
+        self.file.write(json.dumps(line, separators=(",", ":")) + "\n")
+        self.pending += 1
+        if self.pending >= FLUSH_EVERY:
+            self.file.flush()
+            self.pending = 0
+
+    def record(
+        self,
+        kind: str,
+        key: str,
+        what: str,
+        started: float,
+        response: Dict,
+        body: bytes,
+    ):
+        """Record a response"""
+        body_hash = hashlib.sha256(body).hexdigest()[:32]
+        with self.lock:
+            if self.file is None:
+                return
+            if body_hash not in self.blob_hashes:
+                try:
+                    data, encoding = body.decode("utf-8"), "text"
+                except UnicodeDecodeError:
+                    data, encoding = base64.b64encode(body).decode("ascii"), "base64"
+                self.write(
+                    {"type": "blob", "hash": body_hash, "data": data, "enc": encoding}
+                )
+                self.blob_hashes.add(body_hash)
+            self.write(
+                {
+                    "type": "call",
+                    "kind": kind,
+                    "key": key,
+                    "what": what,
+                    "t": round(started - self.started, 3),
+                    "response": response,
+                    "body": body_hash,
+                }
+            )
+            self.counts[(kind, "recorded")] = self.counts.get((kind, "recorded"), 0) + 1
+
+    def load(self):
+        """Read a recording"""
+        lines = []
+        with gzip.open(self.path, "rt", encoding="utf-8") as cassette_file:
+            try:
+                for line in cassette_file:
+                    lines.append(line)
+            except EOFError:
+                # The recording process died. Keep what was flushed
+                print(f"Cassette {self.path} is truncated")
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry["type"] == "header":
+                self.started = entry["started"]
+            elif entry["type"] == "blob":
+                data = entry["data"]
+                self.blobs[entry["hash"]] = (
+                    base64.b64decode(data)
+                    if entry["enc"] == "base64"
+                    else data.encode("utf-8")
+                )
+            elif entry["type"] == "call":
+                entry["served"] = False
+                if entry["kind"] == "llm":
+                    self.model_calls.append(entry)
+                    continue
+                self.calls.setdefault((entry["kind"], entry["key"]), deque()).append(
+                    entry
+                )
+                self.endpoint_calls.setdefault(
+                    (entry["kind"], entry["what"]), deque()
+                ).append(entry)
+
+    def take(self, queue: Optional[deque]) -> Optional[Dict]:
+        """Next unserved call of a queue. Call with the lock held"""
+        while queue and queue[0]["served"]:
+            queue.popleft()
+        if not queue:
+            return None
+        entry = queue.popleft()
+        entry["served"] = True
+        return entry
+
+    def replay(self, kind: str, key: str, what: str) -> Tuple[Dict, bytes]:
+        """Serve the recorded response of a request"""
+        with self.lock:
+            if kind == "llm":
+                entry = self.take(self.model_calls)
+                if entry is None:
+                    raise ReplayFinished()
+                match = "exact" if entry["key"] == key else "diverged"
+            else:
+                entry = self.take(self.calls.get((kind, key)))
+                match = "exact"
+                if entry is None:
+                    entry = self.take(self.endpoint_calls.get((kind, what)))
+                    match = "endpoint"
+                if entry is None:
+                    entry = self.last_served.get((kind, key))
+                    match = "repeat"
+                if entry is None:
+                    self.counts[(kind, "miss")] = self.counts.get((kind, "miss"), 0) + 1
+                    raise CassetteMiss(f"{what} was not recorded")
+                self.last_served[(kind, key)] = entry
+            self.counts[(kind, match)] = self.counts.get((kind, match), 0) + 1
+
+        clock.advance_to(self.started + entry["t"])
+        return entry["response"], self.blobs[entry["body"]]
+
+    def wrap_session(self, session: requests.Session) -> requests.Session:
+        """Record or replay the requests of a session, for every adapter
+        mounted on it so far"""
+        for prefix, adapter in list(session.adapters.items()):
+            if not isinstance(adapter, CassetteAdapter):
+                session.adapters[prefix] = CassetteAdapter(self, adapter)
+        return session
+
+    def make_transport(self):
+        """An httpx transport that records or replays the requests of a client"""
+        import httpx
+
+        cassette = self
+
+        class CassetteTransport(httpx.AsyncBaseTransport):
+            """Async httpx transport backed by the cassette"""
+
+            def __init__(self):
+                """Init"""
+                self.transport = httpx.AsyncHTTPTransport()
+
+            async def handle_async_request(self, request):
+                """Send a request, or serve its recorded response"""
+                body = await request.aread()
+                kind, key, what, rpc = request_key(
+                    request.method, str(request.url), body
+                )
+                if cassette.replaying:
+                    response, content = cassette.replay(kind, key, what)
+                    if rpc is not None:
+                        content = restore_rpc_ids(rpc, content)
+                    return httpx.Response(
+                        response["status"],
+                        headers=response["headers"],
+                        content=content,
+                        request=request,
+                    )
+
+                started = time.time()
+                response = await self.transport.handle_async_request(request)
+                content = await response.aread()
+                await response.aclose()
+                headers = [
+                    [name, value]
+                    for name, value in response.headers.multi_items()
+                    if name.lower() not in DROPPED_HEADERS
+                ]
+                cassette.record(
+                    kind,
+                    key,
+                    what,
+                    started,
+                    {"status": response.status_code, "headers": headers},
+                    content if rpc is None else strip_rpc_ids(rpc, content),
+                )
+                return httpx.Response(
+                    response.status_code,
+                    headers=headers,
+                    content=content,
+                    request=request,
+                )
+
+            async def aclose(self):
+                """Close the connections"""
+                await self.transport.aclose()
+
+        return CassetteTransport()
+
+    def wrap_chat(self, chat):
+        """Record or replay the messages of a Gemini chat session"""
+        return CassetteChat(self, chat)
+
+    def close(self):
+        """Finish the recording"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                print(f"Cassette {self.path} saved")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Recorded, replayed and missed calls per kind"""
+        with self.lock:
+            stats = {}
+            for (kind, outcome), count in self.counts.items():
+                stats.setdefault(kind, {})[outcome] = count
+            return stats
+
+    def collect_metrics(self):
+        """Recorded, replayed and missed calls"""
+        for kind, outcomes in self.stats().items():
+            for outcome, count in outcomes.items():
+                yield (
+                    "cassette_calls_total",
+                    "counter",
+                    {"kind": kind, "outcome": outcome},
+                    count,
+                )
+
+
+class CassetteAdapter(BaseAdapter):
+    """A requests transport adapter backed by a cassette"""
+
+    def __init__(self, cassette: Cassette, adapter: BaseAdapter):
+        """Init"""
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        """Send a request, or serve its recorded response"""
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        elif not isinstance(body, bytes):
+            body = None
+        kind, key, what, rpc = request_key(request.method, request.url, body)
+
+        if self.cassette.replaying:
+            response, content = self.cassette.replay(kind, key, what)
+            if rpc is not None:
+                content = restore_rpc_ids(rpc, content)
+            return self.build_response(request, response, content)
+
+        started = time.time()
+        response = self.adapter.send(request, **kwargs)
+        content = response.content
+        self.cassette.record(
+            kind,
+            key,
+            what,
+            started,
+            {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": [
+                    [name, value]
+                    for name, value in response.headers.items()
+                    if name.lower() not in DROPPED_HEADERS
+                ],
+            },
+            content if rpc is None else strip_rpc_ids(rpc, content),
+        )
+        return response
+
+    def build_response(
+        self, request, response: Dict, content: bytes
+    ) -> requests.Response:
+        """Build a requests response from a recorded one"""
+        replayed = requests.Response()
+        replayed.status_code = response["status"]
+        replayed.reason = response.get("reason")
+        replayed.headers = CaseInsensitiveDict(dict(response["headers"]))
+        replayed.encoding = get_encoding_from_headers(replayed.headers)
+        replayed.url = request.url
+        replayed.request = request
+        replayed.connection = self
+        replayed._content = content
+        return replayed
+
+    def close(self):
+        """Close the wrapped adapter"""
+        self.adapter.close()
+
+
+class CassetteChat:
+    """A Gemini chat session whose responses are recorded, or replayed without
+    calling the API. Replayed exchanges are added to the history like the
+    chat session does"""
+
+    def __init__(self, cassette: Cassette, chat):
+        """Init"""
+        self.cassette = cassette
+        self.chat = chat
+
+    @property
+    def history(self) -> List:
+        """History of the chat session"""
+        return self.chat.history
+
+    @history.setter
+    def history(self, history: List):
+        """Replace the history of the chat session"""
+        self.chat.history = history
+
+    def send_message(self, message):
+        """Send a message to the model"""
+        if self.cassette.replaying:
+            return self.replay(message)
+        started = time.time()
+        result = self.chat.send_message(message)
+        self.record(message, started, result)
+        return result
+
+    async def send_message_async(self, message):
+        """Send a message to the model without blocking the event loop"""
+        if self.cassette.replaying:
+            return self.replay(message)
+        started = time.time()
+        result = await self.chat.send_message_async(message)
+        self.record(message, started, result)
+        return result
+
+    def record(self, message, started: float, result):
+        """Record a model response"""
+        body = json.dumps(result.to_dict(), default=str).encode("utf-8")
+        self.cassette.record("llm", message_key(message), "gemini", started, {}, body)
+
+    def replay(self, message):
+        """Serve the next recorded model response"""
+        import google.generativeai as genai
+
+        _, content = self.cassette.replay("llm", message_key(message), "gemini")
+        result = genai.types.GenerateContentResponse.from_response(
+            genai.protos.GenerateContentResponse(json.loads(content))
+        )
+        if isinstance(message, str):
+            parts = [genai.protos.Part(text=message)]
+        else:
+            parts = list(message)
+        self.chat.history = list(self.chat.history) + [
+            genai.protos.Content(role="user", parts=parts),
+            result.candidates[0].content,
+        ]
+        return result
+
+
+active_cassette: Optional[Cassette] = None
+active_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Get the cassette of the session, if CASSETTE_MODE is set. Once created,
+    it is used for the rest of the process"""
+    global active_cassette
+    with active_cassette_lock:
+        mode = os.environ.get("CASSETTE_MODE")
+        if active_cassette is None and mode:
+            path = os.environ.get("CASSETTE_PATH") or DEFAULT_CASSETTE_PATH
+            active_cassette = Cassette(Path(path), mode)
+        return active_cassette
+
+
+def wrap_session(session: requests.Session) -> requests.Session:
+    """Let the cassette of the session see the requests of a requests session"""
+    cassette = get_cassette()
+    if cassette is not None:
+        cassette.wrap_session(session)
+    return session
+
+
+def get_httpx_kwargs() -> Dict:
+    """Arguments for an httpx client so the cassette sees its requests"""
+    cassette = get_cassette()
+    return {} if cassette is None else {"transport": cassette.make_transport()}
+
+
+def wrap_chat(chat):
+    """Let the cassette of the session see the messages of a chat session"""
+    cassette = get_cassette()
+    return chat if cassette is None else cassette.wrap_chat(chat)
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class Clock:
+    """Time as seen by the agent. Real by default. When a session is
+    replayed it is virtual: sleeps return at once and move the time forward,
+    so rate limit waits and core_sleep cost nothing"""
+
+    def __init__(self):
+        """Init"""
+        self.virtual = False
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def start_virtual(self, now: float):
+        """Switch to virtual time, starting at a UNIX timestamp"""
+        with self.lock:
+            self.virtual = True
+            self.now = now
+
+    def advance_to(self, now: float):
+        """Move the virtual time forward to a timestamp. Never goes back"""
+        with self.lock:
+            self.now = max(self.now, now)
+
+    def time(self) -> float:
+        """Like time.time"""
+        if not self.virtual:
+            return time.time()
+        with self.lock:
+            return self.now
+
+    def monotonic(self) -> float:
+        """Like time.monotonic"""
+        if not self.virtual:
+            return time.monotonic()
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds: float, start: Optional[float] = None):
+        """Like time.sleep. start is when the caller began waiting, now by
+        default"""
+        if not self.virtual:
+            time.sleep(seconds)
+            return
+        # Wake up at the deadline of the caller. A sleeper that another one
+        # already moved past its deadline does not move the time further, so
+        # concurrent sleeps of 4s and 8s take 8s, not 12s
+        self.advance_to((self.time() if start is None else start) + seconds)
+
+    async def sleep_async(self, seconds: float, start: Optional[float] = None):
+        """Like asyncio.sleep. start is when the caller began waiting, now by
+        default"""
+        if not self.virtual:
+            await asyncio.sleep(seconds)
+            return
+        self.advance_to((self.time() if start is None else start) + seconds)
+        # Still give the other tasks a chance to run
+        await asyncio.sleep(0)
+
+
+clock = Clock()
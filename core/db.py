@@ -0,0 +1,79 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from peewee import CharField, Model, SqliteDatabase, TextField
+
+# Where the database, snapshots and other local state live. The benchmark
+# points it to a temporary folder
+STORAGE_PATH = Path(
+    os.environ.get("MEMEPOOL_STORAGE_PATH", Path(__file__).parent.parent)
+)
+
+DB_PATH = STORAGE_PATH / "memepool.db"
+
+db = SqliteDatabase(None)
+db_lock = threading.Lock()
+created_tables = set()
+
+
+class BaseModel(Model):
+    """Base for the models stored in the local database"""
+
+    class Meta:
+        database = db
+
+
+class State(BaseModel):
+    """Free-form key/value state, like checkpoints and refresh times"""
+
+    key = CharField(primary_key=True)
+    value = TextField()
+
+
+def init_db(*models):
+    """Open the local database and create the tables of the given models"""
+    with db_lock:
+        if db.database is None:
+            db.init(
+                str(DB_PATH),
+                pragmas={"journal_mode": "wal", "synchronous": "normal"},
+                check_same_thread=False,
+            )
+        pending = [m for m in (State, *models) if m not in created_tables]
+        if pending:
+            db.create_tables(pending)
+            created_tables.update(pending)
+
+
+def get_state(key: str, default=None):
+    """Get a stored state value"""
+    init_db()
+    row = State.get_or_none(State.key == key)
+    return default if row is None else row.value
+
+
+def set_state(key: str, value):
+    """Store a state value"""
+    init_db()
+    State.insert(key=key, value=str(value)).on_conflict_replace().execute()
+
+
+# Copies of the models with their own tables, by model and scope
+scoped_models = {}
+
+
+def scoped_model(model, scope: Optional[str]):
+    """A copy of a model stored in its own table, like position_degen for the
+    state of the degen fund. Without a scope, the model itself"""
+    if scope is None:
+        return model
+    with db_lock:
+        key = (model, scope)
+        if key not in scoped_models:
+            meta = type("Meta", (), {"table_name": f"{model._meta.table_name}_{scope}"})
+            scoped_models[key] = type(
+                f"{model.__name__}_{scope}", (model,), {"Meta": meta}
+            )
+        return scoped_models[key]
@@ -0,0 +1,101 @@
+import json
+import os
+import re
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, List, Optional
+
+from dotenv import load_dotenv
+
+# Funds run by the process, as a JSON list of objects with a name and the
+# settings of the fund, like:
+# [{"name": "main"}, {"name": "degen", "safe_address": "0x...",
+#   "quote_token": "0x...", "quote_decimals": 6, "system_prompt": "degen.txt"}]
+# Settings that are left out take the defaults of the plugins. Without the
+# file, a single fund runs with the settings of the environment
+FUNDS_FILE = "funds.json"
+
+# The fund that runs without a funds file. Its state is kept where it was
+# before there were several funds
+DEFAULT_FUND = "main"
+
+# Fund names are used in environment variables and table names
+FUND_NAME = re.compile(r"^[a-z][a-z0-9_]*$")
+
+# Chains funds can trade on. Token names, explorer links and the portfolio
+# checkpoints only know Base for now
+BASE_CHAIN_ID = 8453
+SUPPORTED_CHAIN_IDS = {BASE_CHAIN_ID}
+
+
+class Fund:
+    """A Safe on a chain traded against a quote token, with its own agent
+    session. Plugins read the settings they need, with their own defaults"""
+
+    def __init__(self, name: str, **settings):
+        """Init"""
+        if not FUND_NAME.match(name):
+            raise ValueError(f"Invalid fund name: {name}")
+        chain_id = settings.get("chain_id", BASE_CHAIN_ID)
+        if chain_id not in SUPPORTED_CHAIN_IDS:
+            raise ValueError(
+                f"The {name} fund is on chain {chain_id}, only Base is supported"
+            )
+        self.name = name
+        self.settings = settings
+
+    def __repr__(self) -> str:
+        """Repr"""
+        return f"Fund({self.name})"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a setting"""
+        return self.settings.get(key, default)
+
+    @property
+    def scope(self) -> Optional[str]:
+        """Suffix of the tables holding the state of the fund. None for the
+        default fund, which uses the unsuffixed tables"""
+        return None if self.name == DEFAULT_FUND else self.name
+
+    def get_system_prompt(self, default: str) -> str:
+        """The system prompt of the fund, from its system_prompt file"""
+        path = self.get("system_prompt")
+        return Path(path).read_text(encoding="utf-8") if path else default
+
+    def get_env(self, name: str) -> str:
+        """Get an environment variable, preferring the one of the fund:
+        COWSWAP_DEGEN_SAFE_ADDRESS over COWSWAP_SAFE_ADDRESS for name
+        COWSWAP_SAFE_ADDRESS and the degen fund"""
+        prefix, _, rest = name.partition("_")
+        fund_name = f"{prefix}_{self.name.upper()}_{rest}"
+        if fund_name in os.environ:
+            return os.environ[fund_name]
+        return os.environ[name]
+
+
+# The fund whose agent is running the current tool call. Shared plugins read
+# it to keep state, like what was already seen, per fund
+current_fund: ContextVar[Optional[Fund]] = ContextVar("current_fund", default=None)
+
+
+def get_current_scope() -> Optional[str]:
+    """Table scope of the fund running the current tool call. None outside of a
+    fund, or for the default fund"""
+    fund = current_fund.get()
+    return None if fund is None else fund.scope
+
+
+def load_funds(path: Optional[Path] = None) -> List[Fund]:
+    """Load the funds of the funds file, or the default fund"""
+    load_dotenv(override=True)
+    path = Path(path or os.environ.get("FUNDS_FILE") or FUNDS_FILE)
+    if not path.exists():
+        return [Fund(DEFAULT_FUND)]
+
+    with open(path, "r", encoding="utf-8") as funds_file:
+        funds = [Fund(**settings) for settings in json.load(funds_file)]
+    names = [fund.name for fund in funds]
+    if not funds or len(set(names)) != len(names):
+        raise ValueError(f"{path} must list funds with unique names")
+    return funds
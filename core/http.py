@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.cassette import wrap_session
+from core.limiter import get_bucket, parse_retry_after
+from core.metrics import metrics
+
+BROWSER_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+}
+
+# Per-host settings. The upstream is the rate limit bucket the host belongs to.
+# Timeouts are (connect, read) seconds
+HOSTS = {
+    "api.coingecko.com": {
+        "upstream": "coingecko",
+        "timeout": (5, 30),
+        "retries": 3,
+        "headers": BROWSER_HEADERS,
+    },
+    "api.alternative.me": {
+        "upstream": "fearandgreed",
+        "timeout": (5, 30),
+        "retries": 3,
+    },
+    "api.cow.fi": {
+        "upstream": "cow",
+        "timeout": (5, 20),
+        "retries": 2,
+    },
+    "safe-transaction-base.safe.global": {
+        "upstream": "safe",
+        "timeout": (5, 20),
+        "retries": 3,
+    },
+}
+
+DEFAULT_HOST = {"upstream": None, "timeout": (5, 60), "retries": 1}
+
+# Connections kept alive per host
+POOL_SIZE = 16
+
+# Retries on 429 are handled by the rate limiter, so the whole bucket backs off
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Latency samples kept per host
+LATENCY_SAMPLES = 1000
+
+
+class HttpClient:
+    """A pooled HTTP client with per-host timeouts, retries and headers"""
+
+    def __init__(self, hosts: Optional[Dict] = None):
+        """Init"""
+        self.hosts = hosts or HOSTS
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.latencies: Dict[str, deque] = {}
+        self.errors: Dict[str, int] = {}
+
+        self.session.mount("https://", self.build_adapter(DEFAULT_HOST))
+        self.session.mount("http://", self.build_adapter(DEFAULT_HOST))
+        for host, config in self.hosts.items():
+            self.session.mount(f"https://{host}", self.build_adapter(config))
+        wrap_session(self.session)
+
+    def build_adapter(self, config: Dict) -> HTTPAdapter:
+        """Build a keep-alive connection pool with the host retry policy"""
+        retry = Retry(
+            total=config["retries"],
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        return HTTPAdapter(
+            pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry
+        )
+
+    def get_config(self, host: str) -> Dict:
+        """Get the settings of a host"""
+        return self.hosts.get(host, DEFAULT_HOST)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Make a request within the upstream rate limit"""
+        host = urlparse(url).hostname
+        config = self.get_config(host)
+
+        kwargs["headers"] = {**config.get("headers", {}), **kwargs.get("headers", {})}
+        kwargs.setdefault("timeout", config["timeout"])
+
+        bucket = get_bucket(config["upstream"]) if config["upstream"] else None
+
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            if bucket:
+                bucket.acquire()
+
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException:
+                self.record(host, time.perf_counter() - start, error=True)
+                raise
+            self.record(
+                host, time.perf_counter() - start, error=response.status_code >= 400
+            )
+
+            if response.status_code != 429 or not bucket:
+                if bucket:
+                    bucket.success()
+                return response
+
+            bucket.backoff(parse_retry_after(response.headers.get("Retry-After")))
+
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET request"""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST request"""
+        return self.request("POST", url, **kwargs)
+
+    def record(self, host: str, latency: float, error: bool = False):
+        """Record the latency of a request"""
+        metrics.observe("http_request_seconds", latency, {"host": host})
+        if error:
+            metrics.inc("http_errors_total", {"host": host})
+        with self.lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+            self.latencies.setdefault(host, deque(maxlen=LATENCY_SAMPLES)).append(
+                latency
+            )
+            if error:
+                self.errors[host] = self.errors.get(host, 0) + 1
+
+    def stats(self) -> Dict[str, Dict]:
+        """Get the request latency stats per host, in seconds"""
+        with self.lock:
+            stats = {}
+            for host, samples in self.latencies.items():
+                ordered = sorted(samples)
+                stats[host] = {
+                    "requests": self.requests[host],
+                    "errors": self.errors.get(host, 0),
+                    "mean": sum(ordered) / len(ordered),
+                    "p50": ordered[len(ordered) // 2],
+                    "p95": ordered[int(len(ordered) * 0.95)],
+                    "max": ordered[-1],
+                }
+            return stats
+
+
+client = None
+client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """Get the HTTP client shared by all the plugins"""
+    global client
+    with client_lock:
+        if client is None:
+            client = HttpClient()
+        return client
@@ -0,0 +1,172 @@
+import email.utils
+import random
+import threading
+from typing import Dict, Optional, Tuple
+
+from core.clock import clock
+from core.metrics import metrics
+
+# Requests per second and burst size for every upstream we talk to
+UPSTREAM_LIMITS = {
+    "gemini": {"rate": 15 / 60, "capacity": 2},
+    "coingecko": {"rate": 30 / 60, "capacity": 5},
+    "fearandgreed": {"rate": 1, "capacity": 5},
+    "cow": {"rate": 5, "capacity": 10},
+    "safe": {"rate": 2, "capacity": 5},
+    "rpc": {"rate": 10, "capacity": 25},
+    "reddit": {"rate": 100 / 60, "capacity": 10},
+    "twitter": {"rate": 50 / 900, "capacity": 5},
+}
+
+# Backoff after a rate limit error, when the upstream does not say how long to wait
+BASE_BACKOFF = 2
+MAX_BACKOFF = 60
+
+# Slowest rate an upstream is throttled down to after repeated 429s, as a
+# fraction of its configured rate
+MIN_RATE_FRACTION = 0.1
+
+# Only log waits longer than this
+LOG_WAIT_THRESHOLD = 1
+
+
+class TokenBucket:
+    """A thread-safe token bucket with adaptive backoff for one upstream"""
+
+    def __init__(self, name: str, rate: float, capacity: int):
+        """Init"""
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = clock.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+        # Stats
+        self.calls = 0
+        self.waits = 0
+        self.waited = 0.0
+        self.backoffs = 0
+
+    def reserve(self) -> Tuple[float, float]:
+        """Take a token. Returns when it was taken and how many seconds to
+        wait from then before using it"""
+        with self.lock:
+            now = clock.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            # Tokens can go negative: that is the queue of callers already waiting
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+            self.calls += 1
+            if wait > 0:
+                self.waits += 1
+                self.waited += wait
+
+        metrics.observe("rate_limit_wait_seconds", wait, {"upstream": self.name})
+        if wait > LOG_WAIT_THRESHOLD:
+            print(f"Waiting {wait:.1f}s for the {self.name} rate limit")
+        return now, wait
+
+    def acquire(self) -> float:
+        """Block until a call is allowed. Returns the time spent waiting"""
+        start, wait = self.reserve()
+        if wait > 0:
+            clock.sleep(wait, start)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Wait on the event loop until a call is allowed"""
+        start, wait = self.reserve()
+        if wait > 0:
+            await clock.sleep_async(wait, start)
+        return wait
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """Register a rate limit error. Every caller of the bucket waits it out"""
+        with self.lock:
+            self.failures += 1
+            self.backoffs += 1
+
+            if retry_after is None:
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.failures - 1))
+                # Equal jitter so that concurrent callers do not retry in lockstep
+                delay = delay / 2 + random.uniform(0, delay / 2)
+            else:
+                # Never retry before the upstream told us to
+                delay = retry_after + random.uniform(0, min(1, retry_after * 0.1))
+
+            # Slow down until the upstream stops complaining
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self.blocked_until = max(self.blocked_until, clock.monotonic() + delay)
+
+        metrics.inc("rate_limit_backoffs_total", {"upstream": self.name})
+        print(f"Hit the {self.name} rate limit. Backing off {delay:.1f}s")
+        return delay
+
+    def success(self):
+        """Register a successful call, recovering the rate little by little"""
+        with self.lock:
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def stats(self) -> Dict:
+        """Get the bucket stats"""
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "waits": self.waits,
+                "waited_seconds": round(self.waited, 3),
+                "backoffs": self.backoffs,
+                "rate": self.rate,
+            }
+
+
+buckets: Dict[str, TokenBucket] = {}
+buckets_lock = threading.Lock()
+
+
+def get_bucket(upstream: str) -> TokenBucket:
+    """Get the shared bucket of an upstream"""
+    with buckets_lock:
+        if upstream not in buckets:
+            limits = UPSTREAM_LIMITS.get(upstream, {"rate": 1, "capacity": 1})
+            buckets[upstream] = TokenBucket(upstream, **limits)
+        return buckets[upstream]
+
+
+def get_stats() -> Dict[str, Dict]:
+    """Get the stats of all the buckets, including the time spent waiting"""
+    with buckets_lock:
+        return {name: bucket.stats() for name, bucket in buckets.items()}
+
+
+def collect_metrics():
+    """Current rate of every bucket, which drops after rate limit errors"""
+    for name, stats in get_stats().items():
+        yield "rate_limit_rate", "gauge", {"upstream": name}, stats["rate"]
+
+
+metrics.register(collect_metrics)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, given either in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - clock.time())
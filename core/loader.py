@@ -0,0 +1,264 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import google.generativeai as genai
+from google.generativeai.types import FunctionDeclaration
+
+from core.funds import Fund
+from core.plugin import Plugin
+
+PLUGINS_DIR = Path(__file__).parent.parent / "plugins"
+
+# Tool declarations of the plugins, so they are known without importing them.
+# Generated, and regenerated for the plugins whose source changed
+MANIFEST_PATH = PLUGINS_DIR / "manifest.json"
+
+
+# Changed when the format of the manifest entries changes
+MANIFEST_VERSION = 2
+
+# Sources outside the plugin folders that the declarations depend on
+CORE_SOURCES = [Path(__file__).parent / "plugin.py"]
+
+
+def source_hash(folder: Path) -> str:
+    """Hash of the source files of a plugin package, with the core sources
+    and the manifest version, so that a change to a helper module of the
+    plugin also declares it again"""
+    digest = hashlib.sha256(str(MANIFEST_VERSION).encode())
+    for path in CORE_SOURCES:
+        digest.update(path.read_bytes())
+    for path in sorted(folder.rglob("*.py")):
+        digest.update(path.relative_to(folder).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def find_plugin_class(module) -> type:
+    """Get the class of a module that inherits from Plugin"""
+    for attr_name in dir(module):
+        plugin_class = getattr(module, attr_name)
+        if (
+            isinstance(plugin_class, type)
+            and issubclass(plugin_class, Plugin)
+            and plugin_class is not Plugin
+        ):
+            return plugin_class
+    raise ValueError(f"No plugin in {module.__name__}")
+
+
+def declare_function(func) -> Dict:
+    """Gemini function declaration of a function, as JSON"""
+    declaration = FunctionDeclaration.from_function(func).to_proto()
+    return json.loads(type(declaration).to_json(declaration))
+
+
+def declare_plugin(folder: str) -> Dict:
+    """Build the manifest entry of a plugin. Imports its module but does not
+    instantiate the plugin"""
+    module_name = f"plugins.{folder}.plugin"
+    plugin_class = find_plugin_class(importlib.import_module(module_name))
+
+    tools = []
+    for attr in dir(plugin_class):
+        func = getattr(plugin_class, attr)
+        if callable(func) and attr.endswith("_tool"):
+            # Bound to a placeholder so that self is not declared
+            tools.append(
+                {
+                    "declaration": declare_function(
+                        types.MethodType(func, plugin_class)
+                    ),
+                    "async": inspect.iscoroutinefunction(func),
+                }
+            )
+    return {
+        "module": module_name,
+        "class": plugin_class.__name__,
+        "per_fund": plugin_class.PER_FUND,
+        "tools": tools,
+    }
+
+
+class PluginLoader:
+    """Knows the tools of every plugin from the manifest. A plugin module is
+    imported and the plugin instantiated only when one of its tools is first
+    called, so a slow or broken plugin does not hold the others back.
+
+    The loader of a fund gives its own instance of the plugins that trade to
+    the fund, and takes the other plugins from the shared loader, so that the
+    funds of a process share the research plugins and their clients"""
+
+    def __init__(
+        self,
+        plugins_dir: Path = PLUGINS_DIR,
+        manifest_path=MANIFEST_PATH,
+        fund: Optional[Fund] = None,
+        shared: Optional["PluginLoader"] = None,
+    ):
+        """Init"""
+        self.plugins_dir = plugins_dir
+        self.manifest_path = manifest_path
+        self.fund = fund
+        self.shared = shared
+        self.manifest: Dict[str, Dict] = {}
+        self.tool_plugins: Dict[str, str] = {}
+        self.plugins: Dict[str, Plugin] = {}
+        # Import and init seconds, and errors, per plugin
+        self.profile: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.plugin_locks: Dict[str, threading.Lock] = {}
+
+    def load_manifest(self):
+        """Read the manifest, declaring again the plugins whose source changed"""
+        if self.shared is not None:
+            if not self.shared.manifest:
+                self.shared.load_manifest()
+            self.manifest = self.shared.manifest
+            self.tool_plugins = self.shared.tool_plugins
+            return
+
+        manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+
+        entries = {}
+        for folder in sorted(os.listdir(self.plugins_dir)):
+            plugin_path = self.plugins_dir / folder / "plugin.py"
+            if not plugin_path.is_file():
+                continue
+
+            digest = source_hash(plugin_path.parent)
+            entry = manifest.get(folder)
+            if entry is None or entry.get("source_hash") != digest:
+                print(f"Declaring the {folder} plugin tools")
+                start = time.perf_counter()
+                try:
+                    entry = {**declare_plugin(folder), "source_hash": digest}
+                except Exception as e:
+                    print(f"Couldnt declare the {folder} plugin: {e}")
+                    self.profile[folder] = {"error": str(e)}
+                    continue
+                self.profile[folder] = {"import": time.perf_counter() - start}
+            entries[folder] = entry
+
+        if entries != manifest:
+            tmp_path = self.manifest_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(entries, manifest_file, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+        self.manifest = entries
+        self.tool_plugins = {
+            tool["declaration"]["name"]: folder
+            for folder, entry in entries.items()
+            for tool in entry["tools"]
+        }
+
+    def get_declarations(self) -> List:
+        """Gemini function declarations of all the plugin tools"""
+        return [
+            genai.protos.FunctionDeclaration.from_json(json.dumps(tool["declaration"]))
+            for entry in self.manifest.values()
+            for tool in entry["tools"]
+        ]
+
+    def get_async_tools(self) -> List[str]:
+        """Names of the tools that are coroutines"""
+        return [
+            tool["declaration"]["name"]
+            for entry in self.manifest.values()
+            for tool in entry["tools"]
+            if tool["async"]
+        ]
+
+    def get_plugin(self, folder: str) -> Plugin:
+        """Get a plugin, importing and instantiating it on first use"""
+        entry = self.manifest[folder]
+        per_fund = entry.get("per_fund", False)
+        if self.shared is not None and not per_fund:
+            return self.shared.get_plugin(folder)
+
+        with self.lock:
+            lock = self.plugin_locks.setdefault(folder, threading.Lock())
+
+        with lock:
+            if folder in self.plugins:
+                return self.plugins[folder]
+
+            profile = self.profile.setdefault(folder, {})
+
+            try:
+                start = time.perf_counter()
+                imported = entry["module"] in sys.modules
+                module = importlib.import_module(entry["module"])
+                if not imported:
+                    profile["import"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                plugin_class = getattr(module, entry["class"])
+                plugin = plugin_class(self.fund) if per_fund else plugin_class()
+                plugin.loader = self
+                profile["init"] = time.perf_counter() - start
+            except Exception as e:
+                profile["error"] = str(e)
+                raise
+            profile.pop("error", None)
+
+            self.plugins[folder] = plugin
+            owner = f" for the {self.fund.name} fund" if per_fund and self.fund else ""
+            print(
+                f"Loaded {plugin.NAME} plugin{owner} "
+                f"(import {profile.get('import', 0):.2f}s, init {profile['init']:.2f}s)"
+            )
+            return plugin
+
+    def get_tool(self, name: str):
+        """Get the method that implements a tool, loading its plugin if needed"""
+        return getattr(self.get_plugin(self.tool_plugins[name]), name)
+
+    def load_all(self):
+        """Load every plugin now instead of on first use"""
+        for folder in self.manifest:
+            try:
+                self.get_plugin(folder)
+            except Exception as e:
+                print(f"Couldnt load the {folder} plugin: {e}")
+
+    def report(self) -> str:
+        """Import and init time of every plugin, as a table"""
+        rows = ["plugin|import_s|init_s|status"]
+        # The shared plugins are profiled by the shared loader
+        profiles, plugins = dict(self.profile), dict(self.plugins)
+        if self.shared is not None:
+            profiles = {**self.shared.profile, **profiles}
+            plugins = {**self.shared.plugins, **plugins}
+        for folder in sorted(set(self.manifest) | set(profiles)):
+            profile = profiles.get(folder, {})
+            if "error" in profile:
+                status = f"error: {profile['error']}"
+            elif folder in plugins:
+                status = "loaded"
+            else:
+                status = "lazy"
+            rows.append(
+                "|".join(
+                    [
+                        folder,
+                        f"{profile['import']:.2f}" if "import" in profile else "-",
+                        f"{profile['init']:.2f}" if "init" in profile else "-",
+                        status,
+                    ]
+                )
+            )
+        return "\n".join(rows)
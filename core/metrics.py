@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.db import STORAGE_PATH
+
+# Prefix of every exported metric
+NAMESPACE = "memepool"
+
+# Histogram buckets for latencies, in seconds, and for token counts
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 200_000)
+
+# Prometheus text file, rewritten after every turn, and structured event log.
+# Only written when METRICS_FILES is set
+METRICS_FILE = STORAGE_PATH / "metrics.prom"
+EVENTS_FILE = STORAGE_PATH / "events.jsonl"
+
+# A (name, type, labels, value) sample reported by a collector at export time
+Sample = Tuple[str, str, Dict[str, str], float]
+
+
+def escape(value) -> str:
+    """Escape a label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def format_labels(labels: Tuple) -> str:
+    """Render labels in the Prometheus text format"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """Cumulative histogram of observations"""
+
+    def __init__(self, buckets: Tuple):
+        """Init"""
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Add an observation"""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms of the agent, exported in the Prometheus text
+    format to a file or a local endpoint"""
+
+    def __init__(self):
+        """Init"""
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.events_lock = threading.Lock()
+
+    def inc(self, name: str, labels: Optional[Dict] = None, amount: float = 1):
+        """Increase a counter"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[Dict] = None,
+        buckets: Tuple = LATENCY_BUCKETS,
+    ):
+        """Add an observation to a histogram"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timed(self, name: str, labels: Optional[Dict] = None):
+        """Observe the duration of a block, and count it as an error if it
+        raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{name.removesuffix('_seconds')}_errors_total", labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def register(self, collector: Callable[[], Iterable[Sample]]):
+        """Add a function that reports samples, like the stats of a component
+        that already keeps its own counters, at export time"""
+        self.collectors.append(collector)
+
+    def export(self) -> str:
+        """Render all the metrics in the Prometheus text format"""
+        lines = []
+        typed = set()
+
+        def add(name: str, kind: str, labels: Tuple, value: float):
+            full_name = f"{NAMESPACE}_{name}"
+            if full_name not in typed:
+                lines.append(f"# TYPE {full_name} {kind}")
+                typed.add(full_name)
+            lines.append(f"{full_name}{format_labels(labels)} {value}")
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (h.buckets, list(h.counts), h.sum, h.count))
+                for key, h in self.histograms.items()
+            )
+
+        for (name, labels), value in counters:
+            add(name, "counter", labels, value)
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            full_name = f"{NAMESPACE}_{name}"
+            if full_name not in typed:
+                lines.append(f"# TYPE {full_name} histogram")
+                typed.add(full_name)
+            for bound, bucket_count in zip(buckets, counts):
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(
+                    f"{full_name}_bucket{format_labels(bucket_labels)} {bucket_count}"
+                )
+            inf_labels = labels + (("le", "+Inf"),)
+            lines.append(f"{full_name}_bucket{format_labels(inf_labels)} {count}")
+            lines.append(f"{full_name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{full_name}_count{format_labels(labels)} {count}")
+
+        for collector in self.collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Exception while collecting metrics: {e}")
+                continue
+            for name, kind, labels, value in samples:
+                add(name, kind, tuple(sorted(labels.items())), value)
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path = METRICS_FILE):
+        """Write the metrics to a file, for a node exporter textfile collector"""
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.export())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve the metrics on http://host:port/metrics in the background"""
+        if self.server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                """Metrics endpoint"""
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.export().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                """Do not log every scrape"""
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        ).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def log(self, event: str, **fields):
+        """Append a structured event to the JSON log"""
+        line = json.dumps({"ts": time.time(), "event": event, **fields}, default=str)
+        with self.events_lock:
+            with open(EVENTS_FILE, "a", encoding="utf-8") as events_file:
+                events_file.write(line + "\n")
+
+
+metrics = Metrics()
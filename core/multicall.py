@@ -0,0 +1,259 @@
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from eth_abi import decode, encode
+from peewee import CharField, CompositeKey, IntegerField
+from web3 import Web3
+
+from core.db import BaseModel, init_db
+from core.limiter import get_bucket
+
+# Multicall3 is deployed at the same address on every major chain.
+# Dev chains without it fall back to one eth_call per call
+MULTICALL3_ADDRESS = os.environ.get(
+    "MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11"
+)
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"},
+                ],
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"},
+                ],
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    },
+]
+
+BALANCE_OF_SELECTOR = Web3.keccak(text="balanceOf(address)")[:4]
+DECIMALS_SELECTOR = Web3.keccak(text="decimals()")[:4]
+ALLOWANCE_SELECTOR = Web3.keccak(text="allowance(address,address)")[:4]
+GET_ETH_BALANCE_SELECTOR = Web3.keccak(text="getEthBalance(address)")[:4]
+
+
+class TokenDecimals(BaseModel):
+    """ERC20 decimals. They never change, so they are cached forever"""
+
+    chain_id = IntegerField()
+    address = CharField()
+    decimals = IntegerField()
+
+    class Meta:
+        primary_key = CompositeKey("chain_id", "address")
+
+
+decimals_cache: Dict[Tuple[int, str], int] = {}
+decimals_lock = threading.Lock()
+loaded_chains = set()
+
+
+def get_cached_decimals(chain_id: int, address: str) -> Optional[int]:
+    """Get the decimals of a token if they are already known"""
+    with decimals_lock:
+        if chain_id not in loaded_chains:
+            init_db(TokenDecimals)
+            rows = TokenDecimals.select().where(TokenDecimals.chain_id == chain_id)
+            for row in rows:
+                decimals_cache[(chain_id, row.address)] = row.decimals
+            loaded_chains.add(chain_id)
+        return decimals_cache.get((chain_id, address.lower()))
+
+
+def set_cached_decimals(chain_id: int, address: str, decimals: int):
+    """Store the decimals of a token"""
+    with decimals_lock:
+        decimals_cache[(chain_id, address.lower())] = decimals
+    init_db(TokenDecimals)
+    TokenDecimals.insert(
+        chain_id=chain_id, address=address.lower(), decimals=decimals
+    ).on_conflict_replace().execute()
+
+
+def encode_call(
+    selector: bytes, types: Optional[List[str]] = None, args: Optional[List] = None
+) -> bytes:
+    """Encode a contract call"""
+    return selector + (encode(types, args) if types else b"")
+
+
+def decode_uint(success: bool, data: bytes) -> Optional[int]:
+    """Decode a uint return value, if the call succeeded"""
+    if not success or len(data) < 32:
+        return None
+    return decode(["uint256"], data)[0]
+
+
+class Multicall:
+    """Batch read-only contract calls into a single Multicall3 aggregate3 call"""
+
+    def __init__(self, w3: Web3, address: str = MULTICALL3_ADDRESS):
+        """Init"""
+        self.w3 = w3
+        self.address = Web3.to_checksum_address(address)
+        self.contract = w3.eth.contract(address=self.address, abi=MULTICALL3_ABI)
+        self.deployed = None
+        self.chain_id = None
+
+    def get_chain_id(self) -> int:
+        """Get the chain id, only once"""
+        if self.chain_id is None:
+            self.chain_id = self.w3.eth.chain_id
+        return self.chain_id
+
+    def is_deployed(self) -> bool:
+        """Whether Multicall3 exists on this chain"""
+        if self.deployed is None:
+            self.deployed = len(self.w3.eth.get_code(self.address)) > 0
+            if not self.deployed:
+                print("Multicall3 is not deployed, falling back to single calls")
+        return self.deployed
+
+    def aggregate(
+        self, calls: List[Tuple[str, bytes]], block_identifier="latest"
+    ) -> List[Tuple[bool, bytes]]:
+        """Run (target, calldata) calls at the same block, allowing failures"""
+        if not calls:
+            return []
+
+        bucket = get_bucket("rpc")
+
+        if self.is_deployed():
+            bucket.acquire()
+            return [
+                (success, bytes(data))
+                for success, data in self.contract.functions.aggregate3(
+                    [(target, True, data) for target, data in calls]
+                ).call(block_identifier=block_identifier)
+            ]
+
+        results = []
+        for target, data in calls:
+            bucket.acquire()
+            try:
+                result = self.w3.eth.call(
+                    {"to": target, "data": data}, block_identifier
+                )
+                results.append((True, bytes(result)))
+            except Exception:
+                results.append((False, b""))
+        return results
+
+    def get_decimals(self, token_addresses: List[str]) -> Dict[str, Optional[int]]:
+        """Get the decimals of many tokens, reading only the unknown ones"""
+        token_addresses = [Web3.to_checksum_address(t) for t in token_addresses]
+        chain_id = self.get_chain_id()
+
+        missing = [
+            t for t in token_addresses if get_cached_decimals(chain_id, t) is None
+        ]
+        results = self.aggregate([(t, encode_call(DECIMALS_SELECTOR)) for t in missing])
+        for token, result in zip(missing, results):
+            decimals = decode_uint(*result)
+            if decimals is not None:
+                set_cached_decimals(chain_id, token, decimals)
+
+        return {t: get_cached_decimals(chain_id, t) for t in token_addresses}
+
+    def get_balances(
+        self, owner: str, token_addresses: List[str], include_native: bool = True
+    ) -> Dict:
+        """Get the native and ERC20 balances of an owner in one call, pinned to
+        one block. Unknown decimals are fetched in the same call"""
+        token_addresses = [Web3.to_checksum_address(t) for t in token_addresses]
+        chain_id = self.get_chain_id()
+
+        bucket = get_bucket("rpc")
+        bucket.acquire()
+        block = self.w3.eth.block_number
+
+        missing_decimals = [
+            t for t in token_addresses if get_cached_decimals(chain_id, t) is None
+        ]
+
+        calls = [
+            (t, encode_call(BALANCE_OF_SELECTOR, ["address"], [owner]))
+            for t in token_addresses
+        ]
+        calls += [(t, encode_call(DECIMALS_SELECTOR)) for t in missing_decimals]
+
+        native_in_batch = include_native and self.is_deployed()
+        if native_in_batch:
+            calls.append(
+                (
+                    self.address,
+                    encode_call(GET_ETH_BALANCE_SELECTOR, ["address"], [owner]),
+                )
+            )
+
+        results = self.aggregate(calls, block)
+
+        decimal_results = results[len(token_addresses) :]
+        for token, result in zip(missing_decimals, decimal_results):
+            decimals = decode_uint(*result)
+            if decimals is not None:
+                set_cached_decimals(chain_id, token, decimals)
+
+        balances = {}
+        for token, result in zip(token_addresses, results):
+            balance_wei = decode_uint(*result)
+            decimals = get_cached_decimals(chain_id, token)
+            balances[token] = {
+                "balance_wei": balance_wei,
+                "decimals": decimals,
+                "balance": None
+                if balance_wei is None or decimals is None
+                else balance_wei / 10**decimals,
+            }
+
+        portfolio = {"block": block, "tokens": balances}
+
+        if include_native:
+            if native_in_batch:
+                native_wei = decode_uint(*results[-1])
+            else:
+                bucket.acquire()
+                native_wei = self.w3.eth.get_balance(owner, block)
+            portfolio["native"] = (
+                None
+                if native_wei is None
+                else float(Web3.from_wei(native_wei, "ether"))
+            )
+
+        return portfolio
+
+    def get_allowances(
+        self, owner: str, spender: str, token_addresses: List[str]
+    ) -> Dict[str, Optional[int]]:
+        """Get the allowances of an owner to a spender for many tokens at once"""
+        token_addresses = [Web3.to_checksum_address(t) for t in token_addresses]
+        results = self.aggregate(
+            [
+                (
+                    t,
+                    encode_call(
+                        ALLOWANCE_SELECTOR, ["address", "address"], [owner, spender]
+                    ),
+                )
+                for t in token_addresses
+            ]
+        )
+        return {t: decode_uint(*r) for t, r in zip(token_addresses, results)}
@@ -1,19 +1,32 @@
 import os
-from pathlib import Path
+from typing import Optional
 
 from dotenv import load_dotenv
 
+from core.db import STORAGE_PATH
+from core.funds import Fund
+from core.http import get_client
+
 
 class Plugin:
     """Plugin base"""
 
     NAME = "Plugin"
     ENV_VARS = []
+    # Plugins that trade get an instance per fund. The others are shared by
+    # all the funds of the process
+    PER_FUND = False
 
-    def __init__(self):
+    def __init__(self, fund: Optional[Fund] = None):
         """Init"""
         load_dotenv(override=True)
+        self.fund = fund
         for env_var in self.ENV_VARS:
-            setattr(self, env_var.lower(), os.environ[f"{self.NAME.upper()}_{env_var}"])
+            name = f"{self.NAME.upper()}_{env_var}"
+            value = fund.get_env(name) if fund else os.environ[name]
+            setattr(self, env_var.lower(), value)
 
-        self.storage_path = Path(__file__).parent.parent
+        self.storage_path = STORAGE_PATH
+        self.http = get_client()
+        # Set by the plugin loader, to reach the other plugins
+        self.loader = None
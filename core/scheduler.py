@@ -0,0 +1,51 @@
+import asyncio
+from typing import List
+
+from core.agent import Agent
+from core.funds import Fund
+from core.loader import PluginLoader
+
+
+class FundScheduler:
+    """Runs an agent session per fund in a single process, all on one event
+    loop. The plugins that do not trade, with their clients, rate limits and
+    caches, are loaded once and shared by every session, so each fund adds
+    its trades and LLM turns but not its own market and social polling"""
+
+    def __init__(self, system_prompt: str, funds: List[Fund]):
+        """Init"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.shared = PluginLoader()
+        self.agents = []
+        for fund in funds:
+            self.agents.append(
+                Agent(
+                    fund.get_system_prompt(system_prompt),
+                    async_mode=True,
+                    fund=fund,
+                    loader=PluginLoader(fund=fund, shared=self.shared),
+                    loop=self.loop,
+                )
+            )
+
+    async def run_fund(self, agent: Agent):
+        """Run the session of a fund. A failing fund does not stop the others"""
+        try:
+            await agent.run_async()
+        except Exception as e:
+            print(f"The {agent.fund.name} fund stopped: {e}")
+
+    def run(self):
+        """Run every fund until interrupted"""
+        print(f"Running {len(self.agents)} funds...")
+        try:
+            self.loop.run_until_complete(
+                asyncio.gather(*[self.run_fund(agent) for agent in self.agents])
+            )
+        except KeyboardInterrupt:
+            print("Agents stopped")
+        finally:
+            for agent in self.agents:
+                agent.flush_turn()
+                agent.executor.shutdown(wait=False, cancel_futures=True)
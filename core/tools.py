@@ -1,24 +1,28 @@
 import functools
-import time
+import inspect
 
+from core.limiter import get_bucket
 
-def rate_limit(interval: int = 5):
-    """Rate limit a function call"""
+
+def rate_limit(upstream: str):
+    """Rate limit a function call using the shared bucket of an upstream.
+    Coroutines wait without blocking the loop"""
 
     def decorator(func):
-        # Needs to be a mutable to store state
-        # We initialize it so we do not wait for some time before the first call
-        last_called = [time.time() - interval]
+        bucket = get_bucket(upstream)
 
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            now = time.time()
-            elapsed = now - last_called[0]
+        if inspect.iscoroutinefunction(func):
 
-            if elapsed < interval:
-                time.sleep(interval - elapsed)
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                await bucket.acquire_async()
+                return await func(*args, **kwargs)
 
-            last_called[0] = time.time()
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bucket.acquire()
             return func(*args, **kwargs)
 
         return wrapper
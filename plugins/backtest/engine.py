@@ -0,0 +1,293 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from plugins.backtest.history import PriceHistory
+from plugins.coingecko.snapshot import format_number
+
+# Parameters of the rebalance policy. Every rebalance hours, the coins are
+# ranked by their return over the last lookback hours, among those with a 24h
+# volume of at least min_volume. Coins that fall out of the top_k are sold
+# whole and new ones are bought with buy_amount USDC each, while cash lasts,
+# like the agent does with cowswap_sell_tokens_tool and cowswap_buy_tokens_tool
+PARAMETERS = ["lookback", "top_k", "rebalance", "buy_amount", "min_volume"]
+
+# USDC the simulated fund starts with
+INITIAL_CASH = 100.0
+
+# CoW protocol fee, as a fraction of the traded value
+FEE = 0.001
+
+# Slippage is a base spread plus the price impact of the trade, proportional
+# to its share of the hourly volume
+BASE_SLIPPAGE = 0.002
+IMPACT = 0.5
+
+# CowSwap.build_order accepts 1% less than the quote. Trades that would slip
+# more than that do not fill
+MAX_SLIPPAGE = 0.01
+
+# Parameter sets simulated together by each worker process
+CHUNK_SIZE = 256
+
+RESULT_COLUMNS = [
+    "final_equity",
+    "pnl",
+    "return",
+    "max_drawdown",
+    "turnover",
+    "trades",
+    "failed_trades",
+    "fees",
+]
+
+
+def make_grid(**values: List) -> Dict[str, np.ndarray]:
+    """Every combination of the given parameter values"""
+    missing = set(PARAMETERS) - set(values)
+    if missing:
+        raise ValueError(f"Missing parameters: {sorted(missing)}")
+    combinations = list(itertools.product(*(values[p] for p in PARAMETERS)))
+    columns = zip(*combinations)
+    return {
+        name: np.array(column, dtype=np.float64)
+        for name, column in zip(PARAMETERS, columns)
+    }
+
+
+def slippage(notional: np.ndarray, hourly_volume: np.ndarray) -> np.ndarray:
+    """Expected slippage of trades. Infinite without volume"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            hourly_volume > 0,
+            BASE_SLIPPAGE + IMPACT * notional / hourly_volume,
+            np.inf,
+        )
+
+
+def simulate_period(
+    history: PriceHistory,
+    params: Dict[str, np.ndarray],
+    period: int,
+    initial_cash: float,
+    fee: float,
+) -> Dict[str, np.ndarray]:
+    """Simulate parameter sets that rebalance every period hours, all at once.
+    State is kept as (sets, coins) arrays and the equity between rebalances
+    is a single matrix product"""
+    prices = history.prices
+    marks = np.nan_to_num(prices)
+    hourly_volumes = history.volumes / 24
+    sets, coins = len(params["top_k"]), prices.shape[1]
+
+    # Sets that share a lookback and a volume filter rank the coins the same
+    signals, signal_index = np.unique(
+        np.column_stack([params["lookback"], params["min_volume"]]),
+        axis=0,
+        return_inverse=True,
+    )
+    signal_index = signal_index.reshape(-1)
+    lookbacks = signals[:, 0].astype(np.int64)
+    min_volume = signals[:, 1][:, None]
+    top_k = params["top_k"][:, None]
+    buy_amounts, buy_index = np.unique(params["buy_amount"], return_inverse=True)
+    buy_index = buy_index.reshape(-1)
+    buy_amount = params["buy_amount"]
+
+    units = np.zeros((sets, coins))
+    cash = np.full(sets, initial_cash)
+    peak = cash.copy()
+    max_drawdown = np.zeros(sets)
+    equity_sum = np.zeros(sets)
+    traded = np.zeros(sets)
+    fees = np.zeros(sets)
+    trades = np.zeros(sets)
+    failed = np.zeros(sets)
+
+    start = int(lookbacks.max())
+    steps = list(range(start, len(history), period))
+    for t, end in zip(steps, steps[1:] + [len(history)]):
+        # Rank once per signal, then each set takes its own top_k
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.log(prices[t] / prices[t - lookbacks])
+        eligible = np.isfinite(returns) & (history.volumes[t] >= min_volume)
+        scores = np.where(eligible, returns, -np.inf)
+        signal_order = np.argsort(-scores, axis=1, kind="stable")
+        signal_ranks = np.empty_like(signal_order)
+        np.put_along_axis(signal_ranks, signal_order, np.arange(coins)[None, :], axis=1)
+        target = eligible[signal_index] & (signal_ranks[signal_index] < top_k)
+
+        # Sell whole positions that left the target
+        held = units > 0
+        notional = units * marks[t]
+        sell_slippage = slippage(notional, hourly_volumes[t])
+        sells = held & ~target & (sell_slippage <= MAX_SLIPPAGE)
+        failed += (held & ~target & ~sells).sum(axis=1)
+        with np.errstate(invalid="ignore"):
+            proceeds = np.where(sells, notional * (1 - sell_slippage), 0)
+        cash += proceeds.sum(axis=1) * (1 - fee)
+        fees += proceeds.sum(axis=1) * fee
+        traded += np.where(sells, notional, 0).sum(axis=1)
+        trades += sells.sum(axis=1)
+        units[sells] = 0
+
+        # Buy the new coins, best ranked first, while the cash lasts
+        candidates = target & ~held
+        buy_slippage = slippage(buy_amounts[:, None], hourly_volumes[t])[buy_index]
+        buys = candidates & (buy_slippage <= MAX_SLIPPAGE)
+        failed += (candidates & ~buys).sum(axis=1)
+        affordable = np.floor(cash / buy_amount)
+        short = np.flatnonzero(buys.sum(axis=1) > affordable)
+        if len(short):
+            order = signal_order[signal_index[short]]
+            ranked = np.take_along_axis(buys[short], order, axis=1)
+            ranked &= np.cumsum(ranked, axis=1) <= affordable[short, None]
+            allowed = np.zeros_like(ranked)
+            np.put_along_axis(allowed, order, ranked, axis=1)
+            buys[short] = allowed
+
+        spent = buys.sum(axis=1) * buy_amount
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bought = (buy_amount[:, None] * (1 - fee)) / (marks[t] * (1 + buy_slippage))
+        units += np.where(buys, bought, 0)
+        cash -= spent
+        fees += spent * fee
+        traded += spent
+        trades += buys.sum(axis=1)
+
+        # Mark to market until the next rebalance
+        equity = cash[:, None] + units @ marks[t:end].T
+        running_peak = np.maximum.accumulate(
+            np.concatenate([peak[:, None], equity], axis=1), axis=1
+        )[:, 1:]
+        max_drawdown = np.maximum(max_drawdown, (1 - equity / running_peak).max(axis=1))
+        peak = running_peak[:, -1]
+        equity_sum += equity.sum(axis=1)
+        final_equity = equity[:, -1]
+
+    if not steps:
+        final_equity = cash
+
+    mean_equity = equity_sum / max(1, len(history) - start)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        turnover = np.where(mean_equity > 0, traded / mean_equity, 0)
+    return {
+        "final_equity": final_equity,
+        "pnl": final_equity - initial_cash,
+        "return": final_equity / initial_cash - 1,
+        "max_drawdown": max_drawdown,
+        "turnover": turnover,
+        "trades": trades,
+        "failed_trades": failed,
+        "fees": fees,
+    }
+
+
+def simulate(
+    history: PriceHistory,
+    params: Dict[str, np.ndarray],
+    initial_cash: float = INITIAL_CASH,
+    fee: float = FEE,
+) -> Dict[str, np.ndarray]:
+    """Simulate parameter sets, grouped by rebalance period"""
+    results = {column: np.zeros(len(params["top_k"])) for column in RESULT_COLUMNS}
+    periods = params["rebalance"].astype(np.int64)
+    for period in np.unique(periods):
+        selected = periods == period
+        subset = {name: values[selected] for name, values in params.items()}
+        period_results = simulate_period(
+            history, subset, int(period), initial_cash, fee
+        )
+        for column in RESULT_COLUMNS:
+            results[column][selected] = period_results[column]
+    return results
+
+
+# History of a worker process, loaded once by its initializer
+worker_history: Optional[PriceHistory] = None
+
+
+def init_worker(history_path: Path):
+    """Load the history in a worker process"""
+    global worker_history
+    worker_history = PriceHistory.load_packed(history_path)
+
+
+def simulate_chunk(
+    params: Dict[str, np.ndarray], initial_cash: float, fee: float
+) -> Dict[str, np.ndarray]:
+    """Simulate a chunk of parameter sets in a worker process"""
+    return simulate(worker_history, params, initial_cash, fee)
+
+
+def sweep(
+    history_path: Path,
+    params: Dict[str, np.ndarray],
+    workers: Optional[int] = None,
+    initial_cash: float = INITIAL_CASH,
+    fee: float = FEE,
+    chunk_size: int = CHUNK_SIZE,
+) -> Dict[str, np.ndarray]:
+    """Simulate many parameter sets across a process pool. Every worker loads
+    the packed history once, and gets chunks of sets that share a rebalance
+    period so they run vectorized"""
+    size = len(params["top_k"])
+    # Sets of the same period next to each other, then cut into chunks
+    order = np.argsort(params["rebalance"], kind="stable")
+    periods = params["rebalance"][order]
+    chunks = []
+    for period in np.unique(periods):
+        indices = order[periods == period]
+        chunks += [
+            indices[i : i + chunk_size] for i in range(0, len(indices), chunk_size)
+        ]
+
+    results = {column: np.zeros(size) for column in RESULT_COLUMNS}
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=init_worker,
+        initargs=(history_path,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                simulate_chunk,
+                {name: values[indices] for name, values in params.items()},
+                initial_cash,
+                fee,
+            )
+            for indices in chunks
+        ]
+        for indices, future in zip(chunks, futures):
+            chunk_results = future.result()
+            for column in RESULT_COLUMNS:
+                results[column][indices] = chunk_results[column]
+    return results
+
+
+def to_table(
+    params: Dict[str, np.ndarray], results: Dict[str, np.ndarray], limit: int = 20
+) -> str:
+    """Render the best parameter sets by PnL as a compact table"""
+    order = np.argsort(-results["pnl"], kind="stable")[:limit]
+    rows = ["|".join(PARAMETERS + RESULT_COLUMNS)]
+    for i in order:
+        rows.append(
+            "|".join(
+                [format_number(params[name][i]) for name in PARAMETERS]
+                + [
+                    format_number(results["final_equity"][i]),
+                    f"{results['pnl'][i]:+.2f}",
+                    f"{results['return'][i]:+.1%}",
+                    f"{results['max_drawdown'][i]:.1%}",
+                    f"{results['turnover'][i]:.1f}",
+                    f"{results['trades'][i]:.0f}",
+                    f"{results['failed_trades'][i]:.0f}",
+                    f"{results['fees'][i]:.2f}",
+                ]
+            )
+        )
+    return "\n".join(rows)
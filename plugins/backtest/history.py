@@ -0,0 +1,144 @@
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# Folder with one <coingecko id>.csv file per coin, in the storage path. The
+# columns are timestamp (seconds or milliseconds), price and volume, which is
+# the 24h volume in USD, like CoinGecko's market_chart returns it
+HISTORY_FOLDER = "history"
+
+# Packed arrays of the CSV files, rebuilt when any of them changes
+HISTORY_FILE = "history.npz"
+
+HOUR = 3600
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Fill the NaNs of every column with the last value before them"""
+    rows = np.where(np.isfinite(values), np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = values[rows, np.arange(values.shape[1])]
+    # Nothing to fill from before the first value
+    filled[~np.maximum.accumulate(np.isfinite(values), axis=0)] = np.nan
+    return filled
+
+
+class PriceHistory:
+    """Hourly prices and 24h volumes of a set of coins, as (hours, coins)
+    arrays. Prices are NaN before a coin has any data"""
+
+    def __init__(
+        self,
+        timestamps: np.ndarray,
+        ids: List[str],
+        prices: np.ndarray,
+        volumes: np.ndarray,
+    ):
+        """Init"""
+        self.timestamps = timestamps
+        self.ids = ids
+        self.prices = prices
+        self.volumes = volumes
+
+    def __len__(self) -> int:
+        """Number of hours"""
+        return len(self.timestamps)
+
+    @classmethod
+    def from_csv(cls, folder: Path) -> Optional["PriceHistory"]:
+        """Align the CSV files of a folder on an hourly grid"""
+        paths = sorted(folder.glob("*.csv"))
+        series = []
+        for path in paths:
+            data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+            if not len(data):
+                continue
+            hours = data[:, 0] // (HOUR * 1000 if data[:, 0].max() > 1e11 else HOUR)
+            series.append((path.stem, hours.astype(np.int64), data[:, 1], data[:, 2]))
+        if not series:
+            return None
+
+        first = min(hours.min() for _, hours, _, _ in series)
+        last = max(hours.max() for _, hours, _, _ in series)
+        prices = np.full((last - first + 1, len(series)), np.nan)
+        volumes = np.full((last - first + 1, len(series)), np.nan)
+        for i, (_, hours, price, volume) in enumerate(series):
+            # The last sample of an hour wins
+            prices[hours - first, i] = price
+            volumes[hours - first, i] = volume
+
+        return cls(
+            np.arange(first, last + 1) * HOUR,
+            [coin_id for coin_id, _, _, _ in series],
+            forward_fill(prices),
+            np.nan_to_num(forward_fill(volumes)),
+        )
+
+    @classmethod
+    def load(cls, folder: Path) -> Optional["PriceHistory"]:
+        """Load the history of a folder, from the packed arrays when they are
+        newer than every CSV file"""
+        packed = folder / HISTORY_FILE
+        csv_times = [p.stat().st_mtime for p in folder.glob("*.csv")]
+        if packed.exists() and (
+            not csv_times or packed.stat().st_mtime >= max(csv_times)
+        ):
+            return cls.load_packed(packed)
+
+        history = cls.from_csv(folder)
+        if history is not None:
+            history.save(packed)
+        return history
+
+    @classmethod
+    def load_packed(cls, path: Path) -> "PriceHistory":
+        """Load packed arrays"""
+        with np.load(path) as data:
+            return cls(
+                data["timestamps"],
+                data["ids"].tolist(),
+                data["prices"],
+                data["volumes"],
+            )
+
+    def save(self, path: Path):
+        """Store the arrays, replacing the previous ones atomically"""
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            timestamps=self.timestamps,
+            ids=np.array(self.ids, dtype=str),
+            prices=self.prices,
+            volumes=self.volumes,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def synthetic(cls, hours: int, coins: int, seed: int = 0) -> "PriceHistory":
+        """Random walks with memecoin-like volatility, fat tails and late
+        listings, to benchmark the engine without real data"""
+        rng = np.random.default_rng(seed)
+        volatility = rng.uniform(0.005, 0.02, coins)
+        drift = rng.normal(0, 0.0002, coins)
+        returns = drift + volatility * rng.standard_t(3, (hours, coins)) / np.sqrt(3)
+        prices = rng.uniform(1e-5, 1, coins) * np.exp(np.cumsum(returns, axis=0))
+        volumes = rng.uniform(1e4, 1e7, coins) * np.exp(
+            rng.normal(0, 0.5, (hours, coins))
+        )
+
+        # A third of the coins list during the period
+        listed = np.where(
+            rng.random(coins) < 1 / 3, rng.integers(0, hours // 2, coins), 0
+        )
+        unlisted = np.arange(hours)[:, None] < listed
+        prices[unlisted] = np.nan
+        volumes[unlisted] = 0
+
+        return cls(
+            np.arange(hours) * HOUR,
+            [f"coin-{i}" for i in range(coins)],
+            prices,
+            volumes,
+        )
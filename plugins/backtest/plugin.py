@@ -0,0 +1,57 @@
+from typing import Dict, Optional
+
+from core.plugin import Plugin
+from plugins.backtest.engine import make_grid, simulate
+from plugins.backtest.history import HISTORY_FOLDER, PriceHistory
+
+
+class Backtest(Plugin):
+    """A plugin to evaluate rebalance strategies on historical data"""
+
+    NAME = "Backtest"
+
+    def __init__(self):
+        """Init"""
+        super().__init__()
+        self.history = None
+
+    def get_history(self) -> Optional[PriceHistory]:
+        """Load the price history once"""
+        if self.history is None:
+            folder = self.storage_path / HISTORY_FOLDER
+            if folder.is_dir():
+                self.history = PriceHistory.load(folder)
+        return self.history
+
+    def backtest_strategy_tool(
+        self,
+        lookback_hours: int = 24,
+        top_k: int = 5,
+        rebalance_hours: int = 4,
+        buy_amount_usdc: float = 1.0,
+        min_volume_usd: float = 0,
+    ) -> Optional[Dict]:
+        """Backtest a rebalance strategy on the stored hourly history of the
+        Base memecoins, starting with 100 USDC. Every rebalance_hours, coins
+        are ranked by their return over lookback_hours among those with a 24h
+        volume of at least min_volume_usd. Coins out of the top_k are sold and
+        new ones bought with buy_amount_usdc each. Includes fees and slippage.
+        Returns the PnL, max drawdown and turnover"""
+
+        history = self.get_history()
+        if history is None:
+            return None
+
+        params = make_grid(
+            lookback=[lookback_hours],
+            top_k=[top_k],
+            rebalance=[rebalance_hours],
+            buy_amount=[buy_amount_usdc],
+            min_volume=[min_volume_usd],
+        )
+        results = simulate(history, params)
+        return {
+            "hours": len(history),
+            "coins": len(history.ids),
+            **{column: round(float(value[0]), 4) for column, value in results.items()},
+        }
@@ -1,9 +1,10 @@
-import json
-from typing import List, Optional
+from typing import Optional
 
 import requests
 
+from core.cache import cached
 from core.plugin import Plugin
+from plugins.coingecko.snapshot import SNAPSHOT_FILE, MarketSnapshot
 
 
 class Coingecko(Plugin):
@@ -12,8 +13,15 @@ class Coingecko(Plugin):
     NAME = "Coingecko"
     ENV_VARS = ["API_KEY"]
 
-    def coingecko_get_base_memecoins_tool(self) -> Optional[List]:
-        """Get memecoins on the Base network"""
+    def __init__(self):
+        """Init"""
+        super().__init__()
+
+        # The previous snapshot is needed to compute the rank changes
+        self.snapshot = MarketSnapshot.load(self.storage_path / SNAPSHOT_FILE)
+
+    def get_snapshot(self) -> Optional[MarketSnapshot]:
+        """Fetch a new snapshot of the memecoins on the Base network"""
 
         url = "https://api.coingecko.com/api/v3/coins/markets"
 
@@ -27,20 +35,22 @@ class Coingecko(Plugin):
             "locale": "en",
         }
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-        }
-
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=60)
+            response = self.http.get(url, params=params)
             response.raise_for_status()
-            memecoins = response.json()
-
-            with open(
-                self.storage_path / "memecoins.json", "w", encoding="utf-8"
-            ) as memecoins_file:
-                json.dump(memecoins, memecoins_file, indent=4)
-
-            return memecoins
         except requests.exceptions.RequestException:
             return None
+
+        self.snapshot = MarketSnapshot.from_markets(response.json(), self.snapshot)
+        self.snapshot.save(self.storage_path / SNAPSHOT_FILE)
+        return self.snapshot
+
+    @cached(ttl=60, stale_ttl=240)
+    def coingecko_get_base_memecoins_tool(self) -> Optional[str]:
+        """Get memecoins on the Base network, as a table sorted by market cap.
+        vol/mcap is volume over market cap, range24h the price position within
+        the 24h low-high range (0 to 1) and rankΔ the change in rank since the
+        previous snapshot"""
+
+        snapshot = self.get_snapshot()
+        return snapshot.to_table() if snapshot else None
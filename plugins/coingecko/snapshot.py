@@ -0,0 +1,165 @@
+import math
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Snapshot file, in the storage path
+SNAPSHOT_FILE = "memecoins.npz"
+
+# Text columns and numeric columns kept from the /coins/markets objects
+TEXT_COLUMNS = ["id", "symbol", "name"]
+NUMERIC_COLUMNS = [
+    "market_cap_rank",
+    "current_price",
+    "market_cap",
+    "total_volume",
+    "price_change_percentage_24h",
+    "high_24h",
+    "low_24h",
+    "ath_change_percentage",
+]
+
+# Columns computed from the market data and the previous snapshot
+DERIVED_COLUMNS = ["volume_to_mcap", "rank_change", "range_position_24h"]
+
+
+def format_number(value: float) -> str:
+    """Format a number in a short, human readable way"""
+    if value is None or math.isnan(value):
+        return "-"
+    magnitude = abs(value)
+    for threshold, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if magnitude >= threshold:
+            return f"{value / threshold:.1f}{suffix}"
+    if magnitude >= 1 or magnitude == 0:
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    return f"{value:.4g}"
+
+
+class MarketSnapshot:
+    """A fixed-schema, column-oriented snapshot of the memecoin market"""
+
+    def __init__(self, timestamp: float, text: Dict[str, List[str]], numeric: Dict):
+        """Init"""
+        self.timestamp = timestamp
+        self.text = text
+        self.numeric = numeric
+
+    @classmethod
+    def from_markets(
+        cls, markets: List[Dict], previous: Optional["MarketSnapshot"] = None
+    ) -> "MarketSnapshot":
+        """Project the raw CoinGecko market objects into the snapshot schema"""
+        text = {
+            column: [str(coin.get(column) or "") for coin in markets]
+            for column in TEXT_COLUMNS
+        }
+        numeric = {
+            column: np.array(
+                [
+                    np.nan if coin.get(column) is None else coin[column]
+                    for coin in markets
+                ],
+                dtype=np.float64,
+            )
+            for column in NUMERIC_COLUMNS
+        }
+        snapshot = cls(time.time(), text, numeric)
+        snapshot.derive(previous)
+        return snapshot
+
+    def __len__(self) -> int:
+        """Number of coins"""
+        return len(self.text["id"])
+
+    @property
+    def ids(self) -> List[str]:
+        """The CoinGecko ids of the coins, by market cap"""
+        return self.text["id"]
+
+    def derive(self, previous: Optional["MarketSnapshot"] = None):
+        """Compute the derived columns"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            market_cap = self.numeric["market_cap"]
+            self.numeric["volume_to_mcap"] = np.where(
+                market_cap > 0, self.numeric["total_volume"] / market_cap, np.nan
+            )
+
+            low = self.numeric["low_24h"]
+            spread = self.numeric["high_24h"] - low
+            self.numeric["range_position_24h"] = np.where(
+                spread > 0, (self.numeric["current_price"] - low) / spread, np.nan
+            )
+
+        # Positive when the coin climbed in the ranking since the previous snapshot
+        rank_change = np.full(len(self), np.nan)
+        if previous is not None:
+            previous_ranks = dict(
+                zip(previous.ids, previous.numeric["market_cap_rank"])
+            )
+            rank_change = (
+                np.array(
+                    [previous_ranks.get(coin_id, np.nan) for coin_id in self.ids],
+                    dtype=np.float64,
+                )
+                - self.numeric["market_cap_rank"]
+            )
+        self.numeric["rank_change"] = rank_change
+
+    def to_table(self, limit: Optional[int] = None) -> str:
+        """Render the snapshot as a compact table for the model"""
+        header = "rank|id|symbol|price|mcap|vol|vol/mcap|24h%|range24h|ath%|rankΔ"
+        rows = [header]
+        for i in range(len(self) if limit is None else min(limit, len(self))):
+            n = {column: values[i] for column, values in self.numeric.items()}
+            rank_change = n["rank_change"]
+            rows.append(
+                "|".join(
+                    [
+                        format_number(n["market_cap_rank"]),
+                        self.text["id"][i],
+                        self.text["symbol"][i].upper(),
+                        format_number(n["current_price"]),
+                        format_number(n["market_cap"]),
+                        format_number(n["total_volume"]),
+                        format_number(n["volume_to_mcap"]),
+                        format_number(n["price_change_percentage_24h"]),
+                        format_number(n["range_position_24h"]),
+                        format_number(n["ath_change_percentage"]),
+                        "-" if math.isnan(rank_change) else f"{rank_change:+.0f}",
+                    ]
+                )
+            )
+        return "\n".join(rows)
+
+    def save(self, path: Path):
+        """Store the snapshot, replacing the previous one atomically"""
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            timestamp=np.array(self.timestamp),
+            **{f"text_{c}": np.array(v, dtype=str) for c, v in self.text.items()},
+            **{f"numeric_{c}": v for c, v in self.numeric.items()},
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["MarketSnapshot"]:
+        """Load a stored snapshot"""
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return cls(
+                    float(data["timestamp"]),
+                    {c: data[f"text_{c}"].tolist() for c in TEXT_COLUMNS},
+                    {
+                        c: data[f"numeric_{c}"]
+                        for c in NUMERIC_COLUMNS + DERIVED_COLUMNS
+                    },
+                )
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from web3 import Web3
+
+from core.multicall import Multicall
+
+# Approval receipts tracked at the same time
+MAX_PENDING_APPROVALS = 4
+
+# ERC20s do not decrease an infinite allowance on transfers
+INFINITE_ALLOWANCE = 2**256 - 1
+
+
+class AllowanceManager:
+    """Knows which tokens the owner already approved for a spender.
+
+    Allowances are read from the chain in a single multicall and cached.
+    Missing approvals are sent together, without blocking: the caller gets a
+    future that resolves when the approval is mined, so orders can be queued
+    behind it.
+    """
+
+    def __init__(
+        self,
+        multicall: Multicall,
+        owner: str,
+        spender: str,
+        send_approvals: Callable[[List[str]], Any],
+        wait_for_receipt: Callable[[Any], bool],
+        approval_amount: int = INFINITE_ALLOWANCE,
+    ):
+        """Init"""
+        self.multicall = multicall
+        self.owner = owner
+        self.spender = spender
+        self.send_approvals = send_approvals
+        self.wait_for_receipt = wait_for_receipt
+        self.approval_amount = approval_amount
+
+        self.allowances: Dict[str, int] = {}
+        self.pending: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_PENDING_APPROVALS, thread_name_prefix="approval"
+        )
+
+    def ensure(self, requirements: Dict[str, int]) -> Dict[str, Optional[Future]]:
+        """Make sure the spender can move the required amount of every token.
+
+        Returns, per token, None when the allowance is already there or a
+        future that resolves to the approval success.
+        """
+        requirements = {
+            Web3.to_checksum_address(token): amount
+            for token, amount in requirements.items()
+        }
+
+        with self.lock:
+            unknown = [
+                token
+                for token in requirements
+                if token not in self.allowances and token not in self.pending
+            ]
+
+        # Read every unknown allowance in one call
+        if unknown:
+            allowances = self.multicall.get_allowances(
+                self.owner, self.spender, unknown
+            )
+            with self.lock:
+                for token, allowance in allowances.items():
+                    if allowance is not None:
+                        self.allowances[token] = allowance
+
+        approvals = {}
+        missing = []
+        with self.lock:
+            for token, amount in requirements.items():
+                if token in self.pending:
+                    approvals[token] = self.pending[token]
+                elif self.allowances.get(token, 0) >= amount:
+                    approvals[token] = None
+                else:
+                    missing.append(token)
+            # Registered before the lock is released, so concurrent callers
+            # wait for this approval instead of sending their own
+            if missing:
+                future = Future()
+                for token in missing:
+                    self.pending[token] = future
+                    approvals[token] = future
+
+        if missing:
+            self.approve(missing, future)
+
+        return approvals
+
+    def approve(self, tokens: List[str], future: Future):
+        """Send the approvals and track their receipt in the background. The
+        future resolves to their success"""
+        try:
+            tx = self.send_approvals(tokens)
+        except Exception as e:
+            self.release(tokens, future, success=False)
+            future.set_exception(e)
+            raise
+        self.executor.submit(self.track, tokens, tx, future)
+
+    def track(self, tokens: List[str], tx, future: Future):
+        """Wait for an approval to be mined and update the cache"""
+        try:
+            success = self.wait_for_receipt(tx)
+        except Exception as e:
+            print(f"Exception while waiting for the approval of {tokens}: {e}")
+            success = False
+
+        self.release(tokens, future, success)
+        future.set_result(success)
+
+    def release(self, tokens: List[str], future: Future, success: bool):
+        """Stop tracking an approval, caching the allowances it set"""
+        with self.lock:
+            for token in tokens:
+                if self.pending.get(token) is future:
+                    del self.pending[token]
+                if success:
+                    self.allowances[token] = self.approval_amount
+
+    def spent(self, token: str, amount: int):
+        """Account for an order that will consume allowance"""
+        token = Web3.to_checksum_address(token)
+        with self.lock:
+            allowance = self.allowances.get(token)
+            if allowance is not None and allowance != INFINITE_ALLOWANCE:
+                self.allowances[token] = max(0, allowance - amount)
+
+    def invalidate(self, token: Optional[str] = None):
+        """Forget the cached allowance of a token, or of all of them"""
+        with self.lock:
+            if token is None:
+                self.allowances.clear()
+            else:
+                self.allowances.pop(Web3.to_checksum_address(token), None)
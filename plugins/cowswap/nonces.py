@@ -0,0 +1,220 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+from eth_account import Account
+from safe_eth.safe import Safe as GnosisSafe
+from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound, Web3RPCError
+
+from core.clock import clock
+
+# Blocks on top of a receipt before it is considered final
+CONFIRMATIONS = 2
+
+# Seconds to wait for a receipt before checking if the transaction was dropped
+RECEIPT_TIMEOUT = 120
+
+# Seconds after which a transaction that is still not final is given up on
+WAIT_TIMEOUT = 900
+
+# Gas of the no-op self transfer that fills a signer nonce nothing else can use
+FILLER_GAS = 21_000
+
+POLL_INTERVAL = 1
+
+
+class SafeNonceManager:
+    """Hands out Safe and signer nonces locally so that several Safe
+    transactions can be signed and sent back to back.
+
+    Nonces are read from the chain (Safe contract and signer account) only
+    when the manager starts or after a transaction is dropped or reverts,
+    since the Safe nonces handed out after it can no longer execute.
+    A dropped transaction leaves a gap that blocks every later signer nonce,
+    so waiters re-send the missing transaction, or replace it with a no-op
+    when it is not known anymore.
+    """
+
+    def __init__(self, safe: GnosisSafe, w3: Web3, private_key: str):
+        """Init"""
+        self.safe = safe
+        self.w3 = w3
+        self.account = Account.from_key(private_key)
+        self.sender = self.account.address
+        self.lock = threading.Lock()
+        self.next_safe_nonce: Optional[int] = None
+        self.next_tx_nonce: Optional[int] = None
+        # Sent, not yet final, transactions by Safe nonce:
+        # (signer nonce, tx hash, signed raw transaction)
+        self.in_flight: Dict[int, Tuple[int, bytes, bytes]] = {}
+
+    def sync(self):
+        """Read the nonces from the chain. Call with the lock held"""
+        self.next_safe_nonce = self.safe.retrieve_nonce()
+        self.next_tx_nonce = self.w3.eth.get_transaction_count(self.sender, "pending")
+        self.in_flight = {
+            nonce: sent
+            for nonce, sent in self.in_flight.items()
+            if nonce >= self.next_safe_nonce
+        }
+        # Transactions still in the mempool keep their nonces, as long as none
+        # before them is missing: after a gap they can only revert
+        while self.next_safe_nonce in self.in_flight:
+            self.next_safe_nonce += 1
+
+    def reserve(self) -> Tuple[int, int]:
+        """Get the next (Safe nonce, signer nonce) pair"""
+        with self.lock:
+            if self.next_safe_nonce is None:
+                self.sync()
+            nonces = (self.next_safe_nonce, self.next_tx_nonce)
+            self.next_safe_nonce += 1
+            self.next_tx_nonce += 1
+            return nonces
+
+    def sent(self, safe_nonce: int, tx_hash: bytes, tx: Dict):
+        """Register a sent transaction. It is signed again, which gives the same
+        raw transaction, so it can be re-sent if it gets dropped"""
+        raw = self.account.sign_transaction(tx).raw_transaction
+        with self.lock:
+            self.in_flight[safe_nonce] = (tx["nonce"], tx_hash, raw)
+
+    def reset(self):
+        """Forget the local nonces, they will be read again on the next reserve"""
+        with self.lock:
+            self.next_safe_nonce = None
+            self.next_tx_nonce = None
+
+    def wait(self, safe_nonce: int, tx_hash: bytes) -> bool:
+        """Wait until a transaction is final, at most WAIT_TIMEOUT seconds.
+        Returns its success.
+
+        Dropped transactions are re-sent once. Transactions that cannot be
+        re-sent, reorged out or timed out reset the nonces so the next
+        transaction reuses the right ones.
+        """
+        deadline = clock.monotonic() + WAIT_TIMEOUT
+        resent = False
+        while True:
+            remaining = deadline - clock.monotonic()
+            if remaining <= 0:
+                print(f"Transaction {tx_hash.hex()} not final after {WAIT_TIMEOUT}s")
+                self.done(safe_nonce, tx_hash, drop=True)
+                return False
+
+            try:
+                receipt = self.w3.eth.wait_for_transaction_receipt(
+                    tx_hash,
+                    timeout=min(RECEIPT_TIMEOUT, remaining),
+                    poll_latency=POLL_INTERVAL,
+                )
+            except TimeExhausted:
+                try:
+                    tx = self.w3.eth.get_transaction(tx_hash)
+                except TransactionNotFound:
+                    if not resent and self.resend(safe_nonce):
+                        resent = True
+                        continue
+                    print(f"Transaction {tx_hash.hex()} was dropped")
+                    self.done(safe_nonce, tx_hash, drop=True)
+                    return False
+                # Still in the mempool, maybe behind a dropped earlier nonce
+                self.fill_gap(tx["nonce"])
+                continue
+
+            # Wait for confirmations and make sure it was not reorged out
+            while self.w3.eth.block_number < receipt.blockNumber + CONFIRMATIONS:
+                clock.sleep(POLL_INTERVAL)
+            try:
+                final = self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                final = None
+            if final is None or final.blockHash != receipt.blockHash:
+                print(f"Transaction {tx_hash.hex()} was reorged, waiting again")
+                continue
+
+            # A reverted execTransaction does not use its Safe nonce up, so the
+            # nonces handed out after it are read again
+            success = receipt.status == 1
+            if not success:
+                print(f"Transaction {tx_hash.hex()} reverted")
+            self.done(safe_nonce, tx_hash, drop=not success)
+            return success
+
+    def resend(self, safe_nonce: int) -> bool:
+        """Send an in-flight transaction again. Returns whether it was accepted"""
+        with self.lock:
+            sent = self.in_flight.get(safe_nonce)
+        if sent is None:
+            return False
+        _, tx_hash, raw = sent
+        try:
+            self.w3.eth.send_raw_transaction(raw)
+        except (ValueError, Web3RPCError) as e:
+            # Typically "nonce too low": something else took its nonce
+            print(f"Couldnt re-send transaction {tx_hash.hex()}: {e}")
+            return False
+        print(f"Transaction {tx_hash.hex()} was dropped, re-sent it")
+        return True
+
+    def fill_gap(self, tx_nonce: int):
+        """Unblock a pending transaction whose earlier signer nonces are neither
+        mined nor in the mempool. Known transactions are re-sent, unknown
+        nonces get a no-op self transfer"""
+        mined = self.w3.eth.get_transaction_count(self.sender, "latest")
+        if mined >= tx_nonce:
+            return
+
+        with self.lock:
+            by_tx_nonce = {
+                nonce: (safe_nonce, tx_hash)
+                for safe_nonce, (nonce, tx_hash, _) in self.in_flight.items()
+            }
+        for nonce in range(mined, tx_nonce):
+            if nonce in by_tx_nonce:
+                safe_nonce, tx_hash = by_tx_nonce[nonce]
+                try:
+                    self.w3.eth.get_transaction(tx_hash)
+                    continue
+                except TransactionNotFound:
+                    pass
+                if self.resend(safe_nonce):
+                    continue
+            # The Safe nonce of the missing transaction is never executed now
+            if self.send_filler(nonce):
+                self.reset()
+
+    def send_filler(self, tx_nonce: int) -> bool:
+        """Use a signer nonce with a no-op transfer to the signer itself.
+        Returns whether it was sent"""
+        filler = self.account.sign_transaction(
+            {
+                "to": self.sender,
+                "value": 0,
+                "gas": FILLER_GAS,
+                "gasPrice": self.w3.eth.gas_price,
+                "nonce": tx_nonce,
+                "chainId": self.w3.eth.chain_id,
+            }
+        )
+        try:
+            self.w3.eth.send_raw_transaction(filler.raw_transaction)
+        except (ValueError, Web3RPCError) as e:
+            # Already mined or pending, the gap is closing on its own
+            print(f"Couldnt fill signer nonce {tx_nonce}: {e}")
+            return False
+        print(f"Filled the gap at signer nonce {tx_nonce} with a no-op transfer")
+        return True
+
+    def done(self, safe_nonce: int, tx_hash: bytes, drop: bool):
+        """Stop tracking a transaction. A transaction that did not execute also
+        dooms the later Safe nonces, which are forgotten and read again"""
+        with self.lock:
+            sent = self.in_flight.get(safe_nonce)
+            if sent is not None and sent[1] == tx_hash:
+                del self.in_flight[safe_nonce]
+            if drop:
+                for nonce in [n for n in self.in_flight if n > safe_nonce]:
+                    del self.in_flight[nonce]
+                self.next_safe_nonce = None
+                self.next_tx_nonce = None
@@ -0,0 +1,175 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from peewee import CharField, FloatField, IntegerField, TextField
+
+from core.db import BaseModel, init_db, scoped_model
+from core.http import HttpClient
+
+# Seconds between polls while there are open orders
+POLL_INTERVAL = 10
+
+# Seconds between polls when there is nothing to track, or after errors
+IDLE_INTERVAL = 60
+MAX_BACKOFF = 300
+
+# Orders returned by the tool
+RECENT_ORDERS = 20
+
+FINAL_STATUSES = {"fulfilled", "cancelled", "expired"}
+
+
+class CowOrder(BaseModel):
+    """An order submitted to CoW and its execution"""
+
+    uid = CharField(primary_key=True)
+    sell_token = CharField()
+    buy_token = CharField()
+    sell_amount = TextField()
+    buy_amount = TextField()
+    valid_to = IntegerField()
+    status = CharField(default="open")
+    executed_sell_amount = TextField(default="0")
+    executed_buy_amount = TextField(default="0")
+    created_at = FloatField()
+    updated_at = FloatField()
+
+
+def order_to_json(order: CowOrder) -> Dict:
+    """Order to json, with its fill price and surplus"""
+    sell_amount = int(order.sell_amount)
+    buy_amount = int(order.buy_amount)
+    executed_sell = int(order.executed_sell_amount)
+    executed_buy = int(order.executed_buy_amount)
+
+    data = {
+        "uid": order.uid,
+        "sell_token": order.sell_token,
+        "buy_token": order.buy_token,
+        "status": order.status,
+        "sell_amount": str(sell_amount),
+        "executed_sell_amount": str(executed_sell),
+        "executed_buy_amount": str(executed_buy),
+        "filled": executed_sell / sell_amount if sell_amount else 0,
+    }
+    if executed_sell and executed_buy:
+        # Raw units. Buy tokens received per sell token sold
+        data["fill_price"] = executed_buy / executed_sell
+        # Buy tokens received over the limit price for the executed part
+        data["surplus"] = str(executed_buy - buy_amount * executed_sell // sell_amount)
+    return data
+
+
+class OrderTracker:
+    """Follows the submitted CoW orders in the background until they are
+    filled, cancelled or expired. Orders of a scope, like a fund, have their
+    own table"""
+
+    def __init__(
+        self,
+        http: HttpClient,
+        api_url: str,
+        owner: str,
+        scope: Optional[str] = None,
+    ):
+        """Init"""
+        self.http = http
+        self.api_url = api_url
+        self.owner = owner
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.model = scoped_model(CowOrder, scope)
+        init_db(self.model)
+
+    def start(self):
+        """Start polling in the background"""
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, name="cow-orders", daemon=True
+            )
+            self.thread.start()
+
+    def add(self, uid: str, order: Dict):
+        """Start tracking an order"""
+        now = time.time()
+        self.model.insert(
+            uid=uid,
+            sell_token=order["sellToken"],
+            buy_token=order["buyToken"],
+            sell_amount=str(order["sellAmount"]),
+            buy_amount=str(order["buyAmount"]),
+            valid_to=order["validTo"],
+            created_at=now,
+            updated_at=now,
+        ).on_conflict_ignore().execute()
+        self.wakeup.set()
+
+    def get_open_orders(self) -> List[CowOrder]:
+        """Orders that are not final yet"""
+        return list(self.model.select().where(self.model.status.not_in(FINAL_STATUSES)))
+
+    def poll(self) -> int:
+        """Update all the open orders with a single request. Returns how many
+        orders are still open"""
+        open_orders = {order.uid: order for order in self.get_open_orders()}
+        if not open_orders:
+            return 0
+
+        # The account endpoint returns the most recent orders first, so asking
+        # for as many orders as the oldest open one covers all of them
+        oldest = min(order.created_at for order in open_orders.values())
+        limit = self.model.select().where(self.model.created_at >= oldest).count()
+        response = self.http.get(
+            f"{self.api_url}/api/v1/account/{self.owner}/orders",
+            params={"offset": 0, "limit": min(1000, max(limit, 10))},
+        )
+        response.raise_for_status()
+
+        now = time.time()
+        for data in response.json():
+            order = open_orders.pop(data["uid"], None)
+            if order is None:
+                continue
+            order.status = data["status"]
+            order.executed_sell_amount = data.get("executedSellAmount", "0")
+            order.executed_buy_amount = data.get("executedBuyAmount", "0")
+            order.updated_at = now
+            order.save()
+            if order.status in FINAL_STATUSES:
+                print(f"Order {order.uid} {order.status}")
+
+        # Orders the API did not return are expired once past their validity
+        for order in open_orders.values():
+            if order.valid_to < now:
+                order.status = "expired"
+                order.updated_at = now
+                order.save()
+
+        return len(self.get_open_orders())
+
+    def run(self):
+        """Poll while there are open orders, backing off on errors"""
+        backoff = POLL_INTERVAL
+        while True:
+            try:
+                open_count = self.poll()
+                backoff = POLL_INTERVAL
+                interval = POLL_INTERVAL if open_count else IDLE_INTERVAL
+            except Exception as e:
+                print(f"Exception while polling CoW orders: {e}")
+                backoff = min(MAX_BACKOFF, backoff * 2)
+                interval = backoff
+
+            # New orders wake the tracker up early
+            self.wakeup.wait(interval)
+            self.wakeup.clear()
+
+    def get_recent_orders(self, limit: int = RECENT_ORDERS) -> List[Dict]:
+        """Get the status of the most recent orders"""
+        return [
+            order_to_json(order)
+            for order in self.model.select()
+            .order_by(self.model.created_at.desc())
+            .limit(limit)
+        ]
@@ -0,0 +1,167 @@
+from typing import Dict, List
+
+# Trades worth less than this many USD are not worth their fee and are skipped
+MIN_ORDER_USD = 1.0
+
+# A sell that would leave less than this many USD of a token sells all of it,
+# and differences from the target below it are not reported
+DUST_USD = 0.5
+
+# Weights may add up to a bit more than 1 because of rounding
+WEIGHT_TOLERANCE = 0.01
+
+
+def plan_rebalance(
+    balances: Dict[str, Dict],
+    prices: Dict[str, float],
+    targets: Dict[str, float],
+    quote_token: str,
+    min_order_usd: float = MIN_ORDER_USD,
+    dust_usd: float = DUST_USD,
+) -> Dict:
+    """Compute the fewest orders that move the holdings to target weights.
+
+    balances maps token addresses, the quote token included, to their
+    balance_wei and decimals, and prices maps them to USD. targets maps
+    tokens to their share of the total value. The rest is kept in the quote
+    token and held tokens without a target are sold.
+
+    Sells are netted against buys and traded token to token, largest first,
+    so that only the remainders go through the quote token. Buys with the
+    quote token are limited to its current balance, since sells to it only
+    pay out once they fill, and the rest is deferred.
+    """
+    if any(weight < 0 for weight in targets.values()):
+        raise ValueError("Weights can not be negative")
+    total_weight = sum(targets.values())
+    if total_weight > 1 + WEIGHT_TOLERANCE:
+        raise ValueError(f"Weights add up to {total_weight:.2f}, more than 1")
+    scale = max(1.0, total_weight)
+    targets = {token: weight / scale for token, weight in targets.items()}
+
+    # USD value of the priced holdings
+    values, skipped = {}, []
+    for token, balance in balances.items():
+        if not balance.get("balance_wei") or balance.get("decimals") is None:
+            continue
+        price = 1.0 if token == quote_token else prices.get(token)
+        if price is None:
+            skipped.append({"token": token, "reason": "No price"})
+            continue
+        values[token] = balance["balance_wei"] / 10 ** balance["decimals"] * price
+    for token in targets:
+        if token != quote_token and token not in prices:
+            skipped.append({"token": token, "reason": "No price"})
+    total = sum(values.values())
+
+    # USD to sell or buy of every token
+    sells, buys = {}, {}
+    for token in sorted(set(values) | set(targets) & set(prices)):
+        if token == quote_token:
+            continue
+        delta = targets.get(token, 0.0) * total - values.get(token, 0.0)
+        if abs(delta) >= min_order_usd:
+            (buys if delta > 0 else sells)[token] = abs(delta)
+        elif abs(delta) >= dust_usd:
+            skipped.append({"token": token, "reason": "Below min order"})
+
+    # Sells that would leave dust take the whole balance
+    sell_all = {token for token, usd in sells.items() if values[token] - usd < dust_usd}
+    sold_wei = {token: 0 for token in sells}
+    legs = []
+
+    def add_leg(side: str, sell_token: str, buy_token: str, usd: float, last: bool):
+        """Append a leg, the last one of a sell_all token taking the rest"""
+        balance = balances[sell_token]
+        if sell_token in sell_all and last:
+            sell_amount = balance["balance_wei"] - sold_wei[sell_token]
+        else:
+            price = 1.0 if sell_token == quote_token else prices[sell_token]
+            sell_amount = min(
+                int(usd / price * 10 ** balance["decimals"]),
+                balance["balance_wei"] - sold_wei.get(sell_token, 0),
+            )
+        if sell_token in sold_wei:
+            sold_wei[sell_token] += sell_amount
+        legs.append(
+            {
+                "token": buy_token if side == "buy" else sell_token,
+                "side": side,
+                "sell_token": sell_token,
+                "buy_token": buy_token,
+                "sell_amount": sell_amount,
+                "usd": round(usd, 2),
+            }
+        )
+
+    # Net sells against buys, token to token. Remainders below the min order
+    # are dropped, as they are within the tolerance
+    while sells and buys:
+        sell_token = max(sells, key=sells.get)
+        buy_token = max(buys, key=buys.get)
+        usd = min(sells[sell_token], buys[buy_token])
+        sells[sell_token] -= usd
+        buys[buy_token] -= usd
+        last = sells[sell_token] < min_order_usd
+        if last:
+            del sells[sell_token]
+        if buys[buy_token] < min_order_usd:
+            del buys[buy_token]
+        add_leg("swap", sell_token, buy_token, usd, last)
+
+    # Sell the rest to the quote token
+    for token, usd in sells.items():
+        add_leg("sell", token, quote_token, usd, True)
+
+    # Buy the rest with the quote token held now, largest first
+    cash = values.get(quote_token, 0.0)
+    deferred = 0.0
+    for token, usd in sorted(buys.items(), key=lambda item: -item[1]):
+        spend = min(usd, cash)
+        if spend < min_order_usd:
+            spend = 0.0
+        else:
+            add_leg("buy", quote_token, token, spend, False)
+            cash -= spend
+        deferred += usd - spend
+
+    return {
+        "total_usd": round(total, 2),
+        "current_weights": {
+            token: round(value / total, 4)
+            for token, value in values.items()
+            if total > 0
+        },
+        "target_weights": {token: round(w, 4) for token, w in targets.items()},
+        "legs": legs,
+        "cash_left_usd": round(cash, 2),
+        "deferred_usd": round(deferred, 2),
+        "skipped": skipped,
+    }
+
+
+def reroute_leg(leg: Dict, quote_token: str, buy_amount: int) -> List[Dict]:
+    """Split a token to token leg that could not be quoted into a sell to the
+    quote token and, with a non zero buy_amount of it, a buy"""
+    legs = [
+        {
+            "token": leg["sell_token"],
+            "side": "sell",
+            "sell_token": leg["sell_token"],
+            "buy_token": quote_token,
+            "sell_amount": leg["sell_amount"],
+            "usd": leg["usd"],
+        }
+    ]
+    if buy_amount:
+        legs.append(
+            {
+                "token": leg["buy_token"],
+                "side": "buy",
+                "sell_token": quote_token,
+                "buy_token": leg["buy_token"],
+                "sell_amount": buy_amount,
+                "usd": leg["usd"],
+            }
+        )
+    return legs
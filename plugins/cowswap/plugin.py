@@ -1,6 +1,9 @@
 import json
+import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import requests
 from ape import accounts
@@ -9,47 +12,83 @@ from eth_account.messages import _hash_eip191_message
 from eth_utils import decode_hex, encode_hex
 from safe_eth.eth import EthereumClient
 from safe_eth.safe import Safe as GnosisSafe
+from safe_eth.safe.multi_send import MultiSend, MultiSendOperation, MultiSendTx
 from web3 import Web3
 
+from core.cassette import wrap_session
+from core.funds import BASE_CHAIN_ID, DEFAULT_FUND, Fund
+from core.metrics import metrics
+from core.multicall import Multicall
 from core.plugin import Plugin
+from core.tools import rate_limit
+from plugins.coingecko.snapshot import SNAPSHOT_FILE, MarketSnapshot
+from plugins.cowswap.allowances import AllowanceManager
 from plugins.cowswap.constants import SAFE_ABI
-
-BASE_COW_API = "https://api.cow.fi/base"
+from plugins.cowswap.nonces import SafeNonceManager
+from plugins.cowswap.orders import OrderTracker
+from plugins.cowswap.planner import plan_rebalance, reroute_leg
+from plugins.cowswap.portfolio import PortfolioLedger
+from plugins.cowswap.signing import OrderSigner
+from plugins.cowswap.tokens import get_token_index
+
+# Can point to a local stub of the CoW API
+BASE_COW_API = os.environ.get("COWSWAP_API_URL", "https://api.cow.fi/base")
 SAFE_TRANSACTION_SERVICE_URL = "https://safe-transaction-base.safe.global"
 COWSWAP_CONTRACT_ADDRESS = "0x9008D19f58AAbD9eD0D60971565AA8510560ab41"
 BASE_GPV2_VAULT_RELAYER = "0xC92E8bdf79f0507f65a392b0ab4667716BFE0110"
 BASE_GPV2_SETTLEMENT = "0x9008D19f58AAbD9eD0D60971565AA8510560ab41"
 MAX_APPROVAL = 2**256 - 1
-BASE_CHAIN_ID = 8453
 SAFE_ADDRESS = "0x44CBf6E9b4473EFC47BBE8198d19929E3Bc5552c"
 USDC_ADDRESS_BASE = "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
+USDC_DECIMALS = 6
+MULTISEND_CALL_ONLY_ADDRESS = "0x40A2aCCbd92BCA938b02010E17A5b8929b49130D"
+DELEGATE_CALL_OPERATION = 1
+
+# Gas of the inner Safe transaction and of the transaction that executes it
+SAFE_TX_GAS = 1000000
+TX_GAS = 1200000
+
+# Quotes and orders in flight at the same time during a rebalance
+MAX_CONCURRENT_ORDERS = 8
+
+
+def make_message_types(
+    chain_id: int, settlement_address: str, safe_address: str
+) -> Tuple[type, type]:
+    """EIP-712 order and Safe message types, with the domains of a fund"""
+
+    class Order(EIP712Message):
+        _name_ = "Gnosis Protocol"
+        _version_ = "v2"
+        _chainId_ = chain_id
+        _verifyingContract_ = settlement_address
 
+        sellToken: "address"
+        buyToken: "address"
+        receiver: "address"
+        sellAmount: "uint256"
+        buyAmount: "uint256"
+        validTo: "uint32"
+        appData: "bytes32"
+        feeAmount: "uint256"
+        kind: "string"
+        partiallyFillable: "bool"
+        sellTokenBalance: "string"
+        buyTokenBalance: "string"
 
-class SafeMessage(EIP712Message):
-    _chainId_ = BASE_CHAIN_ID
-    _verifyingContract_ = SAFE_ADDRESS
+    class SafeMessage(EIP712Message):
+        _chainId_ = chain_id
+        _verifyingContract_ = safe_address
 
-    message: "bytes"
+        message: "bytes"
 
+    return Order, SafeMessage
 
-class Order(EIP712Message):
-    _name_ = "Gnosis Protocol"
-    _version_ = "v2"
-    _chainId_ = BASE_CHAIN_ID
-    _verifyingContract_ = BASE_GPV2_SETTLEMENT
 
-    sellToken: "address"
-    buyToken: "address"
-    receiver: "address"
-    sellAmount: "uint256"
-    buyAmount: "uint256"
-    validTo: "uint32"
-    appData: "bytes32"
-    feeAmount: "uint256"
-    kind: "string"
-    partiallyFillable: "bool"
-    sellTokenBalance: "string"
-    buyTokenBalance: "string"
+# The types of the default fund
+Order, SafeMessage = make_message_types(
+    BASE_CHAIN_ID, BASE_GPV2_SETTLEMENT, SAFE_ADDRESS
+)
 
 
 class CowSwap(Plugin):
@@ -57,47 +96,198 @@ class CowSwap(Plugin):
 
     NAME = "CowSwap"
     ENV_VARS = ["BASE_RPC", "SIGNER_PRIVATE_KEY", "SAFE_ADDRESS", "APE_ACCOUNTS_NAME"]
+    PER_FUND = True
 
-    def __init__(self):
-        """Init"""
-        super().__init__()
+    def __init__(self, fund: Optional[Fund] = None):
+        """Init. The settings of the fund override the Base defaults, and its
+        COWSWAP_<FUND>_ environment variables the COWSWAP_ ones"""
+        super().__init__(fund or Fund(DEFAULT_FUND))
 
-        self.ledger = Web3(Web3.HTTPProvider(self.base_rpc))
-        self.safe = GnosisSafe(self.safe_address, EthereumClient(self.base_rpc))
+        self.chain_id = self.fund.get("chain_id", BASE_CHAIN_ID)
+        self.safe_address = Web3.to_checksum_address(
+            self.fund.get("safe_address", self.safe_address)
+        )
+        self.quote_token = Web3.to_checksum_address(
+            self.fund.get("quote_token", USDC_ADDRESS_BASE)
+        )
+        self.quote_decimals = self.fund.get("quote_decimals", USDC_DECIMALS)
+        self.quote_symbol = self.fund.get("quote_symbol", "USDC")
+        self.cow_api = self.fund.get("cow_api_url", BASE_COW_API)
+        self.settlement = self.fund.get("settlement_address", BASE_GPV2_SETTLEMENT)
+        self.vault_relayer = self.fund.get(
+            "vault_relayer_address", BASE_GPV2_VAULT_RELAYER
+        )
+        self.order_type, self.safe_message_type = make_message_types(
+            self.chain_id, self.settlement, self.safe_address
+        )
+
+        self.ledger = Web3(
+            Web3.HTTPProvider(self.base_rpc, session=wrap_session(requests.Session()))
+        )
+        ethereum_client = EthereumClient(self.base_rpc)
+        wrap_session(ethereum_client.http_session)
+        self.safe = GnosisSafe(self.safe_address, ethereum_client)
+        self.multisend = MultiSend(
+            ethereum_client, address=MULTISEND_CALL_ONLY_ADDRESS, call_only=True
+        )
+        self.nonces = SafeNonceManager(self.safe, self.ledger, self.signer_private_key)
 
         self.signer = accounts.load(self.ape_accounts_name)
         self.signer.set_autosign(True)
 
+        # Orders are signed in bulk with the signer key when it is the key of
+        # the ape account, and one by one through ape otherwise
+        order_signer = OrderSigner(
+            self.signer_private_key,
+            self.chain_id,
+            self.settlement,
+            self.safe_address,
+        )
+        self.order_signer = (
+            order_signer if order_signer.address == self.signer.address else None
+        )
+
         with open(
             Path(__file__).parent / "abis" / "erc20.json", "r", encoding="utf-8"
         ) as abi_file:
             self.erc20_abi = json.load(abi_file)
 
+        self.tokens = get_token_index(
+            self.http, ranks_path=self.storage_path / SNAPSHOT_FILE
+        )
+        self.multicall = Multicall(self.ledger)
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_ORDERS, thread_name_prefix="cowswap"
+        )
+        self.allowances = AllowanceManager(
+            self.multicall,
+            self.safe_address,
+            self.vault_relayer,
+            self.send_approvals,
+            self.wait_for_safe_tx,
+        )
+        self.orders = OrderTracker(
+            self.http, self.cow_api, self.safe_address, scope=self.fund.scope
+        )
+        self.orders.start()
+        self.portfolio = PortfolioLedger(
+            self.ledger,
+            self.multicall,
+            self.safe_address,
+            self.quote_token,
+            scope=self.fund.scope,
+        )
+
+    @rate_limit("rpc")
     def get_latest_block(self):
         """Get the current block"""
         return self.ledger.eth.get_block("latest")
 
     def get_erc20_balance(self, erc20_contract_address: str):
         """Get the ERC20 balance of a wallet address"""
-        contract = self.ledger.eth.contract(
-            address=erc20_contract_address, abi=self.erc20_abi
-        )
-        balance = contract.functions.balanceOf(self.safe_address).call()
-        decimals = contract.functions.decimals().call()
-        return balance / (10**decimals)
+        return self.get_balances([erc20_contract_address])[
+            Web3.to_checksum_address(erc20_contract_address)
+        ]["balance"]
+
+    def get_balances(self, erc20_contract_addresses: List[str]) -> Dict:
+        """Get the Safe balances of many tokens in a single call"""
+        return self.multicall.get_balances(
+            self.safe_address, erc20_contract_addresses, include_native=False
+        )["tokens"]
+
+    def cowswap_get_portfolio_tool(self, token_names: Optional[List[str]] = None):
+        """Get the Safe balances of USDC, ETH and the given tokens.
+        Without token names, all the tracked memecoins are checked"""
+
+        if token_names:
+            tokens = [self.tokens.resolve(name) for name in token_names]
+            tokens = [t for t in tokens if t is not None]
+        else:
+            tokens = self.tokens.get_universe()
+
+        addresses = [self.quote_token] + [t["address"] for t in tokens]
+        symbols = [self.quote_symbol] + [t["symbol"].upper() for t in tokens]
+
+        portfolio = self.multicall.get_balances(self.safe_address, addresses)
+        holdings = {}
+        for symbol, address in zip(symbols, addresses):
+            balance = portfolio["tokens"][Web3.to_checksum_address(address)]
+            if balance["balance"]:
+                holdings[symbol] = balance["balance"]
+
+        return {
+            "block": portfolio["block"],
+            "ETH": portfolio["native"],
+            "holdings": holdings,
+        }
+
+    def get_prices(self) -> Dict[str, float]:
+        """USD prices of the tokens of the last market snapshot, by address"""
+        snapshot = MarketSnapshot.load(self.storage_path / SNAPSHOT_FILE)
+        if snapshot is None:
+            return {}
+
+        prices = {}
+        for coin_id, price in zip(snapshot.ids, snapshot.numeric["current_price"]):
+            token = self.tokens.lookup(coin_id)
+            if token and price == price:
+                prices[token["address"]] = float(price)
+        return prices
+
+    def cowswap_get_holdings_tool(self):
+        """Get the Safe holdings with their USD value, cost basis and realized
+        and unrealized PnL, from the local portfolio ledger"""
+
+        prices = self.get_prices()
+        if self.portfolio.get_checkpoint() is None:
+            self.portfolio.seed(list(prices), prices)
+        else:
+            self.portfolio.sync()
+        self.portfolio.mark(prices)
+
+        portfolio = self.portfolio.get_holdings()
+        holdings = {}
+        for address, holding in portfolio["holdings"].items():
+            if address == self.quote_token:
+                holdings[self.quote_symbol] = holding
+            elif token := self.tokens.lookup(address):
+                holdings[token["symbol"].upper()] = holding
+            else:
+                holdings[address] = holding
+        portfolio["holdings"] = holdings
+        return portfolio
+
+    def cowswap_get_orders_status_tool(self):
+        """Get the status of the recent orders: open, fulfilled, cancelled or
+        expired, with executed amounts, fill price and surplus"""
+
+        orders = self.orders.get_recent_orders()
+        for order in orders:
+            for key in ("sell_token", "buy_token"):
+                if order[key].lower() == self.quote_token.lower():
+                    order[key] = self.quote_symbol
+                elif token := self.tokens.lookup(order[key]):
+                    order[key] = token["symbol"].upper()
+        return orders
 
     def cowswap_sell_tokens_tool(
         self,
         sell_token_name: str,
-    ):
-        """A tool to sell tokens on Cowswap"""
+    ) -> Dict:
+        """A tool to sell the whole balance of a token on Cowswap. Returns the
+        order UID, or the error"""
 
         sell_token_address = self.get_memecoin_address(sell_token_name)
-        buy_token_address = USDC_ADDRESS_BASE
-        sell_amount_eth = self.get_erc20_balance(sell_token_address)
-        sell_amount_wei = Web3.to_wei(sell_amount_eth, "ether")
+        if sell_token_address is None:
+            return {"success": False, "error": f"Unknown token {sell_token_name}"}
+        buy_token_address = self.quote_token
+        sell_amount_wei = self.get_balances([sell_token_address])[sell_token_address][
+            "balance_wei"
+        ]
+        if not sell_amount_wei:
+            return {"success": False, "error": f"No {sell_token_name} balance"}
 
-        self.swap(
+        return self.swap(
             sell_token_address,
             buy_token_address,
             sell_amount_wei,
@@ -106,30 +296,227 @@ class CowSwap(Plugin):
     def cowswap_buy_tokens_tool(
         self,
         buy_token_name: str,
-    ):
-        """A tool to buy tokens on Cowswap"""
+    ) -> Dict:
+        """A tool to buy tokens on Cowswap. Returns the order UID, or the error"""
 
         buy_token_address = self.get_memecoin_address(buy_token_name)
-        sell_token_address = USDC_ADDRESS_BASE
-        self.approve_allowance(sell_token_address)
-        sell_amount_wei = 1000000  # 1$ (USDC has 6 decimals)
+        if buy_token_address is None:
+            return {"success": False, "error": f"Unknown token {buy_token_name}"}
+        sell_token_address = self.quote_token
+        sell_amount_wei = 10**self.quote_decimals  # 1$
 
-        self.swap(
+        return self.swap(
             sell_token_address,
             buy_token_address,
             sell_amount_wei,
         )
 
-    def swap(
-        self, sell_token_address: str, buy_token_address: str, sell_amount_wei: int
+    def cowswap_rebalance_tool(
+        self,
+        sell_token_names: Optional[List[str]] = None,
+        buy_token_names: Optional[List[str]] = None,
+        buy_amount_usdc: float = 1.0,
+    ):
+        """A tool to rebalance the portfolio in one go: sells the whole balance
+        of every sell token for USDC and buys every buy token with
+        buy_amount_usdc USDC each. All the orders are quoted and submitted
+        concurrently"""
+
+        legs = []
+
+        sell_tokens = [self.get_memecoin_address(n) for n in sell_token_names or []]
+        if sell_tokens:
+            balances = self.get_balances([t for t in sell_tokens if t])
+        for name, address in zip(sell_token_names or [], sell_tokens):
+            balance = balances.get(address, {}).get("balance_wei") if address else None
+            if not balance:
+                legs.append({"token": name, "error": "No balance or unknown token"})
+                continue
+            legs.append(
+                {
+                    "token": name,
+                    "side": "sell",
+                    "sell_token": address,
+                    "buy_token": self.quote_token,
+                    "sell_amount": balance,
+                }
+            )
+
+        buy_legs = []
+        for name in buy_token_names or []:
+            address = self.get_memecoin_address(name)
+            if not address:
+                legs.append({"token": name, "error": "Unknown token"})
+                continue
+            buy_legs.append(
+                {
+                    "token": name,
+                    "side": "buy",
+                    "sell_token": self.quote_token,
+                    "buy_token": address,
+                    "sell_amount": int(buy_amount_usdc * 10**self.quote_decimals),
+                }
+            )
+        legs.extend(buy_legs)
+
+        return self.execute_legs(legs)
+
+    def cowswap_rebalance_to_weights_tool(
+        self,
+        token_names: List[str],
+        weights: List[float],
+        dry_run: bool = False,
     ):
-        """Swap on Cowswap"""
+        """A tool to rebalance the portfolio to target weights, as fractions
+        of its total USD value, one per token name. What is left over stays in
+        USDC and held memecoins that are not listed are sold. Sells are traded
+        directly for the buys when possible, trades under 1 USD are skipped and
+        buys are limited to the USDC held now. With dry_run, only returns the
+        planned trades"""
+
+        if len(token_names) != len(weights):
+            return {"error": "One weight is needed per token name"}
+
+        targets, unknown = {}, []
+        for name, weight in zip(token_names, weights):
+            token = self.tokens.resolve(name)
+            if token is None:
+                unknown.append(name)
+                continue
+            targets[token["address"]] = targets.get(token["address"], 0) + weight
+
+        universe = [t["address"] for t in self.tokens.get_universe()]
+        addresses = list(dict.fromkeys([self.quote_token] + universe + list(targets)))
+        try:
+            plan = plan_rebalance(
+                self.get_balances(addresses),
+                self.get_prices(),
+                targets,
+                self.quote_token,
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+        plan["skipped"] += [{"token": name, "reason": "Unknown"} for name in unknown]
+
+        if dry_run:
+            return plan
+
+        result = self.execute_legs(plan["legs"])
+
+        # Direct swaps CoW could not quote go through USDC, with what is left
+        rerouted = []
+        cash = plan["cash_left_usd"]
+        for leg in plan["legs"]:
+            if leg["side"] == "swap" and leg.get("error", "").startswith("Quote"):
+                buy_usd = leg["usd"] if cash >= leg["usd"] else 0
+                cash -= buy_usd
+                rerouted += reroute_leg(
+                    leg, self.quote_token, int(buy_usd * 10**self.quote_decimals)
+                )
+        if rerouted:
+            retry = self.execute_legs(rerouted)
+            result["legs"] += retry["legs"]
+            result["submitted"] += retry["submitted"]
+            result["pending_approval"] += retry["pending_approval"]
+
+        del plan["legs"]
+        return {**plan, **result}
+
+    def execute_legs(self, legs: List[Dict]) -> Dict:
+        """Quote, sign and submit many orders. Quotes and submissions run
+        concurrently so that all the legs are priced at the same time.
+        Missing approvals are sent first and orders wait only for their own"""
+
+        start = time.perf_counter()
+        pending = [leg for leg in legs if "error" not in leg]
+
+        # Approve what is missing, without waiting for it to be mined
+        required = {}
+        for leg in pending:
+            token = Web3.to_checksum_address(leg["sell_token"])
+            required[token] = required.get(token, 0) + leg["sell_amount"]
+        try:
+            approvals = self.allowances.ensure(required) if required else {}
+        except Exception as e:
+            approvals = {}
+            for leg in pending:
+                leg["error"] = f"Approval failed: {e}"
+            pending = []
+
+        # Quote all the legs at once
+        futures = [
+            self.executor.submit(
+                self.get_quote, leg["sell_token"], leg["buy_token"], leg["sell_amount"]
+            )
+            for leg in pending
+        ]
+        for leg, future in zip(pending, futures):
+            try:
+                leg["order"] = self.build_order(future.result())
+            except Exception as e:
+                leg["error"] = f"Quote failed: {e}"
+        quoted_at = time.perf_counter()
+
+        # Sign them
+        pending = [leg for leg in pending if "error" not in leg]
+        for leg in pending:
+            self.log_order(leg["order"])
+        signatures = self.sign_orders([leg["order"] for leg in pending])
+        for leg, signature in zip(pending, signatures):
+            leg["signature"] = signature
+        signed_at = time.perf_counter()
+
+        # Submit them at once
+        futures = [
+            self.executor.submit(
+                self.submit_leg,
+                leg,
+                approvals.get(Web3.to_checksum_address(leg["sell_token"])),
+            )
+            for leg in pending
+        ]
+        for leg, future in zip(pending, futures):
+            try:
+                leg.update(future.result())
+            except Exception as e:
+                leg["error"] = f"Submission failed: {e}"
+        submitted_at = time.perf_counter()
+
+        results = []
+        for leg in legs:
+            result = {"token": leg["token"], "side": leg.get("side")}
+            if "order" in leg:
+                result["sell_amount"] = str(leg["order"].sellAmount)
+                result["buy_amount"] = str(leg["order"].buyAmount)
+            for key in ("success", "status", "order_uid", "error"):
+                if key in leg:
+                    result[key] = leg[key]
+            results.append(result)
+
+        return {
+            "legs": results,
+            "submitted": sum(1 for leg in legs if leg.get("order_uid")),
+            "pending_approval": sum(
+                1 for leg in legs if leg.get("status") == "pending_approval"
+            ),
+            "timing_seconds": {
+                "quote": round(quoted_at - start, 3),
+                "sign": round(signed_at - quoted_at, 3),
+                "submit": round(submitted_at - signed_at, 3),
+                "total": round(submitted_at - start, 3),
+            },
+        }
+
+    def get_quote(
+        self, sell_token_address: str, buy_token_address: str, sell_amount_wei: int
+    ) -> Dict:
+        """Get a sell quote from the CoW API"""
         payload = {
             "sellToken": sell_token_address,
             "buyToken": buy_token_address,
             "appData": "0x0000000000000000000000000000000000000000000000000000000000000000",
-            "from": SAFE_ADDRESS,
-            "receiver": SAFE_ADDRESS,
+            "from": self.safe_address,
+            "receiver": self.safe_address,
             "validTo": int(time.time()) + 600,
             "sellTokenBalance": "erc20",
             "buyTokenBalance": "erc20",
@@ -141,20 +528,20 @@ class CowSwap(Plugin):
             "onchainOrder": False,
         }
 
-        response = requests.post(
-            f"{BASE_COW_API}/api/v1/quote", json=payload, timeout=60
-        )
+        response = self.http.post(f"{self.cow_api}/api/v1/quote", json=payload)
+        data = response.json()
+        if "quote" not in data:
+            raise ValueError(data.get("description", data))
+        return data["quote"]
 
-        quote = response.json()["quote"]
-        buy_amount = int(int(quote["buyAmount"]) * 0.99)
-
-        # Encode cowswap order data
-        order = Order(
+    def build_order(self, quote: Dict) -> Order:
+        """Encode a cowswap order from a quote, with 1% slippage"""
+        return self.order_type(
             sellToken=quote["sellToken"],
             buyToken=quote["buyToken"],
-            receiver=SAFE_ADDRESS,
+            receiver=self.safe_address,
             sellAmount=int(quote["sellAmount"]),
-            buyAmount=buy_amount,
+            buyAmount=int(int(quote["buyAmount"]) * 0.99),
             validTo=quote["validTo"],
             appData=decode_hex(quote["appData"]),
             feeAmount=0,
@@ -164,29 +551,44 @@ class CowSwap(Plugin):
             buyTokenBalance=quote["buyTokenBalance"],
         )
 
-        if sell_token_address == USDC_ADDRESS_BASE:
+    def log_order(self, order: Order):
+        """Print an order"""
+        if order.sellToken == self.quote_token:
             print(
-                f"Order: {order.sellAmount / 1e6} USDC -> {order.buyAmount / 1e18} {buy_token_address}"
+                f"Order: {order.sellAmount / 10**self.quote_decimals} "
+                f"{self.quote_symbol} -> "
+                f"{order.buyAmount} {order.buyToken}"
             )
         else:
             print(
-                f"Order: {order.sellAmount} {sell_token_address / 1e18} -> {order.buyAmount / 1e6} USDC"
+                f"Order: {order.sellAmount} {order.sellToken} -> "
+                f"{order.buyAmount / 10**self.quote_decimals} {self.quote_symbol}"
             )
 
+    def sign_order(self, order: Order) -> bytes:
+        """Sign an order as the Safe (EIP-1271)"""
         order_digest = _hash_eip191_message(order.signable_message)
-        safe_message = SafeMessage(message=order_digest)
+        safe_message = self.safe_message_type(message=order_digest)
 
         signatures = [
             dev.sign_message(safe_message.signable_message) for dev in [self.signer]
         ]
-        encoded_signature = b"".join(sig.encode_rsv() for sig in signatures)
+        return b"".join(sig.encode_rsv() for sig in signatures)
+
+    def sign_orders(self, orders: List[Order]) -> List[bytes]:
+        """Sign many orders as the Safe, in one pass when possible"""
+        if self.order_signer is None:
+            return [self.sign_order(order) for order in orders]
+        return self.order_signer.sign_orders(orders)
 
+    def submit_order(self, order: Order, signature: bytes) -> Dict:
+        """Submit a signed order to the CoW API"""
         payload = {
             "sellToken": order.sellToken,
             "buyToken": order.buyToken,
             "receiver": order.receiver,
             "sellAmount": str(order.sellAmount),
-            "buyAmount": str(buy_amount),
+            "buyAmount": str(order.buyAmount),
             "validTo": order.validTo,
             "appData": encode_hex(order.appData),
             "feeAmount": str(order.feeAmount),
@@ -195,74 +597,82 @@ class CowSwap(Plugin):
             "sellTokenBalance": order.sellTokenBalance,
             "buyTokenBalance": order.buyTokenBalance,
             "signingScheme": "eip1271",
-            "signature": encode_hex(encoded_signature),
-            "from": SAFE_ADDRESS,
+            "signature": encode_hex(signature),
+            "from": self.safe_address,
         }
-        response = requests.post(
-            f"{BASE_COW_API}/api/v1/orders", json=payload, timeout=60
-        )
+        response = self.http.post(f"{self.cow_api}/api/v1/orders", json=payload)
 
         success = response.status_code == 201
         print(response.text)
-        print(
-            f"Swap success: {success} https://explorer.cow.fi/base/orders/{response.json()}"
-        )
-        return success
-
-    def approve_allowance(self, erc20_contract_address):
-        """Approve allowance"""
-
-        print(f"Approving {BASE_GPV2_VAULT_RELAYER} to spend {erc20_contract_address}")
+        if not success:
+            return {"success": False, "error": response.text}
+
+        order_uid = response.json()
+        print(f"Swap success: https://explorer.cow.fi/base/orders/{order_uid}")
+        self.orders.add(order_uid, payload)
+        return {"success": True, "order_uid": order_uid}
+
+    def submit_leg(self, leg: Dict, approval: Optional[Future]) -> Dict:
+        """Submit the order of a leg. Behind an approval that is still being
+        mined, the order is submitted in the background once it is, and the
+        leg is reported as pending, instead of blocking the tool"""
+        if approval is not None and not approval.done():
+            approval.add_done_callback(
+                lambda done: self.executor.submit(self.submit_approved_leg, leg, done)
+            )
+            return {"success": True, "status": "pending_approval"}
+        return self.submit_approved_leg(leg, approval)
+
+    def submit_approved_leg(self, leg: Dict, approval: Optional[Future]) -> Dict:
+        """Submit the order of a leg whose approval, if any, is mined"""
+        if approval is not None and (approval.exception() or not approval.result()):
+            print(f"Approval of {leg['sell_token']} failed, order not submitted")
+            return {"success": False, "error": "Approval failed"}
+
+        result = self.submit_order(leg["order"], leg["signature"])
+        if result["success"]:
+            self.allowances.spent(leg["sell_token"], leg["order"].sellAmount)
+        elif "InsufficientAllowance" in result["error"]:
+            self.allowances.invalidate(leg["sell_token"])
+        return result
 
-        erc20_contract = self.ledger.eth.contract(
-            address=erc20_contract_address, abi=self.erc20_abi
+    def swap(
+        self, sell_token_address: str, buy_token_address: str, sell_amount_wei: int
+    ) -> Dict:
+        """Swap on Cowswap. Returns the result of the order: its UID and
+        amounts, or the error"""
+        result = self.execute_legs(
+            [
+                {
+                    "token": buy_token_address,
+                    "sell_token": sell_token_address,
+                    "buy_token": buy_token_address,
+                    "sell_amount": sell_amount_wei,
+                }
+            ]
         )
+        leg = result["legs"][0]
+        leg.setdefault("success", False)
+        return leg
 
-        # Get the safe nonce
-        response = requests.get(
-            url=f"{SAFE_TRANSACTION_SERVICE_URL}/api/v1/safes/{SAFE_ADDRESS}",
-            timeout=60,
-        )
-        safe_nonce = response.json()["nonce"]
-
-        # Build the internal transaction
-        estimated_gas = self.ledger.eth.estimate_gas(
-            {
-                "from": self.safe.address,
-                "to": erc20_contract.address,
-                "data": erc20_contract.encode_abi(
-                    "approve", args=[BASE_GPV2_VAULT_RELAYER, MAX_APPROVAL]
-                ),
-            }
-        )
-        gas_price = max(self.ledger.eth.gas_price, self.ledger.to_wei("1", "gwei"))
-
-        estimated_gas = 1000000
-        gas_price = self.ledger.to_wei("10", "gwei")
-
-        approve_tx = erc20_contract.functions.approve(
-            BASE_GPV2_VAULT_RELAYER,
-            MAX_APPROVAL,
-        ).build_transaction(
-            {
-                "chainId": BASE_CHAIN_ID,
-                "gas": estimated_gas,
-                "gasPrice": gas_price,
-                "nonce": safe_nonce,
-            }
-        )
+    def send_safe_tx(self, to: str, data: bytes, operation: int = 0) -> Tuple:
+        """Sign and send a Safe transaction with locally managed nonces, so
+        several of them can be in flight at the same time. Returns a handle
+        to wait for it"""
+
+        safe_nonce, tx_nonce = self.nonces.reserve()
 
         # Build the safe transaction
         safe_tx = self.safe.build_multisig_tx(  # nosec
-            to=erc20_contract.address,
+            to=to,
             value=0,
-            data=approve_tx["data"],
-            operation=0,
-            safe_tx_gas=1000000,
+            data=data,
+            operation=operation,
+            safe_tx_gas=SAFE_TX_GAS,
             base_gas=0,
-            # gas_price=gas_price,
             gas_token="0x0000000000000000000000000000000000000000",
             refund_receiver="0x0000000000000000000000000000000000000000",
+            safe_nonce=safe_nonce,
         )
 
         # Sign
@@ -270,35 +680,76 @@ class CowSwap(Plugin):
         print(safe_tx)
         print(safe_tx.safe_tx_hash.hex())
 
-        # Send
-        tx_hash, _ = safe_tx.execute(self.signer_private_key)
-
-        # Wait
-        tx_receipt = self.ledger.eth.wait_for_transaction_receipt(tx_hash)
-        success = tx_receipt.status == 1
-        print(f"Allowance success: {success}")
+        # Send. The gas is not estimated: it would revert while an earlier
+        # nonce is still pending
+        try:
+            tx_hash, tx = safe_tx.execute(
+                self.signer_private_key, tx_gas=TX_GAS, tx_nonce=tx_nonce
+            )
+        except Exception:
+            self.nonces.reset()
+            raise
+
+        self.nonces.sent(safe_nonce, tx_hash, tx)
+        return safe_nonce, tx_hash
+
+    def wait_for_safe_tx(self, handle: Tuple) -> bool:
+        """Wait for a Safe transaction to be final"""
+        with metrics.timed("safe_tx_wait_seconds"):
+            success = self.nonces.wait(*handle)
+        metrics.inc("safe_txs_total", {"success": str(success).lower()})
+        print(f"Safe transaction {handle[1].hex()} success: {success}")
         return success
 
-    def get_memecoin_address(self, memecoin_name):
-        """Get the address"""
+    def send_approvals(self, erc20_contract_addresses: List[str]) -> Tuple:
+        """Approve the vault relayer for many tokens in one Safe transaction,
+        batched through MultiSend, without waiting"""
 
-        coin_id = memecoin_name.lower()
-        detailed_url = f"https://api.coingecko.com/api/v3/coins/{coin_id}"
+        print(f"Approving {self.vault_relayer} to spend {erc20_contract_addresses}")
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-        }
+        calls = []
+        for address in erc20_contract_addresses:
+            erc20_contract = self.ledger.eth.contract(
+                address=address, abi=self.erc20_abi
+            )
+            calls.append(
+                (
+                    address,
+                    erc20_contract.encode_abi(
+                        "approve", args=[self.vault_relayer, MAX_APPROVAL]
+                    ),
+                )
+            )
 
-        try:
-            # Fetch detailed coin information
-            detailed_response = requests.get(detailed_url, headers=headers, timeout=60)
-            detailed_response.raise_for_status()
-            detailed_data = detailed_response.json()
-
-            # Extract Base network contract address
-            contract_address = detailed_data.get("platforms", {}).get("base", None)
-            print(f"{memecoin_name} adress is {contract_address}")
-            return Web3.to_checksum_address(contract_address)
-        except Exception:
+        if len(calls) == 1:
+            return self.send_safe_tx(*calls[0])
+
+        data = self.multisend.build_tx_data(
+            [
+                MultiSendTx(MultiSendOperation.CALL, address, 0, call_data)
+                for address, call_data in calls
+            ]
+        )
+        return self.send_safe_tx(
+            self.multisend.address, data, operation=DELEGATE_CALL_OPERATION
+        )
+
+    def approve_allowance(
+        self, erc20_contract_address, amount: int = MAX_APPROVAL
+    ) -> bool:
+        """Approve allowance, only if it is missing. Blocks until it is mined"""
+        approval = self.allowances.ensure({erc20_contract_address: amount})[
+            Web3.to_checksum_address(erc20_contract_address)
+        ]
+        return approval.result() if approval else True
+
+    def get_memecoin_address(self, memecoin_name):
+        """Get the address from a CoinGecko id, symbol or name"""
+
+        token = self.tokens.resolve(memecoin_name)
+        if token is None:
             print(f"Couldnt get the address for {memecoin_name}")
             return None
+
+        print(f"{memecoin_name} adress is {token['address']}")
+        return token["address"]
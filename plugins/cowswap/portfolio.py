@@ -0,0 +1,390 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from peewee import CharField, CompositeKey, FloatField, IntegerField, TextField
+from web3 import Web3
+
+from core.db import BaseModel, db, get_state, init_db, scoped_model, set_state
+from core.limiter import get_bucket
+from core.multicall import Multicall
+from plugins.cowswap.nonces import CONFIRMATIONS
+
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+# Blocks per eth_getLogs request. Halved when the RPC refuses a range
+LOG_BLOCK_RANGE = 2000
+MIN_LOG_BLOCK_RANGE = 10
+
+
+class Position(BaseModel):
+    """A token held by the owner, with its average cost basis in USD"""
+
+    token = CharField(primary_key=True)
+    balance_wei = TextField(default="0")
+    decimals = IntegerField(null=True)
+    cost_basis = FloatField(default=0)
+    realized_pnl = FloatField(default=0)
+    last_price = FloatField(null=True)
+    marked_at = FloatField(null=True)
+    updated_block = IntegerField(default=0)
+
+
+class Trade(BaseModel):
+    """A token that left the owner for another one in a transaction. Batch
+    settlements moving several tokens have a trade per pair of tokens"""
+
+    tx_hash = CharField()
+    block = IntegerField()
+    sell_token = CharField()
+    sell_amount = TextField()
+    buy_token = CharField()
+    buy_amount = TextField()
+    # USD value of the trade, when one of the sides is the quote token
+    value = FloatField(null=True)
+
+    class Meta:
+        primary_key = CompositeKey("tx_hash", "sell_token", "buy_token")
+
+
+class PriceMark(BaseModel):
+    """A USD price of a token at some point in time"""
+
+    token = CharField()
+    timestamp = FloatField()
+    price = FloatField()
+
+    class Meta:
+        primary_key = CompositeKey("token", "timestamp")
+
+
+def topic_to_address(topic) -> str:
+    """Get the address stored in an indexed topic"""
+    return Web3.to_checksum_address(bytes(topic)[-20:])
+
+
+class PortfolioLedger:
+    """Local store of the positions, trades and price marks of an owner.
+
+    It is kept current from the ERC20 Transfer logs to and from the owner,
+    scanned with eth_getLogs in block ranges from a stored checkpoint. Reads
+    are local queries, and a restart only scans the blocks it missed.
+    Positions and trades of a scope, like a fund, have their own tables.
+    """
+
+    def __init__(
+        self,
+        w3: Web3,
+        multicall: Multicall,
+        owner: str,
+        quote_token: str,
+        scope: Optional[str] = None,
+    ):
+        """Init"""
+        self.w3 = w3
+        self.multicall = multicall
+        self.owner = Web3.to_checksum_address(owner)
+        self.quote_token = Web3.to_checksum_address(quote_token)
+        self.owner_topic = "0x" + "0" * 24 + self.owner[2:].lower()
+        self.checkpoint_key = f"portfolio:{self.owner}:block"
+        self.block_range = LOG_BLOCK_RANGE
+        self.lock = threading.Lock()
+        self.positions = scoped_model(Position, scope)
+        self.trades = scoped_model(Trade, scope)
+        init_db(self.positions, self.trades, PriceMark)
+
+    def get_checkpoint(self) -> Optional[int]:
+        """Last block applied to the positions"""
+        block = get_state(self.checkpoint_key)
+        return None if block is None else int(block)
+
+    def seed(self, tokens: List[str], prices: Optional[Dict[str, float]] = None):
+        """Start from the current balances, when there is no checkpoint yet.
+        The cost basis of what is already held is its current value"""
+        prices = prices or {}
+        portfolio = self.multicall.get_balances(
+            self.owner, [self.quote_token] + tokens, include_native=False
+        )
+        with db.atomic():
+            for token, balance in portfolio["tokens"].items():
+                if not balance["balance_wei"]:
+                    continue
+                price = 1.0 if token == self.quote_token else prices.get(token)
+                self.positions.insert(
+                    token=token,
+                    balance_wei=str(balance["balance_wei"]),
+                    decimals=balance["decimals"],
+                    cost_basis=(balance["balance"] or 0) * (price or 0),
+                    updated_block=portfolio["block"],
+                ).on_conflict_replace().execute()
+            set_state(self.checkpoint_key, portfolio["block"])
+        print(f"Portfolio seeded at block {portfolio['block']}")
+
+    def get_logs(self, from_block: int, to_block: int) -> List[Dict]:
+        """Transfer logs from and to the owner in a block range"""
+        bucket = get_bucket("rpc")
+        logs = {}
+        for topics in (
+            [TRANSFER_TOPIC, self.owner_topic],
+            [TRANSFER_TOPIC, None, self.owner_topic],
+        ):
+            bucket.acquire()
+            for log in self.w3.eth.get_logs(
+                {"fromBlock": from_block, "toBlock": to_block, "topics": topics}
+            ):
+                # ERC721 transfers have the token id as a fourth topic
+                if len(log["topics"]) != 3:
+                    continue
+                logs[(log["blockNumber"], log["logIndex"])] = log
+        return [logs[key] for key in sorted(logs)]
+
+    def sync(self) -> int:
+        """Apply the Transfer logs since the checkpoint, up to a block deep
+        enough not to be reorged. Returns the number of blocks scanned"""
+        with self.lock:
+            checkpoint = self.get_checkpoint()
+            if checkpoint is None:
+                raise ValueError("The portfolio has not been seeded")
+
+            get_bucket("rpc").acquire()
+            head = self.w3.eth.block_number - CONFIRMATIONS
+            start = checkpoint + 1
+            while start <= head:
+                end = min(head, start + self.block_range - 1)
+                try:
+                    logs = self.get_logs(start, end)
+                except Exception as e:
+                    if self.block_range <= MIN_LOG_BLOCK_RANGE:
+                        raise
+                    self.block_range = max(MIN_LOG_BLOCK_RANGE, self.block_range // 2)
+                    print(f"eth_getLogs failed ({e}), range {self.block_range}")
+                    continue
+
+                # The positions and the checkpoint move together
+                with db.atomic():
+                    self.apply(logs)
+                    set_state(self.checkpoint_key, end)
+                start = end + 1
+
+            return max(0, head - checkpoint)
+
+    def apply(self, logs: List[Dict]):
+        """Update the positions and trades from Transfer logs, per transaction"""
+        flows: Dict[bytes, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        blocks = {}
+        for log in logs:
+            tx_hash = bytes(log["transactionHash"])
+            token = Web3.to_checksum_address(log["address"])
+            amount = int.from_bytes(bytes(log["data"])[:32], "big")
+            if topic_to_address(log["topics"][1]) == self.owner:
+                flows[tx_hash][token] -= amount
+            if topic_to_address(log["topics"][2]) == self.owner:
+                flows[tx_hash][token] += amount
+            blocks[tx_hash] = log["blockNumber"]
+
+        tokens = {token for flow in flows.values() for token in flow}
+        decimals = self.multicall.get_decimals(list(tokens)) if tokens else {}
+        positions = {p.token: p for p in self.positions.select()}
+        new_tokens = tokens - set(positions)
+        for token in new_tokens:
+            positions[token] = self.positions(token=token, decimals=decimals.get(token))
+
+        for tx_hash, flow in flows.items():
+            flow = {token: amount for token, amount in flow.items() if amount}
+            self.apply_flow(Web3.to_hex(tx_hash), blocks[tx_hash], flow, positions)
+
+        for token in tokens:
+            positions[token].save(force_insert=token in new_tokens)
+
+    def get_units(self, token: str, amount: int, positions: Dict) -> float:
+        """Amount of a token in units, from its wei amount"""
+        decimals = positions[token].decimals
+        return abs(amount) / 10**decimals if decimals is not None else 0.0
+
+    def get_leg_values(
+        self, tokens: List[str], flow: Dict[str, int], positions: Dict, costs: Dict
+    ) -> Dict[str, float]:
+        """USD value of each leg of a transaction. The quote token is valued at
+        its amount, other tokens at their last price or else at their released
+        cost. When a leg has no value, the legs are weighted evenly"""
+        values = {}
+        for token in tokens:
+            units = self.get_units(token, flow[token], positions)
+            if token == self.quote_token:
+                values[token] = units
+            elif positions[token].last_price is not None:
+                values[token] = units * positions[token].last_price
+            else:
+                values[token] = costs.get(token, 0.0)
+        if not all(values.values()):
+            return {token: 1.0 for token in tokens}
+        return values
+
+    def apply_flow(
+        self, tx_hash: str, block: int, flow: Dict[str, int], positions: Dict
+    ):
+        """Apply the net token flows of one transaction"""
+        sold = [token for token, amount in flow.items() if amount < 0]
+        bought = [token for token, amount in flow.items() if amount > 0]
+
+        # Cost leaving the sold tokens, in proportion to the amount sold
+        costs = {}
+        for token in sold:
+            position = positions[token]
+            balance = int(position.balance_wei)
+            fraction = min(1.0, -flow[token] / balance) if balance else 1.0
+            costs[token] = position.cost_basis * fraction
+            position.cost_basis -= costs[token]
+
+        for token, amount in flow.items():
+            position = positions[token]
+            position.balance_wei = str(max(0, int(position.balance_wei) + amount))
+            position.updated_block = block
+
+        # The quote token is cash, its cost is its balance
+        quote = positions.get(self.quote_token)
+        if quote is not None and quote.decimals is not None:
+            quote.cost_basis = int(quote.balance_wei) / 10**quote.decimals
+
+        if not sold or not bought:
+            # Deposits and withdrawals: the cost leaves with the tokens, and
+            # nothing is realized
+            return
+
+        # The cost of the sold tokens, cash included, moves to the bought
+        # tokens. Cash received takes its own amount of it, and what the
+        # bought tokens can't carry is realized on the sold tokens
+        if self.quote_token in sold:
+            costs[self.quote_token] = self.get_units(
+                self.quote_token, flow[self.quote_token], positions
+            )
+        received = 0.0
+        if self.quote_token in bought:
+            received = self.get_units(
+                self.quote_token, flow[self.quote_token], positions
+            )
+        cost = sum(costs.values())
+        tokens = [token for token in bought if token != self.quote_token]
+        carried = max(0.0, cost - received) if tokens else 0.0
+        realized = received + carried - cost
+
+        sell_values = self.get_leg_values(sold, flow, positions, costs)
+        buy_values = self.get_leg_values(bought, flow, positions, costs)
+        sell_total = sum(sell_values.values())
+        buy_total = sum(buy_values.values())
+
+        if tokens:
+            token_total = sum(buy_values[token] for token in tokens)
+            for token in tokens:
+                positions[token].cost_basis += carried * buy_values[token] / token_total
+
+        if realized:
+            # Realized on the tokens that had a cost, or else on all of them
+            holders = [token for token in sold if token != self.quote_token]
+            weights = {token: costs[token] for token in holders}
+            if not any(weights.values()):
+                weights = {token: sell_values[token] for token in holders}
+            weight_total = sum(weights.values())
+            for token in holders:
+                positions[token].realized_pnl += (
+                    realized * weights[token] / weight_total
+                )
+
+        rows = []
+        for sell_token in sold:
+            sell_share = sell_values[sell_token] / sell_total
+            for buy_token in bought:
+                buy_share = buy_values[buy_token] / buy_total
+                # A single leg on a side keeps its exact amount
+                sell_amount = -flow[sell_token]
+                if len(bought) > 1:
+                    sell_amount = int(sell_amount * buy_share)
+                buy_amount = flow[buy_token]
+                if len(sold) > 1:
+                    buy_amount = int(buy_amount * sell_share)
+                value = None
+                if self.quote_token == sell_token:
+                    value = self.get_units(sell_token, sell_amount, positions)
+                elif self.quote_token == buy_token:
+                    value = self.get_units(buy_token, buy_amount, positions)
+                rows.append(
+                    {
+                        "tx_hash": tx_hash,
+                        "block": block,
+                        "sell_token": sell_token,
+                        "sell_amount": str(sell_amount),
+                        "buy_token": buy_token,
+                        "buy_amount": str(buy_amount),
+                        "value": value,
+                    }
+                )
+        self.trades.insert_many(rows).on_conflict_ignore().execute()
+
+    def mark(self, prices: Dict[str, float], timestamp: Optional[float] = None):
+        """Record USD prices of tokens"""
+        timestamp = timestamp or time.time()
+        prices = {Web3.to_checksum_address(t): p for t, p in prices.items()}
+        with db.atomic():
+            PriceMark.insert_many(
+                [
+                    {"token": token, "timestamp": timestamp, "price": price}
+                    for token, price in prices.items()
+                ]
+            ).on_conflict_ignore().execute()
+            for token, price in prices.items():
+                self.positions.update(last_price=price, marked_at=timestamp).where(
+                    self.positions.token == token
+                ).execute()
+
+    def get_holdings(self) -> Dict:
+        """Current positions with their value and PnL, from the local store"""
+        holdings = {}
+        totals = {"value": 0.0, "cost_basis": 0.0, "unrealized_pnl": 0.0}
+        realized = 0.0
+        for position in self.positions.select():
+            realized += position.realized_pnl
+            balance_wei = int(position.balance_wei)
+            if not balance_wei or position.decimals is None:
+                continue
+
+            balance = balance_wei / 10**position.decimals
+            if position.token == self.quote_token:
+                price = 1.0
+            else:
+                price = position.last_price
+            holding = {
+                "balance": balance,
+                "cost_basis": round(position.cost_basis, 2),
+                "realized_pnl": round(position.realized_pnl, 2),
+            }
+            if price is not None:
+                value = balance * price
+                holding["price"] = price
+                holding["value"] = round(value, 2)
+                holding["unrealized_pnl"] = round(value - position.cost_basis, 2)
+                totals["value"] += value
+                totals["cost_basis"] += position.cost_basis
+                totals["unrealized_pnl"] += value - position.cost_basis
+            holdings[position.token] = holding
+
+        totals = {key: round(value, 2) for key, value in totals.items()}
+        totals["realized_pnl"] = round(realized, 2)
+        return {"block": self.get_checkpoint(), "holdings": holdings, **totals}
+
+    def get_trades(self, limit: int = 20) -> List[Dict]:
+        """Most recent trades"""
+        return [
+            {
+                "tx_hash": trade.tx_hash,
+                "block": trade.block,
+                "sell_token": trade.sell_token,
+                "sell_amount": trade.sell_amount,
+                "buy_token": trade.buy_token,
+                "buy_amount": trade.buy_amount,
+                "value": trade.value,
+            }
+            for trade in self.trades.select()
+            .order_by(self.trades.block.desc())
+            .limit(limit)
+        ]
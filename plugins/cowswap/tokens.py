@@ -0,0 +1,210 @@
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from peewee import CharField
+from web3 import Web3
+
+from core.db import BaseModel, db, get_state, init_db, set_state
+from core.http import HttpClient
+from plugins.coingecko.snapshot import MarketSnapshot
+
+COINGECKO_COINS_LIST_URL = "https://api.coingecko.com/api/v3/coins/list"
+PLATFORM = "base"
+
+# Full refresh of the coin list
+REFRESH_INTERVAL = 24 * 3600
+
+# Unknown names trigger an early refresh, but not more often than this
+MISS_REFRESH_INTERVAL = 3600
+
+REFRESHED_AT_KEY = "token_index_refreshed_at"
+
+
+class Token(BaseModel):
+    """A CoinGecko coin deployed on Base. Decimals are not part of the index,
+    they are read on chain and cached per chain by Multicall.get_decimals"""
+
+    coin_id = CharField(primary_key=True)
+    symbol = CharField(index=True)
+    name = CharField()
+    address = CharField(index=True)
+
+
+def token_to_json(token: Token) -> Dict:
+    """Token to json"""
+    return {
+        "coin_id": token.coin_id,
+        "symbol": token.symbol,
+        "name": token.name,
+        "address": token.address,
+    }
+
+
+class TokenIndex:
+    """A local CoinGecko id/symbol/name -> Base contract address index"""
+
+    def __init__(self, http: HttpClient, ranks_path: Optional[Path] = None):
+        """Init"""
+        self.http = http
+        # Market snapshot used to break ties between coins sharing a symbol
+        self.ranks_path = ranks_path
+        self.ranks: Dict[str, int] = {}
+        self.ranks_mtime = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+        self.by_id: Dict[str, Dict] = {}
+        self.by_symbol: Dict[str, List[Dict]] = {}
+        self.by_name: Dict[str, List[Dict]] = {}
+        self.by_address: Dict[str, Dict] = {}
+
+        init_db(Token)
+        self.load()
+        if self.age() > REFRESH_INTERVAL:
+            self.refresh()
+
+    def age(self) -> float:
+        """Seconds since the last refresh"""
+        return time.time() - float(get_state(REFRESHED_AT_KEY, 0))
+
+    def load(self):
+        """Load the stored index into memory"""
+        with self.lock:
+            self.by_id.clear()
+            self.by_symbol.clear()
+            self.by_name.clear()
+            self.by_address.clear()
+            for token in Token.select():
+                self.add(token_to_json(token))
+
+    def add(self, token: Dict):
+        """Add a token to the in-memory maps. Call with the lock held"""
+        self.by_id[token["coin_id"]] = token
+        self.by_symbol.setdefault(token["symbol"].lower(), []).append(token)
+        self.by_name.setdefault(token["name"].lower(), []).append(token)
+        self.by_address[token["address"].lower()] = token
+
+    def refresh(self) -> int:
+        """Fetch the coin list and store the new or changed Base tokens.
+        Returns the number of updated tokens"""
+        with self.refresh_lock:
+            return self.refresh_locked()
+
+    def refresh_locked(self) -> int:
+        """Refresh the index. Call with the refresh lock held"""
+        try:
+            response = self.http.get(
+                COINGECKO_COINS_LIST_URL, params={"include_platform": "true"}
+            )
+            response.raise_for_status()
+            coins = response.json()
+        except Exception as e:
+            print(f"Couldnt refresh the token index: {e}")
+            return 0
+
+        updated = []
+        for coin in coins:
+            address = (coin.get("platforms") or {}).get(PLATFORM)
+            if not address:
+                continue
+            try:
+                address = Web3.to_checksum_address(address)
+            except ValueError:
+                continue
+
+            known = self.by_id.get(coin["id"])
+            if known and (known["symbol"], known["name"], known["address"]) == (
+                coin["symbol"],
+                coin["name"],
+                address,
+            ):
+                continue
+
+            updated.append(
+                {
+                    "coin_id": coin["id"],
+                    "symbol": coin["symbol"],
+                    "name": coin["name"],
+                    "address": address,
+                }
+            )
+
+        if updated:
+            with db.atomic():
+                for i in range(0, len(updated), 100):
+                    Token.insert_many(
+                        updated[i : i + 100]
+                    ).on_conflict_replace().execute()
+            self.load()
+
+        set_state(REFRESHED_AT_KEY, time.time())
+        print(f"Token index refreshed: {len(updated)} new or updated tokens")
+        return len(updated)
+
+    def get_ranks(self) -> Dict[str, int]:
+        """Get the market cap rank of the coins in the last market snapshot"""
+        if not self.ranks_path or not self.ranks_path.exists():
+            return {}
+
+        # Only reload when the snapshot changed
+        mtime = self.ranks_path.stat().st_mtime
+        if mtime != self.ranks_mtime:
+            snapshot = MarketSnapshot.load(self.ranks_path)
+            self.ranks = (
+                {coin_id: rank for rank, coin_id in enumerate(snapshot.ids)}
+                if snapshot
+                else {}
+            )
+            self.ranks_mtime = mtime
+        return self.ranks
+
+    def get_universe(self) -> List[Dict]:
+        """Get the indexed tokens of the last market snapshot, by market cap"""
+        ranks = self.get_ranks()
+        with self.lock:
+            tokens = [self.by_id[coin_id] for coin_id in ranks if coin_id in self.by_id]
+        return sorted(tokens, key=lambda t: ranks[t["coin_id"]])
+
+    def pick(self, candidates: List[Dict]) -> Dict:
+        """Pick the best known coin among those sharing a symbol or name"""
+        if len(candidates) == 1:
+            return candidates[0]
+        ranks = self.get_ranks()
+        return min(candidates, key=lambda t: ranks.get(t["coin_id"], len(ranks)))
+
+    def lookup(self, query: str) -> Optional[Dict]:
+        """Look up a token by id, address, symbol or name"""
+        query = query.strip().lower()
+        with self.lock:
+            if query in self.by_id:
+                return self.by_id[query]
+            if query in self.by_address:
+                return self.by_address[query]
+            for index in (self.by_symbol, self.by_name):
+                if query in index:
+                    return self.pick(index[query])
+        return None
+
+    def resolve(self, query: str) -> Optional[Dict]:
+        """Resolve a token, refreshing the index if it is unknown"""
+        token = self.lookup(query)
+        if token is None and self.age() > MISS_REFRESH_INTERVAL:
+            self.refresh()
+            token = self.lookup(query)
+        return token
+
+
+# The index of the process, shared by the funds
+shared_index: Optional[TokenIndex] = None
+shared_index_lock = threading.Lock()
+
+
+def get_token_index(http: HttpClient, ranks_path: Optional[Path] = None) -> TokenIndex:
+    """Get the shared token index, creating it on first use"""
+    global shared_index
+    with shared_index_lock:
+        if shared_index is None:
+            shared_index = TokenIndex(http, ranks_path=ranks_path)
+        return shared_index
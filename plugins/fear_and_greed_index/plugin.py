@@ -2,6 +2,7 @@ from typing import List, Optional
 
 import requests
 
+from core.cache import cached
 from core.plugin import Plugin
 
 
@@ -10,13 +11,15 @@ class FearAndGreedIndex(Plugin):
 
     NAME = "FearAndGreedIndex"
 
+    # The index is only updated once a day
+    @cached(ttl=3600, stale_ttl=6 * 3600)
     def fearandgreedindex_get_index_tool(self) -> Optional[List]:
         """Get the current fear and greed index"""
 
         url = "https://api.alternative.me/fng/"
 
         try:
-            response = requests.get(url, timeout=60)
+            response = self.http.get(url)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException:
@@ -1,9 +1,14 @@
 import json
 from pathlib import Path
+from typing import Dict, List
 
+import requests
 from web3 import Web3
 
+from core.cassette import wrap_session
+from core.multicall import Multicall
 from core.plugin import Plugin
+from core.tools import rate_limit
 
 
 class Ledger(Plugin):
@@ -16,7 +21,9 @@ class Ledger(Plugin):
         """Init"""
         super().__init__()
 
-        self.ledger = Web3(Web3.HTTPProvider(self.base_rpc))
+        self.ledger = Web3(
+            Web3.HTTPProvider(self.base_rpc, session=wrap_session(requests.Session()))
+        )
         self.wallet = Web3().eth.account.from_key(self.private_key)
 
         with open(
@@ -24,10 +31,14 @@ class Ledger(Plugin):
         ) as abi_file:
             self.erc20_abi = json.load(abi_file)
 
+        self.multicall = Multicall(self.ledger)
+
+    @rate_limit("rpc")
     def get_latest_block(self):
         """Get the current block"""
         return self.ledger.eth.get_block("latest")
 
+    @rate_limit("rpc")
     def ledger_get_native_balance(self, wallet_address: str):
         """Get the native balance of a wallet address"""
         balance_wei = self.ledger.eth.get_balance(wallet_address)
@@ -37,9 +48,19 @@ class Ledger(Plugin):
         self, erc20_contract_address: str, wallet_address: str
     ):
         """Get the ERC20 balance of a wallet address"""
-        contract = self.ledger.eth.contract(
-            address=erc20_contract_address, abi=self.erc20_abi
-        )
-        balance = contract.functions.balanceOf(wallet_address).call()
-        decimals = contract.functions.decimals().call()
-        return balance / (10**decimals)
+        return self.multicall.get_balances(
+            wallet_address, [erc20_contract_address], include_native=False
+        )["tokens"][Web3.to_checksum_address(erc20_contract_address)]["balance"]
+
+    def ledger_get_balances(
+        self, token_addresses: List[str], wallet_address: str
+    ) -> Dict:
+        """Get the native and ERC20 balances of a wallet address in a single call"""
+        return self.multicall.get_balances(wallet_address, token_addresses)
+
+    def ledger_get_balances_tool(
+        self, token_addresses: List[str], wallet_address: str
+    ) -> Dict:
+        """Get the native and ERC20 balances of a wallet address, read in a
+        single call at one block"""
+        return self.ledger_get_balances(token_addresses, wallet_address)
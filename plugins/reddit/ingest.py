@@ -0,0 +1,168 @@
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import praw
+from peewee import CharField, FloatField, IntegerField, TextField
+
+from core.db import BaseModel, db, init_db, scoped_model
+from core.funds import get_current_scope
+from core.limiter import get_bucket
+
+# Subreddits fetched at the same time
+MAX_WORKERS = 10
+
+# A known post is returned again when its score grew this much since last seen
+RISING_MIN_DELTA = 10
+RISING_MIN_RATIO = 0.2
+
+# $PEPE style cashtags, and all caps words that look like tickers
+CASHTAG_RE = re.compile(r"\$([A-Za-z][A-Za-z0-9]{1,9})\b")
+CAPS_RE = re.compile(r"\b([A-Z][A-Z0-9]{2,5})\b")
+
+# All caps words that are not tickers
+NOT_TICKERS = {
+    "AMA", "AND", "ATH", "BUY", "CEO", "CEX", "DEX", "DYOR", "FOMO", "FOR",
+    "HODL", "IMO", "LFG", "NEW", "NFA", "NFT", "NOT", "NOW", "OTC", "THE",
+    "USA", "USD", "WHY", "YOU",
+}  # fmt: skip
+
+
+class RedditPost(BaseModel):
+    """A post already seen, with its last known score"""
+
+    id = CharField(primary_key=True)
+    subreddit = CharField()
+    title = TextField()
+    score = IntegerField()
+    num_comments = IntegerField()
+    tickers = TextField(default="")
+    first_seen = FloatField()
+    last_seen = FloatField()
+
+
+def extract_tickers(text: str) -> List[str]:
+    """Ticker-like tokens of a text, cashtags first"""
+    tickers = [t.upper() for t in CASHTAG_RE.findall(text)]
+    tickers += [t for t in CAPS_RE.findall(text) if t not in NOT_TICKERS]
+    return list(dict.fromkeys(tickers))
+
+
+class RedditIngest:
+    """Polls many subreddits concurrently and returns only the posts that are
+    new or rising since the last poll. The ingest is shared by the funds of
+    the process, each of them with its own table of seen posts"""
+
+    def __init__(self, make_client: Callable[[], praw.Reddit]):
+        """Init"""
+        # praw instances are not thread safe, every worker gets its own. The
+        # shared bucket keeps all of them within the Reddit rate limit
+        self.make_client = make_client
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_WORKERS, thread_name_prefix="reddit"
+        )
+        init_db(RedditPost)
+
+    def get_seen_model(self):
+        """The seen posts of the fund polling"""
+        model = scoped_model(RedditPost, get_current_scope())
+        init_db(model)
+        return model
+
+    def get_client(self) -> praw.Reddit:
+        """The praw client of the current thread"""
+        if not hasattr(self.local, "client"):
+            self.local.client = self.make_client()
+        return self.local.client
+
+    def fetch(self, subreddit_name: str, limit: int) -> List[Dict]:
+        """Fetch the hot posts of a subreddit"""
+        bucket = get_bucket("reddit")
+        # praw fetches listings in pages of 100 posts
+        for _ in range(0, limit, 100):
+            bucket.acquire()
+        subreddit = self.get_client().subreddit(subreddit_name)
+        return [
+            {
+                "id": post.id,
+                "subreddit": subreddit_name,
+                "title": post.title,
+                "score": post.score,
+                "num_comments": post.num_comments,
+                "url": post.url,
+            }
+            for post in subreddit.hot(limit=limit)
+        ]
+
+    def poll(self, subreddits: List[str], limit: int) -> Dict:
+        """Fetch all the subreddits at once and keep the new or rising posts"""
+        futures = {
+            name: self.executor.submit(self.fetch, name, limit) for name in subreddits
+        }
+
+        fetched, stats = [], {}
+        for name, future in futures.items():
+            try:
+                posts = future.result()
+            except Exception as e:
+                stats[name] = {"error": str(e)}
+                continue
+            stats[name] = {"fetched": len(posts), "new": 0, "rising": 0}
+            fetched.extend(posts)
+
+        # The same post can be crossposted or listed twice
+        fetched = list({post["id"]: post for post in fetched}.values())
+        seen_model = self.get_seen_model()
+        known = {
+            post.id: post
+            for post in seen_model.select().where(
+                seen_model.id.in_([p["id"] for p in fetched])
+            )
+        }
+
+        now = time.time()
+        results, rows = [], []
+        for post in fetched:
+            post["tickers"] = extract_tickers(post["title"])
+            previous = known.get(post["id"])
+            if previous is None:
+                post["status"] = "new"
+            else:
+                delta = post["score"] - previous.score
+                if delta < max(RISING_MIN_DELTA, RISING_MIN_RATIO * previous.score):
+                    continue
+                post["status"] = "rising"
+                post["score_delta"] = delta
+            stats[post["subreddit"]][post["status"]] += 1
+            results.append(post)
+            rows.append(
+                {
+                    "id": post["id"],
+                    "subreddit": post["subreddit"],
+                    "title": post["title"],
+                    "score": post["score"],
+                    "num_comments": post["num_comments"],
+                    "tickers": ",".join(post["tickers"]),
+                    "first_seen": now if previous is None else previous.first_seen,
+                    "last_seen": now,
+                }
+            )
+
+        # Only returned posts are stored, so a slowly rising post keeps its
+        # baseline score until it crosses the threshold
+        with db.atomic():
+            for i in range(0, len(rows), 100):
+                seen_model.insert_many(
+                    rows[i : i + 100]
+                ).on_conflict_replace().execute()
+
+        tickers = Counter(t for post in results for t in post["tickers"])
+        return {
+            "posts": sorted(results, key=lambda p: p["score"], reverse=True),
+            "tickers": dict(tickers.most_common()),
+            "subreddits": stats,
+        }
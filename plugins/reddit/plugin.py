@@ -1,6 +1,28 @@
+import os
+from typing import Dict, List, Optional
+
 import praw
+import requests
 
+from core.cache import cached
+from core.cassette import wrap_session
 from core.plugin import Plugin
+from core.tools import rate_limit
+from plugins.reddit.ingest import RedditIngest
+
+# Subreddits polled for new posts, comma separated in REDDIT_SUBREDDITS
+DEFAULT_SUBREDDITS = [
+    "memecoins",
+    "CryptoMoonShots",
+    "BaseChain",
+    "CryptoCurrency",
+    "SatoshiStreetBets",
+    "altcoin",
+    "CryptoMarkets",
+    "defi",
+    "ethtrader",
+    "Coinbase",
+]
 
 
 class Reddit(Plugin):
@@ -13,10 +35,18 @@ class Reddit(Plugin):
         """Init"""
         super().__init__()
 
-        self.client = praw.Reddit(
+        self.client = self.make_client()
+        self.ingest = RedditIngest(self.make_client)
+        subreddits = os.environ.get("REDDIT_SUBREDDITS")
+        self.subreddits = subreddits.split(",") if subreddits else DEFAULT_SUBREDDITS
+
+    def make_client(self) -> praw.Reddit:
+        """Create a praw client"""
+        return praw.Reddit(
             client_id=self.client_id,
             client_secret=self.client_secret,
             user_agent="memepool:v0.1",
+            requestor_kwargs={"session": wrap_session(requests.Session())},
         )
 
     def post_to_json(self, post):
@@ -27,7 +57,17 @@ class Reddit(Plugin):
             "url": post.url,
         }
 
+    @cached(ttl=300, stale_ttl=600)
+    @rate_limit("reddit")
     def reddit_get_top_posts_tool(self, subreddit_name: str, posts_limit: int = 10):
         """Get the top posts for a given subreddit"""
         subreddit = self.client.subreddit(subreddit_name)
         return [self.post_to_json(post) for post in subreddit.hot(limit=posts_limit)]
+
+    def reddit_get_new_posts_tool(
+        self, subreddit_names: Optional[List[str]] = None, posts_limit: int = 25
+    ) -> Dict:
+        """Get the hot posts of many subreddits that are new or rising since the
+        last call, with the tickers mentioned in their titles. Without
+        subreddit names, the default memecoin and crypto subreddits are used"""
+        return self.ingest.poll(subreddit_names or self.subreddits, posts_limit)
@@ -0,0 +1,146 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from plugins.coingecko.snapshot import MarketSnapshot, format_number
+
+# Weight of each score in the final one, at a neutral fear and greed index
+WEIGHTS = {"momentum": 0.4, "volume": 0.25, "social": 0.35}
+
+# How much the fear and greed index shifts weight to (greed) or away from
+# (fear) momentum. 0.5 means momentum weighs up to 50% more at extreme greed
+SENTIMENT_TILT = 0.5
+
+# Scores are clipped to this many deviations so a single outlier cannot win
+MAX_ZSCORE = 3
+
+# Bare symbols and names shorter than this are too ambiguous to count as a
+# mention ("ME", "DOG"). Cashtags always count
+MIN_TERM_LENGTH = 4
+
+WORD_RE = re.compile(r"\$?[a-z0-9]+")
+
+
+def robust_zscore(values: np.ndarray) -> np.ndarray:
+    """Median/MAD z-score, clipped. Missing values score 0"""
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.zeros(len(values))
+
+    median = np.median(values[finite])
+    spread = 1.4826 * np.median(np.abs(values[finite] - median))
+    if spread == 0:
+        spread = np.std(values[finite])
+    if spread == 0:
+        return np.zeros(len(values))
+
+    scores = np.where(finite, (values - median) / spread, 0.0)
+    return np.clip(scores, -MAX_ZSCORE, MAX_ZSCORE)
+
+
+def build_terms(symbols: List[str], names: List[str]) -> Dict[str, int]:
+    """Map the terms that mention a coin to its index"""
+    terms = {}
+    # Iterate backwards so the biggest coin wins a shared term
+    for i in reversed(range(len(symbols))):
+        symbol = symbols[i].lower()
+        name = names[i].lower()
+        terms[f"${symbol}"] = i
+        if len(symbol) >= MIN_TERM_LENGTH:
+            terms[symbol] = i
+        if " " not in name and len(name) >= MIN_TERM_LENGTH:
+            terms[name] = i
+    return terms
+
+
+def count_mentions(
+    texts: List[str], engagements: List[float], terms: Dict[str, int], size: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Count the posts that mention each coin and the engagement they got"""
+    coins, weights = [], []
+    for text, engagement in zip(texts, engagements):
+        mentioned = {
+            terms[word] for word in WORD_RE.findall(text.lower()) if word in terms
+        }
+        coins.extend(mentioned)
+        weights.extend([engagement] * len(mentioned))
+
+    coins = np.array(coins, dtype=np.int64)
+    mentions = np.bincount(coins, minlength=size).astype(np.float64)
+    engagement = np.bincount(
+        coins, weights=np.array(weights, dtype=np.float64), minlength=size
+    )
+    return mentions, engagement
+
+
+def score(
+    snapshot: MarketSnapshot,
+    mentions: np.ndarray,
+    engagement: np.ndarray,
+    fear_and_greed: Optional[float] = None,
+) -> Dict[str, np.ndarray]:
+    """Compute the momentum, volume, social and final scores of every coin"""
+    n = snapshot.numeric
+
+    momentum = (
+        0.5 * robust_zscore(n["price_change_percentage_24h"])
+        + 0.25 * robust_zscore(n["range_position_24h"])
+        + 0.25 * robust_zscore(n["rank_change"])
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volume_to_mcap = n["volume_to_mcap"]
+        volume = robust_zscore(
+            np.where(volume_to_mcap > 0, np.log(volume_to_mcap), np.nan)
+        )
+
+    social = 0.5 * robust_zscore(np.log1p(mentions)) + 0.5 * robust_zscore(
+        np.log1p(engagement)
+    )
+
+    weights = dict(WEIGHTS)
+    if fear_and_greed is not None:
+        weights["momentum"] *= 1 + SENTIMENT_TILT * (fear_and_greed - 50) / 50
+    total = sum(weights.values())
+
+    final = (
+        weights["momentum"] * momentum
+        + weights["volume"] * volume
+        + weights["social"] * social
+    ) / total
+
+    return {
+        "score": final,
+        "momentum": momentum,
+        "volume": volume,
+        "social": social,
+        "mentions": mentions,
+    }
+
+
+def to_table(
+    snapshot: MarketSnapshot, scores: Dict[str, np.ndarray], limit: int
+) -> str:
+    """Render the best scored coins as a compact table for the model"""
+    order = np.argsort(-scores["score"], kind="stable")[:limit]
+    rows = ["rank|id|symbol|score|mom|vol|social|mentions|24h%|vol/mcap"]
+    for i in order:
+        rows.append(
+            "|".join(
+                [
+                    format_number(snapshot.numeric["market_cap_rank"][i]),
+                    snapshot.text["id"][i],
+                    snapshot.text["symbol"][i].upper(),
+                    f"{scores['score'][i]:+.2f}",
+                    f"{scores['momentum'][i]:+.2f}",
+                    f"{scores['volume'][i]:+.2f}",
+                    f"{scores['social'][i]:+.2f}",
+                    f"{scores['mentions'][i]:.0f}",
+                    format_number(snapshot.numeric["price_change_percentage_24h"][i]),
+                    format_number(snapshot.numeric["volume_to_mcap"][i]),
+                ]
+            )
+        )
+    return "\n".join(rows)
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import List, Optional
+
+from core.plugin import Plugin
+from plugins.signals.engine import build_terms, count_mentions, score, to_table
+
+# Subreddits scanned for memecoin mentions
+SUBREDDITS = ["memecoins", "CryptoMoonShots", "BaseChain"]
+REDDIT_POSTS = 50
+
+# Coins searched on Twitter, by market cap, and cashtags per search query
+TWITTER_COINS = 45
+TWITTER_QUERY_SYMBOLS = 15
+TWITTER_COUNT = 20
+
+
+class Signals(Plugin):
+    """A plugin that ranks memecoins by joining market, social and sentiment
+    data from the other plugins"""
+
+    NAME = "Signals"
+
+    async def call(self, plugin_name: str, tool_name: str, *args):
+        """Call a tool of another plugin without blocking the event loop"""
+        plugin = await asyncio.to_thread(self.loader.get_plugin, plugin_name)
+        tool = getattr(plugin, tool_name)
+        if asyncio.iscoroutinefunction(tool):
+            return await tool(*args)
+        return await asyncio.to_thread(tool, *args)
+
+    def get_twitter_queries(self, symbols: List[str]) -> List[str]:
+        """Cashtag queries covering the biggest coins"""
+        symbols = [s.upper() for s in symbols[:TWITTER_COINS]]
+        return [
+            " OR ".join(f"${s}" for s in symbols[i : i + TWITTER_QUERY_SYMBOLS])
+            for i in range(0, len(symbols), TWITTER_QUERY_SYMBOLS)
+        ]
+
+    async def signals_rank_memecoins_tool(self, limit: int = 20) -> Optional[str]:
+        """Rank the Base memecoins by a combined score of price momentum,
+        volume over market cap and social mentions on Twitter and Reddit,
+        tilted by the fear and greed index. Returns a table of the best coins.
+        Scores are deviations from the median coin"""
+
+        # The tool refreshes the snapshot of the plugin unless it is cached
+        await self.call("coingecko", "coingecko_get_base_memecoins_tool")
+        snapshot = self.loader.get_plugin("coingecko").snapshot
+        if snapshot is None or not len(snapshot):
+            return None
+
+        # Every source is fetched at once, and any of them may fail
+        calls = [self.call("fearandgreedindex", "fearandgreedindex_get_index_tool")]
+        calls += [
+            self.call("reddit", "reddit_get_top_posts_tool", name, REDDIT_POSTS)
+            for name in SUBREDDITS
+        ]
+        calls += [
+            self.call("twitter", "twitter_search_tweet_tool", query, TWITTER_COUNT)
+            for query in self.get_twitter_queries(snapshot.text["symbol"])
+        ]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        failed = sum(isinstance(r, Exception) or r is None for r in results)
+        fng = results[0]
+        posts = results[1 : 1 + len(SUBREDDITS)]
+        tweets = results[1 + len(SUBREDDITS) :]
+
+        texts, engagements = [], []
+        for items in posts:
+            if isinstance(items, list):
+                texts += [post["title"] for post in items]
+                engagements += [post["score"] for post in items]
+        for items in tweets:
+            if isinstance(items, list):
+                texts += [tweet["text"] for tweet in items]
+                engagements += [
+                    (tweet["retweet_count"] or 0) + (tweet["quote_count"] or 0)
+                    for tweet in items
+                ]
+
+        fear_and_greed, classification = None, "unknown"
+        if isinstance(fng, dict) and fng.get("data"):
+            fear_and_greed = float(fng["data"][0]["value"])
+            classification = fng["data"][0]["value_classification"]
+
+        start = time.perf_counter()
+        terms = build_terms(snapshot.text["symbol"], snapshot.text["name"])
+        mentions, engagement = count_mentions(texts, engagements, terms, len(snapshot))
+        scores = score(snapshot, mentions, engagement, fear_and_greed)
+        table = to_table(snapshot, scores, limit)
+        print(
+            f"Scored {len(snapshot)} coins from {len(texts)} posts "
+            f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+
+        header = (
+            f"fear_and_greed={fear_and_greed} ({classification}), "
+            f"posts={len(texts)}, failed_sources={failed}"
+        )
+        return f"{header}\n{table}"
@@ -1,10 +1,14 @@
 import asyncio
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import tweepy
 from twikit import Client
 
+from core.cache import cached
+from core.cassette import get_httpx_kwargs, wrap_session
 from core.plugin import Plugin
+from core.tools import rate_limit
+from plugins.twitter.search import MAX_PAGES, BatchSearch
 
 
 def tweet_to_json(tweet: Any, user_id: Optional[str] = None) -> Dict:
@@ -57,35 +61,53 @@ class Twitter(Plugin):
             access_token_secret=self.main_access_secret,
         )
         self.tweepy_api = tweepy.API(oauth)
+        wrap_session(self.tweepy_client.session)
+        wrap_session(self.tweepy_api.session)
 
-        # Twikit
-        self.twikit_client = Client(language="en-US")
-        self.loop = asyncio.get_event_loop()
-        self.loop.run_until_complete(self.twikit_login())
+        # Twikit. Logged in on first use, on the loop that runs the async tools
+        self.twikit_client = Client(language="en-US", **get_httpx_kwargs())
+        self.twikit_logged_in = False
+        self.twikit_login_lock = asyncio.Lock()
+        self.batch_search = BatchSearch(self.twikit_client)
 
     async def twikit_login(self):
-        """Login into Twitter"""
-        await self.twikit_client.login(
-            auth_info_1=self.secondary_email,
-            auth_info_2=self.secondary_user,
-            password=self.secondary_password,
-            cookies_file=str(self.storage_path / "twikit_cookies.json"),
-        )
+        """Login into Twitter, only once"""
+        async with self.twikit_login_lock:
+            if self.twikit_logged_in:
+                return
+            await self.twikit_client.login(
+                auth_info_1=self.secondary_email,
+                auth_info_2=self.secondary_user,
+                password=self.secondary_password,
+                cookies_file=str(self.storage_path / "twikit_cookies.json"),
+            )
+            self.twikit_logged_in = True
 
     def twitter_create_tweet_tool(self, text: str) -> Optional[int]:
         """Create a new tweet"""
         return self.tweepy_client.create_tweet(text=text)
 
-    async def search_tweet(self, query: str, count: int = 20) -> Optional[Dict]:
+    @cached(ttl=300, stale_ttl=600)
+    @rate_limit("twitter")
+    async def twitter_search_tweet_tool(
+        self, query: str, count: int = 20
+    ) -> Optional[Dict]:
         """Search tweets based on a query"""
+        await self.twikit_login()
         tweets = await self.twikit_client.search_tweet(
             query, product="Top", count=count
         )
         return [tweet_to_json(t) for t in tweets]
 
-    def twitter_search_tweet_tool(self, query: str, count: int = 20) -> Optional[Dict]:
-        """Search tweets based on a query"""
-        return self.loop.run_until_complete(self.search_tweet(query, count))
+    async def twitter_search_batch_tool(
+        self, queries: List[str], max_pages: int = MAX_PAGES
+    ) -> Dict:
+        """Search many queries at once and get, per query, stats of the tweets
+        posted since the last search of that query: number of new tweets and
+        of those no other query matched, unique users, engagement, tweets per
+        hour and the top tweet"""
+        await self.twikit_login()
+        return await self.batch_search.run(queries, max_pages)
 
     # get mentions
 
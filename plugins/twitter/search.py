@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Dict, List
+
+from peewee import CharField, FloatField
+from twikit import Client
+
+from core.db import BaseModel, init_db, scoped_model
+from core.funds import get_current_scope
+from core.limiter import get_bucket
+
+# Queries searched at the same time
+MAX_CONCURRENT_QUERIES = 4
+
+# Pages of results followed per query and poll
+MAX_PAGES = 3
+PAGE_SIZE = 20
+
+# Requests of a batch. At the Twitter rate limit they take about 12 minutes,
+# under the timeout of the batch tool
+MAX_BATCH_REQUESTS = 45
+
+# Characters of the top tweet kept in the stats
+TOP_TWEET_CHARS = 140
+
+
+class SearchCursor(BaseModel):
+    """Newest tweet seen for a search query"""
+
+    query = CharField(primary_key=True)
+    newest_id = CharField()
+    updated_at = FloatField()
+
+
+def engagement(tweet) -> int:
+    """Likes, retweets, replies and quotes of a tweet"""
+    return (
+        (tweet.favorite_count or 0)
+        + (tweet.retweet_count or 0)
+        + (tweet.reply_count or 0)
+        + (tweet.quote_count or 0)
+    )
+
+
+class BatchSearch:
+    """Runs many twikit searches concurrently under the shared Twitter rate
+    limit, following cursors and only fetching tweets newer than the last
+    poll of each query. Every fund has its own cursors"""
+
+    def __init__(self, client: Client, max_concurrency: int = MAX_CONCURRENT_QUERIES):
+        """Init"""
+        self.client = client
+        self.max_concurrency = max_concurrency
+        init_db(SearchCursor)
+
+    def get_cursor_model(self):
+        """The cursors of the fund searching"""
+        model = scoped_model(SearchCursor, get_current_scope())
+        init_db(model)
+        return model
+
+    def get_newest_id(self, query: str) -> int:
+        """Newest tweet id already seen for a query, 0 if none"""
+        model = self.get_cursor_model()
+        cursor = model.get_or_none(model.query == query)
+        return 0 if cursor is None else int(cursor.newest_id)
+
+    def set_newest_id(self, query: str, newest_id: int):
+        """Remember the newest tweet id seen for a query"""
+        self.get_cursor_model().insert(
+            query=query, newest_id=str(newest_id), updated_at=time.time()
+        ).on_conflict_replace().execute()
+
+    async def search(self, query: str, max_pages: int, budget: Dict) -> Dict:
+        """Fetch the tweets of a query newer than its last poll. Pages after
+        the first come out of the budget of the batch. The cursor is moved
+        by commit"""
+        bucket = get_bucket("twitter")
+        since_id = self.get_newest_id(query)
+
+        tweets = []
+        pages = 0
+        await bucket.acquire_async()
+        result = await self.client.search_tweet(query, "Latest", count=PAGE_SIZE)
+        while True:
+            pages += 1
+            reached_seen = False
+            for tweet in result:
+                if int(tweet.id) <= since_id:
+                    reached_seen = True
+                    break
+                tweets.append(tweet)
+            if reached_seen or not len(result) or pages >= max_pages:
+                break
+            if budget["pages"] <= 0:
+                break
+            budget["pages"] -= 1
+            await bucket.acquire_async()
+            result = await result.next()
+
+        return {"tweets": tweets, "pages": pages, "first_poll": since_id == 0}
+
+    def commit(self, queries: List[str], results: List):
+        """Move the cursors past the tweets returned. Done once the batch has
+        its result, so a batch that times out fetches its tweets again"""
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception) or not result["tweets"]:
+                continue
+            self.set_newest_id(query, max(int(t.id) for t in result["tweets"]))
+
+    async def run(self, queries: List[str], max_pages: int = MAX_PAGES) -> Dict:
+        """Search many queries at once. Returns per query stats of the new
+        tweets, with tweets matching several queries counted once overall.
+        The queries past the requests of a batch are skipped"""
+        queries = list(dict.fromkeys(queries))
+        skipped = queries[MAX_BATCH_REQUESTS:]
+        queries = queries[:MAX_BATCH_REQUESTS]
+        # Every query gets its first page, the rest is shared by later pages
+        budget = {"pages": MAX_BATCH_REQUESTS - len(queries)}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(query: str):
+            async with semaphore:
+                return await self.search(query, max_pages, budget)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[bounded(q) for q in queries], return_exceptions=True
+        )
+
+        # Queries matching each tweet
+        matches = Counter(
+            t.id
+            for result in results
+            if not isinstance(result, Exception)
+            for t in result["tweets"]
+        )
+        stats = {}
+        for query, result in zip(queries, results):
+            if isinstance(result, Exception):
+                stats[query] = {"error": str(result)}
+                continue
+            stats[query] = self.get_stats(result)
+            stats[query]["unique_tweets"] = sum(
+                1 for t in result["tweets"] if matches[t.id] == 1
+            )
+        for query in skipped:
+            stats[query] = {"error": "Skipped, over the requests of a batch"}
+
+        self.commit(queries, results)
+        return {
+            "queries": stats,
+            "unique_new_tweets": len(matches),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+
+    def get_stats(self, result: Dict) -> Dict:
+        """Aggregate the new tweets of a query"""
+        tweets = result["tweets"]
+        stats = {
+            "new_tweets": len(tweets),
+            "pages": result["pages"],
+            "first_poll": result["first_poll"],
+        }
+        if not tweets:
+            return stats
+
+        users = {t.user.id for t in tweets}
+        stats["unique_users"] = len(users)
+        stats["engagement"] = sum(engagement(t) for t in tweets)
+
+        times = [t.created_at_datetime.timestamp() for t in tweets]
+        span_hours = (max(times) - min(times)) / 3600
+        if span_hours > 0:
+            stats["tweets_per_hour"] = round(len(tweets) / span_hours, 1)
+
+        top = max(tweets, key=engagement)
+        stats["top_tweet"] = {
+            "text": top.text[:TOP_TWEET_CHARS],
+            "engagement": engagement(top),
+        }
+        return stats
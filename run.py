@@ -1,5 +1,13 @@
 from core.agent import Agent
+from core.funds import load_funds
+from core.scheduler import FundScheduler
 
 with open("system_prompt.txt", "r", encoding="utf-8") as prompt_file:
-    agent = Agent(prompt_file.read())
+    system_prompt = prompt_file.read()
+
+funds = load_funds()
+if len(funds) == 1:
+    agent = Agent(funds[0].get_system_prompt(system_prompt), fund=funds[0])
     agent.run()
+else:
+    FundScheduler(system_prompt, funds).run()
@@ -0,0 +1,94 @@
+# uv run python3 -m scripts.backtest [--synthetic] [--workers 8] [--out sweep.csv]
+# Sweeps a grid of rebalance strategies over the stored hourly history, in a
+# process pool, and prints the best ones. --synthetic benchmarks the engine on
+# a year of random walks for 100 coins instead
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from core.db import STORAGE_PATH
+from plugins.backtest.engine import (
+    PARAMETERS,
+    RESULT_COLUMNS,
+    make_grid,
+    sweep,
+    to_table,
+)
+from plugins.backtest.history import HISTORY_FILE, HISTORY_FOLDER, PriceHistory
+
+
+def parse_list(value: str) -> list:
+    """Comma separated numbers"""
+    return [float(v) for v in value.split(",")]
+
+
+def main():
+    """Run a sweep"""
+    parser = argparse.ArgumentParser(description="Backtest rebalance strategies")
+    parser.add_argument("--history", default=str(STORAGE_PATH / HISTORY_FOLDER))
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--hours", type=int, default=24 * 365)
+    parser.add_argument("--coins", type=int, default=100)
+    parser.add_argument("--lookback", type=parse_list, default="6,12,24,48,72,168")
+    parser.add_argument("--top-k", type=parse_list, default="3,5,10,15,20")
+    parser.add_argument("--rebalance", type=parse_list, default="1,4,8,24")
+    parser.add_argument("--buy-amount", type=parse_list, default="1,5,10,25")
+    parser.add_argument("--min-volume", type=parse_list, default="0,1e5,1e6")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--out", default=None, help="CSV file with every result")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.synthetic:
+        history = PriceHistory.synthetic(args.hours, args.coins)
+        history_path = Path(tempfile.mkdtemp(prefix="memepool-backtest-"))
+        history_path = history_path / HISTORY_FILE
+        history.save(history_path)
+    else:
+        history = PriceHistory.load(Path(args.history))
+        if history is None:
+            print(f"No history in {args.history}")
+            return
+        history_path = Path(args.history) / HISTORY_FILE
+    print(
+        f"History: {len(history)} hours, {len(history.ids)} coins "
+        f"({time.perf_counter() - start:.1f}s)"
+    )
+
+    params = make_grid(
+        lookback=args.lookback,
+        top_k=args.top_k,
+        rebalance=args.rebalance,
+        buy_amount=args.buy_amount,
+        min_volume=args.min_volume,
+    )
+
+    start = time.perf_counter()
+    results = sweep(history_path, params, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(params['top_k'])} parameter sets in {elapsed:.1f}s "
+        f"({len(params['top_k']) / elapsed:.0f} sets/s)"
+    )
+    print(to_table(params, results, args.limit))
+
+    if args.out:
+        columns = PARAMETERS + RESULT_COLUMNS
+        np.savetxt(
+            args.out,
+            np.column_stack(
+                [params[p] for p in PARAMETERS] + [results[r] for r in RESULT_COLUMNS]
+            ),
+            delimiter=",",
+            header=",".join(columns),
+            comments="",
+        )
+        print(f"Results saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
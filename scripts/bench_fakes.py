@@ -0,0 +1,465 @@
+# In-process stand-ins for the services the agent talks to, for the benchmark.
+# Nothing here touches the network: HTTP APIs are answered by a requests
+# adapter, the RPC node is a local JSON-RPC server and Gemini, twikit and praw
+# are replaced by scripted clients.
+
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from eth_abi import decode, encode
+from requests.adapters import BaseAdapter
+
+SEED = 42
+
+# Canned data sizes
+MARKET_COINS = 120
+SUBREDDIT_POSTS = 25
+NEW_TWEETS_PER_SEARCH = 5
+
+CHAIN_ID = 8453
+BLOCK_TIME = 2
+
+AGGREGATE3_SELECTOR = "82ad56cb"
+BALANCE_OF_SELECTOR = "70a08231"
+DECIMALS_SELECTOR = "313ce567"
+ALLOWANCE_SELECTOR = "dd62ed3e"
+GET_ETH_BALANCE_SELECTOR = "4d2301cc"
+
+
+def make_address(rng: random.Random) -> str:
+    """A random checksum-less address"""
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40))
+
+
+def make_markets(count: int = MARKET_COINS) -> Tuple[List[Dict], List[Dict]]:
+    """Canned CoinGecko /coins/markets and /coins/list responses"""
+    rng = random.Random(SEED)
+    markets, coins = [], []
+    for i in range(count):
+        coin_id = f"meme-{i}"
+        symbol = f"mm{i}"
+        price = rng.uniform(1e-6, 2)
+        markets.append(
+            {
+                "id": coin_id,
+                "symbol": symbol,
+                "name": f"Meme {i}",
+                "market_cap_rank": i + 1,
+                "current_price": price,
+                "market_cap": 1e9 / (i + 1),
+                "total_volume": rng.uniform(1e4, 1e8),
+                "price_change_percentage_24h": rng.gauss(0, 15),
+                "high_24h": price * rng.uniform(1, 1.3),
+                "low_24h": price * rng.uniform(0.7, 1),
+                "ath_change_percentage": -rng.uniform(0, 99),
+            }
+        )
+        coins.append(
+            {
+                "id": coin_id,
+                "symbol": symbol,
+                "name": f"Meme {i}",
+                "platforms": {"base": make_address(rng)},
+            }
+        )
+    return markets, coins
+
+
+class StubAdapter(BaseAdapter):
+    """A requests adapter that answers from in-process handlers"""
+
+    def __init__(self, routes: List[Tuple[str, str, Callable]], latency: float = 0):
+        """Init"""
+        super().__init__()
+        self.routes = routes
+        self.latency = latency
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        """Answer a request"""
+        url = urlparse(request.url)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = json.loads(request.body) if request.body else None
+
+        status, payload = 404, {"error": f"No stub for {request.method} {url.path}"}
+        for method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if request.method == method and match:
+                status, payload = handler(query, body, *match.groups())
+                break
+
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(payload).encode("utf-8")
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        """Nothing to close"""
+
+
+class StubApis:
+    """Canned CoinGecko, Fear and Greed and CoW APIs"""
+
+    def __init__(self):
+        """Init"""
+        self.markets, self.coins = make_markets()
+        self.orders: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def get_routes(self) -> Dict[str, List[Tuple[str, str, Callable]]]:
+        """Routes per host"""
+        return {
+            "api.coingecko.com": [
+                ("GET", r"/api/v3/coins/markets", self.coins_markets),
+                ("GET", r"/api/v3/coins/list", self.coins_list),
+            ],
+            "api.alternative.me": [("GET", r"/fng/", self.fear_and_greed)],
+            "api.cow.fi": [
+                ("POST", r"/base/api/v1/quote", self.cow_quote),
+                ("POST", r"/base/api/v1/orders", self.cow_submit_order),
+                ("GET", r"/base/api/v1/account/(\w+)/orders", self.cow_orders),
+            ],
+        }
+
+    def coins_markets(self, query, body):
+        """Markets, with prices moving a bit on every call"""
+        for coin in self.markets:
+            coin["price_change_percentage_24h"] += random.gauss(0, 1)
+        return 200, self.markets[: int(query.get("per_page", 100))]
+
+    def coins_list(self, query, body):
+        """Coin list"""
+        return 200, self.coins
+
+    def fear_and_greed(self, query, body):
+        """Fear and greed index"""
+        return 200, {"data": [{"value": "62", "value_classification": "Greed"}]}
+
+    def cow_quote(self, query, body):
+        """A quote at a fixed rate"""
+        sell_amount = int(body["sellAmountBeforeFee"])
+        return 200, {
+            "quote": {
+                "sellToken": body["sellToken"],
+                "buyToken": body["buyToken"],
+                "receiver": body.get("receiver") or body["from"],
+                "sellAmount": str(sell_amount),
+                "buyAmount": str(sell_amount * 1000),
+                "validTo": int(time.time()) + 600,
+                "appData": "0x" + "00" * 32,
+                "feeAmount": "0",
+                "kind": "sell",
+                "partiallyFillable": False,
+                "sellTokenBalance": "erc20",
+                "buyTokenBalance": "erc20",
+            }
+        }
+
+    def cow_submit_order(self, query, body):
+        """Accept an order, filled on the next poll"""
+        with self.lock:
+            uid = "0x" + f"{len(self.orders):0112x}"
+            self.orders[uid] = {**body, "uid": uid, "status": "open"}
+        return 201, uid
+
+    def cow_orders(self, query, body, owner):
+        """Orders of an account, most recent first. Open orders get filled"""
+        with self.lock:
+            orders = list(reversed(self.orders.values()))
+            for order in orders:
+                if order["status"] == "open":
+                    order["status"] = "fulfilled"
+                    order["executedSellAmount"] = order["sellAmount"]
+                    order["executedBuyAmount"] = str(int(order["buyAmount"]) + 1)
+        limit = int(query.get("limit", 10))
+        return 200, orders[:limit]
+
+    def mount(self, session: requests.Session, latency: float = 0):
+        """Answer the requests of a session to the stubbed hosts"""
+        for host, routes in self.get_routes().items():
+            session.mount(f"https://{host}", StubAdapter(routes, latency))
+
+
+class RpcNode:
+    """A local JSON-RPC node with just enough of the eth namespace for
+    Multicall3 balance, decimals and allowance reads"""
+
+    def __init__(self):
+        """Init"""
+        self.started = time.time()
+        self.calls = 0
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                """JSON-RPC endpoint, single and batch requests"""
+                length = int(self.headers["Content-Length"])
+                request = json.loads(self.rfile.read(length))
+                if isinstance(request, list):
+                    response = [node.handle(r) for r in request]
+                else:
+                    response = node.handle(request)
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                """Quiet"""
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(
+            target=self.server.serve_forever, name="rpc-node", daemon=True
+        ).start()
+
+    def block_number(self) -> int:
+        """A block number that moves with time"""
+        return 20_000_000 + int((time.time() - self.started) / BLOCK_TIME)
+
+    def handle(self, request: Dict) -> Dict:
+        """Answer one JSON-RPC request"""
+        self.calls += 1
+        method, params = request["method"], request.get("params", [])
+        handlers = {
+            "eth_chainId": lambda: hex(CHAIN_ID),
+            "net_version": lambda: str(CHAIN_ID),
+            "eth_blockNumber": lambda: hex(self.block_number()),
+            "eth_getCode": lambda: "0x6080",
+            "eth_getBalance": lambda: hex(10**18),
+            "eth_call": lambda: self.call(params[0]),
+            "eth_getLogs": lambda: [],
+        }
+        if method not in handlers:
+            return {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32601, "message": f"{method} not stubbed"},
+            }
+        return {"jsonrpc": "2.0", "id": request["id"], "result": handlers[method]()}
+
+    def call(self, tx: Dict) -> str:
+        """eth_call, Multicall3 aggregate3 or a single token read"""
+        data = bytes.fromhex((tx.get("data") or tx.get("input"))[2:])
+        if data[:4].hex() == AGGREGATE3_SELECTOR:
+            (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+            results = [(True, self.read(target, call)) for target, _, call in calls]
+            return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+        return "0x" + self.read(tx["to"], data).hex()
+
+    def read(self, token: str, data: bytes) -> bytes:
+        """A view call to a token: deterministic balances, 18 decimals"""
+        selector = data[:4].hex()
+        if selector == DECIMALS_SELECTOR:
+            return encode(["uint256"], [18])
+        if selector == BALANCE_OF_SELECTOR:
+            return encode(["uint256"], [int(token[-6:], 16) * 10**12])
+        if selector == ALLOWANCE_SELECTOR:
+            return encode(["uint256"], [0])
+        if selector == GET_ETH_BALANCE_SELECTOR:
+            return encode(["uint256"], [10**18])
+        return b""
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+
+
+class FakeTweetsResult(list):
+    """A page of tweets that knows how to fetch the next one"""
+
+    def __init__(self, tweets: List, older: List, count: int):
+        """Init"""
+        super().__init__(tweets)
+        self.older = older
+        self.count = count
+
+    async def next(self) -> "FakeTweetsResult":
+        """Next page"""
+        return FakeTweetsResult(
+            self.older[: self.count], self.older[self.count :], self.count
+        )
+
+
+class FakeTwikitClient:
+    """twikit Client with a timeline per query that grows on every search"""
+
+    def __init__(self, *args, **kwargs):
+        """Init"""
+        self.rng = random.Random(SEED)
+        self.timelines: Dict[str, List] = {}
+        self.next_id = 10**18
+        self.symbols = [coin["symbol"].upper() for coin in make_markets()[1]]
+
+    async def login(self, **kwargs):
+        """Nothing to log in to"""
+
+    def make_tweet(self, query: str):
+        """A tweet mentioning a few coins"""
+        self.next_id += 1
+        mentions = " ".join(f"${s}" for s in self.rng.sample(self.symbols[:40], 2))
+        return SimpleNamespace(
+            id=str(self.next_id),
+            text=f"{query} {mentions} to the moon",
+            user=SimpleNamespace(id=str(self.rng.randrange(1000)), name="degen"),
+            created_at=datetime.now(timezone.utc).isoformat(),
+            created_at_datetime=datetime.now(timezone.utc)
+            - timedelta(seconds=self.rng.randrange(3600)),
+            view_count=str(self.rng.randrange(10_000)),
+            view_count_state="EnabledWithCount",
+            favorite_count=self.rng.randrange(100),
+            retweet_count=self.rng.randrange(50),
+            reply_count=self.rng.randrange(20),
+            quote_count=self.rng.randrange(10),
+        )
+
+    async def search_tweet(
+        self, query: str, product: str, count: int = 20, cursor=None
+    ) -> FakeTweetsResult:
+        """Newest tweets of a query, first page"""
+        timeline = self.timelines.setdefault(query, [])
+        new = [self.make_tweet(query) for _ in range(NEW_TWEETS_PER_SEARCH)]
+        timeline[:0] = reversed(new)
+        return FakeTweetsResult(timeline[:count], timeline[count:], count)
+
+
+class FakeSubreddit:
+    """A subreddit whose posts gain score on every listing"""
+
+    def __init__(self, name: str, posts: List):
+        """Init"""
+        self.name = name
+        self.posts = posts
+
+    def hot(self, limit: int = 10):
+        """Hot posts"""
+        for post in self.posts:
+            post.score += random.randrange(0, 30)
+        return iter(self.posts[:limit])
+
+
+class FakeReddit:
+    """praw.Reddit with canned subreddits"""
+
+    subreddits: Dict[str, FakeSubreddit] = {}
+    lock = threading.Lock()
+
+    def __init__(self, **kwargs):
+        """Init"""
+
+    def subreddit(self, name: str) -> FakeSubreddit:
+        """Get a subreddit"""
+        with self.lock:
+            if name not in self.subreddits:
+                rng = random.Random(f"{SEED}-{name}")
+                self.subreddits[name] = FakeSubreddit(
+                    name,
+                    [
+                        SimpleNamespace(
+                            id=f"{name}-{i}",
+                            title=f"Is $MM{rng.randrange(40)} the next 100x? {name}",
+                            score=rng.randrange(1000),
+                            num_comments=rng.randrange(200),
+                            url=f"https://reddit.com/r/{name}/{i}",
+                        )
+                        for i in range(SUBREDDIT_POSTS)
+                    ],
+                )
+            return self.subreddits[name]
+
+
+class ScriptedChat:
+    """A Gemini chat that answers with scripted function calls. Raises
+    KeyboardInterrupt once the script is over, which stops Agent.run"""
+
+    def __init__(self, genai, script: List[List[Dict]]):
+        """Init"""
+        self.genai = genai
+        self.script = script
+        self.turn = 0
+        self.history = []
+        # Function responses with an error, as (name, error)
+        self.errors = []
+
+    def respond(self, message):
+        """Record the message and build the next scripted response"""
+        if self.turn >= len(self.script):
+            raise KeyboardInterrupt
+        protos = self.genai.protos
+        parts = (
+            [protos.Part(text=message)] if isinstance(message, str) else list(message)
+        )
+        self.history.append(protos.Content(role="user", parts=parts))
+        for part in parts:
+            response = part.function_response
+            if response.name and "error" in response.response:
+                self.errors.append((response.name, response.response["error"]))
+
+        calls = self.script[self.turn]
+        self.turn += 1
+        content = protos.Content(
+            role="model",
+            parts=[
+                protos.Part(
+                    function_call=protos.FunctionCall(name=c["name"], args=c["args"])
+                )
+                for c in calls
+            ]
+            or [protos.Part(text="Nothing to do")],
+        )
+        self.history.append(content)
+
+        prompt_tokens = sum(len(type(c).to_json(c)) for c in self.history) // 4
+        return SimpleNamespace(
+            parts=content.parts,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens, candidates_token_count=20
+            ),
+        )
+
+    def send_message(self, message):
+        """Answer a message"""
+        return self.respond(message)
+
+    async def send_message_async(self, message):
+        """Answer a message"""
+        return self.respond(message)
+
+
+class ScriptedModel:
+    """genai.GenerativeModel that starts scripted chats"""
+
+    genai = None
+    script: Optional[List[List[Dict]]] = None
+    # Every chat started, to check their function responses
+    chats: List[ScriptedChat] = []
+
+    def __init__(self, model_name: str, tools=None):
+        """Init"""
+        self.model_name = model_name
+        self.tools = tools
+
+    def start_chat(self) -> ScriptedChat:
+        """Start a chat"""
+        chat = ScriptedChat(self.genai, self.script)
+        self.chats.append(chat)
+        return chat
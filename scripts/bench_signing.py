@@ -0,0 +1,94 @@
+# uv run python3 -m scripts.bench_signing [--orders 8,32,256]
+# Signs batches of random orders with the per-order EIP-712 path that
+# CowSwap.sign_order uses and with the bulk OrderSigner, checks that both give
+# the same signatures and prints the timings. Uses a throwaway key
+import argparse
+import os
+import time
+
+from eth_account import Account
+from eth_account.messages import _hash_eip191_message
+
+from plugins.cowswap.plugin import (
+    BASE_CHAIN_ID,
+    BASE_GPV2_SETTLEMENT,
+    SAFE_ADDRESS,
+    USDC_ADDRESS_BASE,
+    Order,
+    SafeMessage,
+)
+from plugins.cowswap.signing import OrderSigner
+
+
+def make_orders(count: int) -> list:
+    """Random USDC sell orders"""
+    return [
+        Order(
+            sellToken=USDC_ADDRESS_BASE,
+            buyToken=Account.create().address,
+            receiver=SAFE_ADDRESS,
+            sellAmount=10**6 + i,
+            buyAmount=int.from_bytes(os.urandom(12), "big"),
+            validTo=int(time.time()) + 600,
+            appData=bytes(32),
+            feeAmount=0,
+            kind="sell",
+            partiallyFillable=False,
+            sellTokenBalance="erc20",
+            buyTokenBalance="erc20",
+        )
+        for i in range(count)
+    ]
+
+
+def sign_one_by_one(account, orders: list) -> list:
+    """The per-order path: EIP-712 messages hashed and signed one at a time"""
+    signatures = []
+    for order in orders:
+        order_digest = _hash_eip191_message(order.signable_message)
+        safe_message = SafeMessage(message=order_digest)
+        signature = account.sign_message(safe_message.signable_message)
+        signatures.append(
+            signature.r.to_bytes(32, "big")
+            + signature.s.to_bytes(32, "big")
+            + bytes([signature.v])
+        )
+    return signatures
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark order signing")
+    parser.add_argument("--orders", default="8,32,256")
+    args = parser.parse_args()
+
+    account = Account.create()
+    signer = OrderSigner(
+        account.key.hex(),
+        BASE_CHAIN_ID,
+        BASE_GPV2_SETTLEMENT,
+        SAFE_ADDRESS,
+    )
+
+    print("orders|per_order_s|bulk_s|speedup|orders_per_s")
+    for count in [int(c) for c in args.orders.split(",")]:
+        orders = make_orders(count)
+
+        start = time.perf_counter()
+        expected = sign_one_by_one(account, orders)
+        per_order = time.perf_counter() - start
+
+        start = time.perf_counter()
+        signatures = signer.sign_orders(orders)
+        bulk = time.perf_counter() - start
+
+        if signatures != expected:
+            raise SystemExit(f"Signatures differ for {count} orders")
+        print(
+            f"{count}|{per_order:.4f}|{bulk:.4f}|{per_order / bulk:.1f}x|"
+            f"{count / bulk:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
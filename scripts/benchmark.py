@@ -0,0 +1,314 @@
+# uv run python3 -m scripts.benchmark [--rounds 20] [--async] [--latency 0.05]
+# Runs the agent loop and the plugins against in-process fakes and compares the
+# results with the stored baseline. --save-baseline stores the current results.
+# Nothing touches the network, and no real funds or accounts are involved.
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASELINE_FILE = Path(__file__).parent / "benchmark_baseline.json"
+
+# Slower than the baseline by more than this fraction counts as a regression
+REGRESSION_THRESHOLD = 0.25
+
+# Latencies below this many seconds are noise, never regressions
+MIN_COMPARED_SECONDS = 0.005
+
+# Tool calls requested by the scripted model on every round
+ROUND_CALLS = [
+    {"name": "coingecko_get_base_memecoins_tool", "args": {}},
+    {"name": "fearandgreedindex_get_index_tool", "args": {}},
+    {
+        "name": "reddit_get_top_posts_tool",
+        "args": {"subreddit_name": "memecoins", "posts_limit": 10},
+    },
+    {"name": "reddit_get_new_posts_tool", "args": {}},
+    {"name": "twitter_search_tweet_tool", "args": {"query": "$MM1", "count": 20}},
+    {
+        "name": "twitter_search_batch_tool",
+        "args": {"queries": ["$MM1", "$MM2", "$MM3", "base memecoins"]},
+    },
+    {
+        "name": "ledger_get_balances_tool",
+        "args": {
+            "token_addresses": [
+                "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+                "0x4200000000000000000000000000000000000006",
+            ],
+            "wallet_address": "0x44CBf6E9b4473EFC47BBE8198d19929E3Bc5552c",
+        },
+    },
+    {"name": "signals_rank_memecoins_tool", "args": {"limit": 20}},
+    {"name": "core_sleep", "args": {"seconds": 0}},
+]
+
+# Orders quoted, submitted and tracked by the CoW benchmark
+COW_ORDERS = 20
+
+
+def configure_environment(storage_path: Path, rpc_url: str):
+    """Point the agent and the plugins to the fakes. Must run before core and
+    the plugins are imported, as they read it at import time"""
+    dummy_key = "0x" + "11" * 32
+    os.environ.update(
+        {
+            "MEMEPOOL_STORAGE_PATH": str(storage_path),
+            "GEMINI_API_KEY": "benchmark",
+            "REDDIT_CLIENT_ID": "benchmark",
+            "REDDIT_CLIENT_SECRET": "benchmark",
+            "LEDGER_BASE_RPC": rpc_url,
+            "LEDGER_PRIVATE_KEY": dummy_key,
+            "COINGECKO_API_KEY": "benchmark",
+            "METRICS_FILES": "1",
+        }
+    )
+    for name in (
+        "MAIN_CONSUMER_KEY",
+        "MAIN_CONSUMER_SECRET",
+        "MAIN_BEARER_TOKEN",
+        "MAIN_ACCESS_TOKEN",
+        "MAIN_ACCESS_SECRET",
+        "MAIN_CLIENT_ID",
+        "MAIN_CLIENT_SECRET",
+        "SECONDARY_EMAIL",
+        "SECONDARY_USER",
+        "SECONDARY_PASSWORD",
+    ):
+        os.environ[f"TWITTER_{name}"] = "benchmark"
+
+
+def install_fakes(fakes, script, latency: float):
+    """Replace the clients of the agent and the plugins with the fakes"""
+    import core.limiter
+
+    # Measure the agent, not the upstream rate limits. Set before the plugins
+    # are imported, as their rate limited tools get their bucket then
+    for upstream in core.limiter.UPSTREAM_LIMITS:
+        core.limiter.UPSTREAM_LIMITS[upstream] = {"rate": 1000, "capacity": 1000}
+
+    import core.agent
+    import core.plugin
+    import plugins.reddit.plugin
+    import plugins.twitter.plugin
+    from core.http import get_client
+
+    # A real .env would point the plugins back to the live services
+    core.agent.load_dotenv = lambda **kwargs: None
+    core.plugin.load_dotenv = lambda **kwargs: None
+
+    fakes.ScriptedModel.genai = core.agent.genai
+    fakes.ScriptedModel.chats = []
+    fakes.ScriptedModel.script = script
+    core.agent.genai.GenerativeModel = fakes.ScriptedModel
+
+    apis = fakes.StubApis()
+    apis.mount(get_client().session, latency)
+    plugins.twitter.plugin.Client = fakes.FakeTwikitClient
+    plugins.reddit.plugin.praw.Reddit = fakes.FakeReddit
+    return apis
+
+
+def percentile(samples, fraction: float) -> float:
+    """Percentile of a list of samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_agent(rounds: int, async_mode: bool) -> dict:
+    """Run Agent.run through the scripted chat and collect the turn stats"""
+    from core.agent import Agent
+    from core.metrics import EVENTS_FILE
+
+    start = time.perf_counter()
+    agent = Agent("Benchmark", async_mode=async_mode)
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    agent.run()
+    elapsed = time.perf_counter() - start
+
+    turns = []
+    with open(EVENTS_FILE, "r", encoding="utf-8") as events_file:
+        for line in events_file:
+            event = json.loads(line)
+            if event["event"] == "turn":
+                turns.append(event)
+
+    tools = {}
+    for turn in turns:
+        for call in turn["tools"]:
+            tools.setdefault(call["name"], []).append(call)
+
+    return {
+        "startup_seconds": round(startup, 4),
+        "startup_stages": {k: round(v, 4) for k, v in agent.startup.items()},
+        "plugins": agent.loader.profile,
+        "turns": len(turns),
+        "turns_per_second": round(len(turns) / elapsed, 2),
+        "turn_p50_seconds": round(percentile([t["seconds"] for t in turns], 0.5), 4),
+        "tools": {
+            name: {
+                "calls": len(calls),
+                "errors": sum("error" in c for c in calls),
+                "p50_seconds": round(percentile([c["seconds"] for c in calls], 0.5), 4),
+                "p95_seconds": round(
+                    percentile([c["seconds"] for c in calls], 0.95), 4
+                ),
+            }
+            for name, calls in sorted(tools.items())
+        },
+    }
+
+
+def run_cow(apis) -> dict:
+    """Quote, submit and track orders against the stub CoW API"""
+    from core.http import get_client
+    from plugins.cowswap.orders import OrderTracker
+
+    base_url = "https://api.cow.fi/base"
+    owner = "0x44CBf6E9b4473EFC47BBE8198d19929E3Bc5552c"
+    http = get_client()
+    tracker = OrderTracker(http, base_url, owner)
+
+    latencies = []
+    start = time.perf_counter()
+    for coin in apis.coins[:COW_ORDERS]:
+        order_start = time.perf_counter()
+        quote = http.post(
+            f"{base_url}/api/v1/quote",
+            json={
+                "sellToken": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+                "buyToken": coin["platforms"]["base"],
+                "from": owner,
+                "sellAmountBeforeFee": str(10**6),
+            },
+        ).json()["quote"]
+        uid = http.post(f"{base_url}/api/v1/orders", json=quote).json()
+        tracker.add(uid, quote)
+        latencies.append(time.perf_counter() - order_start)
+
+    poll_start = time.perf_counter()
+    still_open = tracker.poll()
+    poll = time.perf_counter() - poll_start
+
+    return {
+        "orders": COW_ORDERS,
+        "order_p50_seconds": round(statistics.median(latencies), 4),
+        "poll_seconds": round(poll, 4),
+        "still_open": still_open,
+        "total_seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def flatten(results: dict) -> dict:
+    """The compared numbers, as {name: (value, higher_is_better)}"""
+    flat = {
+        "startup_seconds": (results["agent"]["startup_seconds"], False),
+        "turns_per_second": (results["agent"]["turns_per_second"], True),
+        "turn_p50_seconds": (results["agent"]["turn_p50_seconds"], False),
+        "cow.order_p50_seconds": (results["cow"]["order_p50_seconds"], False),
+        "cow.poll_seconds": (results["cow"]["poll_seconds"], False),
+    }
+    for name, stats in results["agent"]["tools"].items():
+        flat[f"tool.{name}.p50_seconds"] = (stats["p50_seconds"], False)
+    return flat
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Print the results next to the baseline and return the regressions"""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    print(f"{'metric':<60} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous or not previous[name][0]:
+            print(f"{name:<60} {'-':>10} {value:>10} {'new':>8}")
+            continue
+        before = previous[name][0]
+        change = (value - before) / before
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > REGRESSION_THRESHOLD and (
+            higher_is_better or max(value, before) > MIN_COMPARED_SECONDS
+        ):
+            flag = " REGRESSION"
+            regressions.append(name)
+        print(f"{name:<60} {before:>10} {value:>10} {change:>+8.0%}{flag}")
+    return regressions
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--async", dest="async_mode", action="store_true")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds added to every HTTP stub"
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    storage_path = Path(tempfile.mkdtemp(prefix="memepool-benchmark-"))
+
+    # The fakes need web3 and requests, but not the agent
+    from scripts import bench_fakes
+
+    node = bench_fakes.RpcNode()
+    configure_environment(storage_path, node.url)
+
+    # A text-only turn between rounds, like the model thinking out loud
+    script = [ROUND_CALLS, []] * args.rounds
+    apis = install_fakes(bench_fakes, script, args.latency)
+
+    results = {
+        "rounds": args.rounds,
+        "async": args.async_mode,
+        "latency": args.latency,
+        "agent": run_agent(args.rounds, args.async_mode),
+        "cow": run_cow(apis),
+        "rpc_calls": node.calls,
+    }
+    node.stop()
+    print(json.dumps(results, indent=2, default=str))
+
+    # Timings of failing tools mean nothing
+    errors = [
+        error for chat in bench_fakes.ScriptedModel.chats for error in chat.errors
+    ]
+    if errors:
+        for name, error in dict(errors).items():
+            print(f"{name} failed: {error}")
+        print(f"{len(errors)} tool calls failed")
+        sys.exit(1)
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2, default=str)
+        print(f"Baseline saved to {BASELINE_FILE}")
+        return
+
+    if not BASELINE_FILE.exists():
+        print("No baseline yet. Run with --save-baseline to store one")
+        return
+
+    with open(BASELINE_FILE, "r", encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    if (baseline["rounds"], baseline["async"], baseline["latency"]) != (
+        args.rounds,
+        args.async_mode,
+        args.latency,
+    ):
+        print("The baseline was taken with other settings, comparing anyway")
+
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"{len(regressions)} regressions: {regressions}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+# uv run python3 -m scripts.profile_startup
+# Builds the plugin manifest, then loads every plugin to time its import and init
+from core.loader import PluginLoader
+
+loader = PluginLoader()
+loader.load_manifest()
+loader.load_all()
+print(loader.report())
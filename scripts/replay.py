@@ -0,0 +1,77 @@
+# uv run python3 -m scripts.replay [cassettes/session.jsonl.gz] [--async]
+# Replays a session recorded with CASSETTE_MODE=record. The model, HTTP and RPC
+# responses come from the cassette and time is virtual, so a long session runs
+# in seconds. The replay uses a temporary storage folder, so that the caches
+# and checkpoints of the recording machine do not change what gets requested.
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Files copied from the real storage folder into the replay one. Twikit only
+# logs in again when its cookies are missing
+COPIED_FILES = ["twikit_cookies.json"]
+
+
+def main():
+    """Replay a session"""
+    parser = argparse.ArgumentParser(description="Replay a recorded session")
+    parser.add_argument("cassette", nargs="?", default=None)
+    parser.add_argument("--async", dest="async_mode", action="store_true")
+    parser.add_argument("--prompt", default=str(ROOT / "system_prompt.txt"))
+    args = parser.parse_args()
+
+    storage_path = Path(tempfile.mkdtemp(prefix="memepool-replay-"))
+    real_storage_path = Path(os.environ.get("MEMEPOOL_STORAGE_PATH", ROOT))
+    for name in COPIED_FILES:
+        if (real_storage_path / name).exists():
+            shutil.copy(real_storage_path / name, storage_path / name)
+
+    # Read at import time, and the cassette is created before the agent loads
+    # the .env, so that it can not switch the replay back to recording
+    os.environ["MEMEPOOL_STORAGE_PATH"] = str(storage_path)
+    os.environ["CASSETTE_MODE"] = "replay"
+    if args.cassette:
+        os.environ["CASSETTE_PATH"] = args.cassette
+    os.environ.setdefault("GEMINI_API_KEY", "replay")
+
+    from core.agent import Agent
+    from core.cassette import get_cassette
+    from core.clock import clock
+
+    cassette = get_cassette()
+    with open(args.prompt, "r", encoding="utf-8") as prompt_file:
+        agent = Agent(prompt_file.read(), async_mode=args.async_mode)
+
+    start = time.perf_counter()
+    agent.run()
+    elapsed = time.perf_counter() - start
+
+    stats = cassette.stats()
+    print(
+        json.dumps(
+            {
+                "turns": agent.turns,
+                "wall_seconds": round(elapsed, 2),
+                "session_seconds": round(clock.time() - cassette.started, 2),
+                "calls": stats,
+                "storage": str(storage_path),
+            },
+            indent=2,
+        )
+    )
+
+    # Misses and diverged model turns mean the code no longer does what it did
+    # when the session was recorded
+    if any(outcome in ("miss", "diverged") for s in stats.values() for outcome in s):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Keep the local database and snapshots of the tests out of the repo. Set
+# before core.db is imported, which reads it once
+os.environ.setdefault("MEMEPOOL_STORAGE_PATH", tempfile.mkdtemp(prefix="memepool-"))
@@ -0,0 +1,16 @@
+from typing import Optional
+
+from core.agent import coerce_ints
+
+
+def test_int_parameters_get_whole_numbers():
+    """Float args of int parameters become ints, other args are kept"""
+
+    def tool(limit: int, count: Optional[int] = None, seconds: float = 0):
+        """A tool"""
+
+    kwargs = coerce_ints(tool, {"limit": 20.0, "count": 5.0, "seconds": 1.0})
+
+    assert kwargs == {"limit": 20, "count": 5, "seconds": 1.0}
+    assert isinstance(kwargs["limit"], int)
+    assert isinstance(kwargs["seconds"], float)
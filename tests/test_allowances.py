@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from plugins.cowswap.allowances import AllowanceManager
+
+OWNER = "0x0000000000000000000000000000000000000001"
+SPENDER = "0x0000000000000000000000000000000000000002"
+TOKEN = "0x0000000000000000000000000000000000000003"
+
+
+class StubMulticall:
+    """A multicall where nothing is approved yet"""
+
+    def get_allowances(self, owner, spender, tokens):
+        """No allowance for any token"""
+        time.sleep(0.01)
+        return {token: 0 for token in tokens}
+
+
+def test_concurrent_callers_share_one_approval():
+    """Callers needing the same missing approval wait for a single Safe tx"""
+    sent = []
+    mined = threading.Event()
+
+    def send_approvals(tokens):
+        sent.append(tokens)
+        time.sleep(0.01)
+        return "tx"
+
+    manager = AllowanceManager(
+        StubMulticall(), OWNER, SPENDER, send_approvals, lambda tx: mined.wait(5)
+    )
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(manager.ensure({TOKEN: 1})))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    mined.set()
+
+    assert len(sent) == 1
+    futures = {id(result[TOKEN]) for result in results}
+    assert len(futures) == 1
+    assert results[0][TOKEN].result(timeout=5)
+    # Once mined, the allowance is cached
+    assert manager.ensure({TOKEN: 1}) == {TOKEN: None}
+
+
+def test_failed_send_lets_the_next_caller_retry():
+    """An approval that could not be sent is not left pending"""
+    calls = []
+
+    def send_approvals(tokens):
+        calls.append(tokens)
+        if len(calls) == 1:
+            raise RuntimeError("RPC down")
+        return "tx"
+
+    manager = AllowanceManager(
+        StubMulticall(), OWNER, SPENDER, send_approvals, lambda tx: True
+    )
+
+    with pytest.raises(RuntimeError):
+        manager.ensure({TOKEN: 1})
+    assert manager.ensure({TOKEN: 1})[TOKEN].result(timeout=5)
+    assert len(calls) == 2
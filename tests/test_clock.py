@@ -0,0 +1,30 @@
+import asyncio
+
+from core.clock import Clock
+
+
+def test_concurrent_sleeps_overlap():
+    """Sleeps of 4s and 8s started together take 8s of virtual time"""
+    clock = Clock()
+    clock.start_virtual(1000)
+
+    async def sleeper(seconds: float, start: float):
+        await clock.sleep_async(seconds, start)
+
+    async def main():
+        start = clock.time()
+        await asyncio.gather(sleeper(4, start), sleeper(8, start))
+
+    asyncio.run(main())
+    assert clock.time() == 1008
+
+
+def test_sequential_sleeps_add_up():
+    """Sleeps one after the other still move the time by their sum"""
+    clock = Clock()
+    clock.start_virtual(1000)
+
+    clock.sleep(4)
+    clock.sleep(8)
+
+    assert clock.time() == 1012
@@ -0,0 +1,14 @@
+from core.loader import source_hash
+
+
+def test_helper_module_changes_the_hash(tmp_path):
+    """A change to a module next to plugin.py declares the plugin again"""
+    folder = tmp_path / "example"
+    folder.mkdir()
+    (folder / "plugin.py").write_text("from plugins.example.search import MAX_PAGES\n")
+    (folder / "search.py").write_text("MAX_PAGES = 5\n")
+    digest = source_hash(folder)
+
+    assert source_hash(folder) == digest
+    (folder / "search.py").write_text("MAX_PAGES = 10\n")
+    assert source_hash(folder) != digest
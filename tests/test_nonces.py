@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+from eth_account import Account
+
+from plugins.cowswap.nonces import SafeNonceManager
+
+# A throwaway key
+PRIVATE_KEY = "0x" + "42" * 32
+SENDER = Account.from_key(PRIVATE_KEY).address
+
+
+class StubSafe:
+    """A Safe whose nonce only moves when a transaction executes"""
+
+    def __init__(self, nonce: int):
+        """Init"""
+        self.nonce = nonce
+
+    def retrieve_nonce(self) -> int:
+        """The on-chain Safe nonce"""
+        return self.nonce
+
+
+class StubEth:
+    """The eth module of a chain where every transaction is already mined"""
+
+    def __init__(self, tx_count: int):
+        """Init"""
+        self.tx_count = tx_count
+        self.block_number = 100
+        self.receipts = {}
+
+    def get_transaction_count(self, address, block_identifier):
+        """Signer nonce"""
+        return self.tx_count
+
+    def wait_for_transaction_receipt(self, tx_hash, timeout, poll_latency):
+        """The receipt, at once"""
+        return self.receipts[tx_hash]
+
+    def get_transaction_receipt(self, tx_hash):
+        """The receipt, at once"""
+        return self.receipts[tx_hash]
+
+
+def make_tx(nonce: int) -> dict:
+    """A Safe execTransaction as returned by SafeTx.execute"""
+    return {
+        "to": SENDER,
+        "value": 0,
+        "gas": 100_000,
+        "gasPrice": 1,
+        "nonce": nonce,
+        "chainId": 8453,
+        "data": b"",
+    }
+
+
+def send(manager: SafeNonceManager, eth: StubEth, tx_hash: bytes, status: int):
+    """Reserve nonces and send a transaction that gets mined with a status"""
+    safe_nonce, tx_nonce = manager.reserve()
+    manager.sent(safe_nonce, tx_hash, make_tx(tx_nonce))
+    eth.tx_count = tx_nonce + 1
+    eth.receipts[tx_hash] = SimpleNamespace(
+        status=status, blockNumber=90, blockHash=tx_hash
+    )
+    return safe_nonce, tx_nonce
+
+
+def test_nonces_are_handed_out_locally():
+    """Pipelined transactions get consecutive nonces without reading the chain"""
+    safe, eth = StubSafe(5), StubEth(10)
+    manager = SafeNonceManager(safe, SimpleNamespace(eth=eth), PRIVATE_KEY)
+
+    assert manager.reserve() == (5, 10)
+    assert manager.reserve() == (6, 11)
+
+
+def test_reverted_transaction_resyncs_the_safe_nonce():
+    """A reverted execTransaction does not use its Safe nonce up, so it is
+    handed out again instead of the ones queued behind it"""
+    safe, eth = StubSafe(5), StubEth(10)
+    manager = SafeNonceManager(safe, SimpleNamespace(eth=eth), PRIVATE_KEY)
+
+    assert send(manager, eth, b"reverted", status=0) == (5, 10)
+    # Pipelined behind it, it can only fail with GS026
+    assert send(manager, eth, b"doomed", status=0) == (6, 11)
+
+    assert manager.wait(5, b"reverted") is False
+    assert manager.in_flight == {}
+    assert manager.reserve() == (5, 12)
+
+
+def test_executed_transaction_keeps_the_local_nonces():
+    """Successful transactions do not make the manager read the chain again"""
+    safe, eth = StubSafe(5), StubEth(10)
+    manager = SafeNonceManager(safe, SimpleNamespace(eth=eth), PRIVATE_KEY)
+
+    send(manager, eth, b"executed", status=1)
+    safe.nonce = 6
+
+    assert manager.wait(5, b"executed") is True
+    assert manager.reserve() == (6, 11)
@@ -0,0 +1,144 @@
+import time
+import uuid
+
+import pytest
+
+from plugins.cowswap.orders import CowOrder, OrderTracker, order_to_json
+
+API_URL = "https://cow.test/base"
+OWNER = "0x0000000000000000000000000000000000000001"
+
+
+class StubResponse:
+    """A requests response with a JSON body"""
+
+    def __init__(self, data):
+        """Init"""
+        self.data = data
+
+    def raise_for_status(self):
+        """Always a 200"""
+
+    def json(self):
+        """The body"""
+        return self.data
+
+
+class StubHttpClient:
+    """An HttpClient that answers the account orders endpoint"""
+
+    def __init__(self, orders):
+        """Init"""
+        self.orders = orders
+        self.calls = []
+
+    def get(self, url, params=None, **kwargs):
+        """Return the account orders"""
+        self.calls.append((url, params))
+        return StubResponse(self.orders)
+
+
+def make_order(valid_to):
+    """Order fields as sent to CoW"""
+    return {
+        "sellToken": "0xsell",
+        "buyToken": "0xbuy",
+        "sellAmount": 1_000,
+        "buyAmount": 2_000,
+        "validTo": valid_to,
+    }
+
+
+@pytest.fixture
+def tracker_factory():
+    """Trackers with their own orders table"""
+
+    def factory(orders):
+        http = StubHttpClient(orders)
+        return http, OrderTracker(http, API_URL, OWNER, scope=uuid.uuid4().hex[:8])
+
+    return factory
+
+
+def test_order_to_json_open_order():
+    """An order without executions has no fill price nor surplus"""
+    order = CowOrder(
+        uid="0x01",
+        sell_token="0xsell",
+        buy_token="0xbuy",
+        sell_amount="1000",
+        buy_amount="2000",
+        valid_to=0,
+    )
+
+    data = order_to_json(order)
+
+    assert data["filled"] == 0
+    assert data["executed_sell_amount"] == "0"
+    assert "fill_price" not in data
+    assert "surplus" not in data
+
+
+def test_order_to_json_partial_fill_surplus():
+    """Surplus is measured over the limit price of the executed part"""
+    order = CowOrder(
+        uid="0x01",
+        sell_token="0xsell",
+        buy_token="0xbuy",
+        sell_amount="1000",
+        buy_amount="2000",
+        valid_to=0,
+        executed_sell_amount="250",
+        executed_buy_amount="520",
+    )
+
+    data = order_to_json(order)
+
+    assert data["filled"] == 0.25
+    assert data["fill_price"] == 520 / 250
+    # The limit price asks for 2 buy tokens per sell token: 500 for 250 sold
+    assert data["surplus"] == "20"
+
+
+def test_poll_updates_returned_orders(tracker_factory):
+    """Orders returned by the API get their status and executed amounts"""
+    http, tracker = tracker_factory(
+        [
+            {
+                "uid": "0x01",
+                "status": "fulfilled",
+                "executedSellAmount": "1000",
+                "executedBuyAmount": "2100",
+            }
+        ]
+    )
+    tracker.add("0x01", make_order(int(time.time()) + 600))
+
+    assert tracker.poll() == 0
+    assert http.calls[0][0] == f"{API_URL}/api/v1/account/{OWNER}/orders"
+
+    (data,) = tracker.get_recent_orders()
+    assert data["status"] == "fulfilled"
+    assert data["filled"] == 1
+    assert data["surplus"] == "100"
+
+
+def test_poll_expires_missing_orders_past_valid_to(tracker_factory):
+    """Orders the API does not return expire once past validTo"""
+    now = int(time.time())
+    _, tracker = tracker_factory([])
+    tracker.add("0xold", make_order(now - 10))
+    tracker.add("0xnew", make_order(now + 600))
+
+    assert tracker.poll() == 1
+
+    statuses = {o["uid"]: o["status"] for o in tracker.get_recent_orders()}
+    assert statuses == {"0xold": "expired", "0xnew": "open"}
+
+
+def test_poll_without_open_orders_makes_no_request(tracker_factory):
+    """Nothing to track, nothing to ask"""
+    http, tracker = tracker_factory([])
+
+    assert tracker.poll() == 0
+    assert http.calls == []
@@ -0,0 +1,101 @@
+import pytest
+
+from plugins.cowswap.planner import plan_rebalance, reroute_leg
+
+USDC = "0xusdc"
+A = "0xaaaa"
+B = "0xbbbb"
+C = "0xcccc"
+
+BALANCES = {
+    USDC: {"balance_wei": 100 * 10**6, "decimals": 6},
+    A: {"balance_wei": 100 * 10**18, "decimals": 18},
+    B: {"balance_wei": 0, "decimals": 18},
+    C: {"balance_wei": 10 * 10**18, "decimals": 18},
+}
+
+PRICES = {A: 2.0, B: 1.0, C: 10.0}
+
+
+def test_sells_are_netted_into_direct_swaps():
+    """$100 of A and all of C, which has no target, buy $200 of B"""
+    plan = plan_rebalance(BALANCES, PRICES, {A: 0.25, B: 0.5}, USDC)
+
+    assert plan["total_usd"] == 400
+    assert plan["current_weights"] == {USDC: 0.25, A: 0.5, C: 0.25}
+    assert plan["legs"] == [
+        {
+            "token": A,
+            "side": "swap",
+            "sell_token": A,
+            "buy_token": B,
+            "sell_amount": 50 * 10**18,
+            "usd": 100.0,
+        },
+        {
+            "token": C,
+            "side": "swap",
+            "sell_token": C,
+            "buy_token": B,
+            "sell_amount": 10 * 10**18,
+            "usd": 100.0,
+        },
+    ]
+    assert plan["cash_left_usd"] == 100
+    assert plan["deferred_usd"] == 0
+    assert plan["skipped"] == []
+
+
+def test_remainders_go_through_the_quote_token():
+    """Without buys to net against, sells go to the quote token and buys use it"""
+    plan = plan_rebalance(BALANCES, PRICES, {A: 0.25, C: 0.25}, USDC)
+
+    assert [(leg["side"], leg["token"], leg["usd"]) for leg in plan["legs"]] == [
+        ("sell", A, 100.0)
+    ]
+
+    plan = plan_rebalance(BALANCES, PRICES, {A: 0.5, B: 0.25, C: 0.25}, USDC)
+
+    (leg,) = plan["legs"]
+    assert leg["side"] == "buy"
+    assert (leg["sell_token"], leg["buy_token"]) == (USDC, B)
+    assert leg["sell_amount"] == 100 * 10**6
+    assert plan["cash_left_usd"] == 0
+
+
+def test_small_differences_and_unpriced_tokens_are_skipped():
+    """Differences below the min order are not traded, unpriced tokens are reported"""
+    plan = plan_rebalance(
+        BALANCES, PRICES, {A: 0.498, C: 0.25, "0xdddd": 0.1}, USDC, min_order_usd=1.0
+    )
+
+    assert plan["skipped"] == [
+        {"token": "0xdddd", "reason": "No price"},
+        {"token": A, "reason": "Below min order"},
+    ]
+    assert plan["legs"] == []
+
+
+@pytest.mark.parametrize("targets", [{A: -0.1}, {A: 0.6, B: 0.6}])
+def test_invalid_weights_are_rejected(targets):
+    """Weights must be positive and add up to 1 at most"""
+    with pytest.raises(ValueError):
+        plan_rebalance(BALANCES, PRICES, targets, USDC)
+
+
+def test_reroute_leg_splits_a_swap_through_the_quote_token():
+    """A swap that could not be quoted becomes a sell and a buy"""
+    leg = {
+        "token": B,
+        "side": "swap",
+        "sell_token": A,
+        "buy_token": B,
+        "sell_amount": 5,
+        "usd": 10.0,
+    }
+
+    sell, buy = reroute_leg(leg, USDC, buy_amount=7)
+
+    assert (sell["side"], sell["buy_token"], sell["sell_amount"]) == ("sell", USDC, 5)
+    assert (buy["side"], buy["sell_token"], buy["sell_amount"]) == ("buy", USDC, 7)
+    assert reroute_leg(leg, USDC, buy_amount=0) == [sell]
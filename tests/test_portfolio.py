@@ -0,0 +1,71 @@
+import pytest
+
+from plugins.cowswap.portfolio import PortfolioLedger
+
+OWNER = "0x0000000000000000000000000000000000000001"
+USDC = "0x0000000000000000000000000000000000000002"
+TOKEN_A = "0x0000000000000000000000000000000000000003"
+TOKEN_B = "0x0000000000000000000000000000000000000004"
+
+
+def make_positions(ledger):
+    """Positions holding two tokens and some cash"""
+    return {
+        USDC: ledger.positions(
+            token=USDC, balance_wei=str(10 * 10**6), decimals=6, cost_basis=10
+        ),
+        TOKEN_A: ledger.positions(
+            token=TOKEN_A, balance_wei=str(10 * 10**18), decimals=18, cost_basis=100
+        ),
+        TOKEN_B: ledger.positions(
+            token=TOKEN_B, balance_wei=str(5 * 10**18), decimals=18, cost_basis=50
+        ),
+    }
+
+
+def test_two_sells_for_one_buy():
+    """A batch settlement selling two tokens for cash realizes both of them"""
+    ledger = PortfolioLedger(None, None, OWNER, USDC, scope="batch_test")
+    positions = make_positions(ledger)
+    flow = {TOKEN_A: -(10 * 10**18), TOKEN_B: -(5 * 10**18), USDC: 180 * 10**6}
+
+    ledger.apply_flow("0x01", 1, flow, positions)
+
+    assert positions[TOKEN_A].cost_basis == 0
+    assert positions[TOKEN_B].cost_basis == 0
+    assert positions[TOKEN_A].realized_pnl == pytest.approx(20)
+    assert positions[TOKEN_B].realized_pnl == pytest.approx(10)
+    assert positions[USDC].cost_basis == pytest.approx(190)
+
+    trades = {trade["sell_token"]: trade for trade in ledger.get_trades()}
+    assert trades[TOKEN_A]["buy_amount"] == str(120 * 10**6)
+    assert trades[TOKEN_B]["buy_amount"] == str(60 * 10**6)
+    assert trades[TOKEN_A]["value"] == pytest.approx(120)
+
+
+def test_cash_and_token_for_one_buy():
+    """The cost of every sold leg, cash included, moves to the bought token"""
+    ledger = PortfolioLedger(None, None, OWNER, USDC, scope="carry_test")
+    positions = make_positions(ledger)
+    positions[TOKEN_B].balance_wei = "0"
+    positions[TOKEN_B].cost_basis = 0
+    flow = {TOKEN_A: -(5 * 10**18), USDC: -(10 * 10**6), TOKEN_B: 10**18}
+
+    ledger.apply_flow("0x02", 1, flow, positions)
+
+    assert positions[TOKEN_A].cost_basis == pytest.approx(50)
+    assert positions[TOKEN_B].cost_basis == pytest.approx(60)
+    assert positions[TOKEN_A].realized_pnl == 0
+    assert len(ledger.get_trades()) == 2
+
+
+def test_withdrawal_keeps_nothing_realized():
+    """Tokens leaving without anything coming in take their cost with them"""
+    ledger = PortfolioLedger(None, None, OWNER, USDC, scope="withdraw_test")
+    positions = make_positions(ledger)
+
+    ledger.apply_flow("0x03", 1, {TOKEN_A: -(5 * 10**18)}, positions)
+
+    assert positions[TOKEN_A].cost_basis == pytest.approx(50)
+    assert positions[TOKEN_A].realized_pnl == 0
+    assert ledger.get_trades() == []
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+from eth_account import Account
+from eth_account.messages import _hash_eip191_message, encode_typed_data
+
+from plugins.cowswap.signing import OrderSigner
+
+CHAIN_ID = 8453
+SETTLEMENT = "0x9008D19f58AAbD9eD0D60971565AA8510560ab41"
+SAFE = "0x44CBf6E9b4473EFC47BBE8198d19929E3Bc5552c"
+USDC = "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913"
+
+# A throwaway key
+PRIVATE_KEY = "0x" + "42" * 32
+
+ORDER_TYPES = {
+    "Order": [
+        {"name": "sellToken", "type": "address"},
+        {"name": "buyToken", "type": "address"},
+        {"name": "receiver", "type": "address"},
+        {"name": "sellAmount", "type": "uint256"},
+        {"name": "buyAmount", "type": "uint256"},
+        {"name": "validTo", "type": "uint32"},
+        {"name": "appData", "type": "bytes32"},
+        {"name": "feeAmount", "type": "uint256"},
+        {"name": "kind", "type": "string"},
+        {"name": "partiallyFillable", "type": "bool"},
+        {"name": "sellTokenBalance", "type": "string"},
+        {"name": "buyTokenBalance", "type": "string"},
+    ]
+}
+
+
+def make_order(i: int) -> SimpleNamespace:
+    """A USDC order, with fields as the CowSwap Order message has them"""
+    return SimpleNamespace(
+        sellToken=USDC,
+        buyToken=Account.from_key("0x" + f"{i + 1:064x}").address,
+        receiver=SAFE,
+        sellAmount=10**6 + i,
+        buyAmount=10**18 * (i + 1),
+        validTo=1_800_000_000 + i,
+        appData=bytes([i]) * 32,
+        feeAmount=0,
+        kind="sell" if i % 2 else "buy",
+        partiallyFillable=bool(i % 3),
+        sellTokenBalance="erc20",
+        buyTokenBalance="erc20",
+    )
+
+
+def sign_with_eth_account(order) -> bytes:
+    """The per-order path: full EIP-712 messages hashed and signed by eth_account"""
+    order_message = encode_typed_data(
+        domain_data={
+            "name": "Gnosis Protocol",
+            "version": "v2",
+            "chainId": CHAIN_ID,
+            "verifyingContract": SETTLEMENT,
+        },
+        message_types=ORDER_TYPES,
+        message_data=dict(vars(order)),
+    )
+    safe_message = encode_typed_data(
+        domain_data={"chainId": CHAIN_ID, "verifyingContract": SAFE},
+        message_types={"SafeMessage": [{"name": "message", "type": "bytes"}]},
+        message_data={"message": _hash_eip191_message(order_message)},
+    )
+    signature = Account.sign_message(safe_message, PRIVATE_KEY)
+    return (
+        signature.r.to_bytes(32, "big")
+        + signature.s.to_bytes(32, "big")
+        + bytes([signature.v])
+    )
+
+
+def test_bulk_signatures_match_eth_account():
+    """Precomputed domains and hand-encoded structs sign the same digests"""
+    signer = OrderSigner(PRIVATE_KEY, CHAIN_ID, SETTLEMENT, SAFE)
+    orders = [make_order(i) for i in range(6)]
+
+    assert signer.sign_orders(orders) == [sign_with_eth_account(o) for o in orders]
+
+
+def test_signer_address():
+    """The signer exposes the address of its key"""
+    signer = OrderSigner(PRIVATE_KEY, CHAIN_ID, SETTLEMENT, SAFE)
+
+    assert signer.address == Account.from_key(PRIVATE_KEY).address
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+
+from plugins.twitter.search import BatchSearch
+
+
+def make_tweet(tweet_id: int):
+    """A tweet with no engagement"""
+    return SimpleNamespace(
+        id=str(tweet_id),
+        user=SimpleNamespace(id="user"),
+        text="gm",
+        favorite_count=0,
+        retweet_count=0,
+        reply_count=0,
+        quote_count=0,
+        created_at_datetime=SimpleNamespace(timestamp=lambda: 0.0),
+    )
+
+
+class Page(list):
+    """A last page of search results"""
+
+    async def next(self):
+        """No more results"""
+        return Page()
+
+
+class StubClient:
+    """A twikit client with fixed results per query"""
+
+    def __init__(self, results):
+        """Init"""
+        self.results = results
+
+    async def search_tweet(self, query, product, count):
+        """The tweets of a query, in one page. Queries without results hang"""
+        if query not in self.results:
+            await asyncio.Event().wait()
+        return Page(make_tweet(tweet_id) for tweet_id in self.results[query])
+
+
+def test_shared_tweets_are_not_unique_to_a_query():
+    """A tweet matching two queries is counted once"""
+    client = StubClient({"dedupe_a": [3, 2], "dedupe_b": [3, 1]})
+    result = asyncio.run(BatchSearch(client).run(["dedupe_a", "dedupe_b"], 1))
+
+    assert result["unique_new_tweets"] == 3
+    assert result["queries"]["dedupe_a"]["new_tweets"] == 2
+    assert result["queries"]["dedupe_a"]["unique_tweets"] == 1
+    assert result["queries"]["dedupe_b"]["unique_tweets"] == 1
+
+
+def test_cursors_move_once_the_batch_returns():
+    """A batch timing out leaves the cursors of its done queries in place"""
+    search = BatchSearch(StubClient({"cursor_a": [5, 4]}))
+
+    async def timed_out():
+        try:
+            await asyncio.wait_for(search.run(["cursor_a", "cursor_hang"], 1), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(timed_out())
+    assert search.get_newest_id("cursor_a") == 0
+
+    asyncio.run(search.run(["cursor_a"], 1))
+    assert search.get_newest_id("cursor_a") == 5